@@ -0,0 +1,203 @@
+# Async serving mode: `uvicorn asgi:app --workers 4`
+#
+# GET /api/search/books runs natively on the event loop (httpx for Open Library,
+# an async SQLAlchemy engine for the local query), so a worker can hold thousands of
+# searches waiting on upstream instead of one per thread. Every other route is the
+# regular Flask app, run on asgiref's thread pool. `python run.py` is unaffected.
+import asyncio
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import decode_token
+
+from config import settings
+from models import db
+from routes.search import (DEFAULT_SEARCH_RESULTS, MAX_EXTERNAL_RESULTS, MAX_LOCAL_RESULTS, MAX_SEARCH_RESULTS,
+                           format_ranked, new_external_hits)
+from run import app as flask_app
+from services.async_db import async_session, dispose_async_engine, init_async_engine
+from services.book_search_api import UpstreamUnavailable, close_async_client, search_books_external_async
+from services.book_search_index import ensure_local_index, search_local_books_async
+from services.catalog_enrichment import enqueue_hits_in_background
+from services.db_routing import REPLICA_BIND_KEY
+from services.metrics import finish_request, start_request_stats
+from services.rate_limit import MemoryStore, limiter, retry_after_header
+from services.responses import body_etag, choose_encoding, compress_bytes, etag_matches
+from services.search_ranking import popularity_stmt, rank_results
+
+SEARCH_PATH = '/api/search/books'
+
+
+def _host_url(scope, headers):
+    # Same value as Flask's request.host_url, which cover proxy URLs are built from
+    host = headers.get(b'host')
+    if host is None:
+        server_host, port = scope.get('server') or ('localhost', None)
+        host = f"{server_host}:{port}" if port else server_host
+    else:
+        host = host.decode('latin-1')
+    return f"{scope.get('scheme', 'http')}://{host}/"
+
+
+def _identity(scope, headers):
+    # Same keys as services.rate_limit.request_identity
+    authorization = headers.get(b'authorization', b'').decode('latin-1')
+    if authorization.startswith('Bearer '):
+        try:
+            with flask_app.app_context():
+                claims = decode_token(authorization[len('Bearer '):])
+            return f"user:{claims[flask_app.config['JWT_IDENTITY_CLAIM']]}"
+        except Exception:
+            pass
+    client = scope.get('client')
+    return f"ip:{client[0] if client else None}"
+
+
+async def _rate_limited(scope, headers):
+    identity = _identity(scope, headers)
+    if isinstance(limiter.store, MemoryStore):
+        return limiter.check('search', identity)
+    # A shared store is a network round-trip; keep it off the event loop
+    return await asyncio.to_thread(limiter.check, 'search', identity)
+
+
+def _prepare_database():
+    with flask_app.app_context():
+        sync_url = db.engine.url
+        replica = db.engines.get(REPLICA_BIND_KEY)
+        if db.engine.dialect.name != 'postgresql':
+            # Local search off PostgreSQL reads the in-process index, which needs the sync session to build
+            ensure_local_index()
+    init_async_engine(sync_url, replica.url if replica is not None else None)
+
+
+async def _send_json(send, headers, status, payload, extra_headers=(), cacheable=False):
+    body = flask_app.json.dumps(payload).encode()
+    response_headers = list(extra_headers)
+    if b'origin' in headers:
+        # Mirrors CORS(app, expose_headers=[...]) in run.py for this natively served route
+        response_headers.append((b'access-control-allow-origin', b'*'))
+        response_headers.append((b'access-control-expose-headers', b'X-Search-Partial, Retry-After'))
+
+    # Same conditional and compression handling the Flask app applies (see services/responses.py)
+    if cacheable:
+        etag = body_etag(body)
+        response_headers.append((b'etag', f'W/"{etag}"'.encode()))
+        response_headers.append((b'cache-control', f'public, max-age={settings.SEARCH_RESULTS_MAX_AGE}'.encode()))
+        if etag_matches(headers.get(b'if-none-match', b'').decode('latin-1'), etag):
+            await send({'type': 'http.response.start', 'status': 304, 'headers': response_headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return 304
+    elif status == 200:
+        response_headers.append((b'cache-control', b'no-store'))
+
+    if settings.RESPONSE_COMPRESSION_ENABLED and len(body) >= settings.COMPRESSION_MIN_BYTES:
+        response_headers.append((b'vary', b'Accept-Encoding'))
+        encoding = choose_encoding(headers.get(b'accept-encoding', b'').decode('latin-1'))
+        if encoding:
+            body = compress_bytes(body, encoding)
+            response_headers.append((b'content-encoding', encoding.encode()))
+
+    response_headers += [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+    await send({'type': 'http.response.body', 'body': body})
+    return status
+
+
+async def search_all_books(scope, send):
+    """Async twin of routes.search.search_all_books: same parameters, body and headers. Returns the status sent."""
+    headers = dict(scope.get('headers') or ())
+    retry_after = await _rate_limited(scope, headers)
+    if retry_after is not None:
+        return await _send_json(send, headers, 429, {"message": "Too many requests, please retry later"},
+                                [(b'retry-after', retry_after_header(retry_after).encode())])
+
+    params = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    query = params.get('query', [None])[0]
+    try:
+        limit = int(params['limit'][0]) if 'limit' in params else DEFAULT_SEARCH_RESULTS
+    except ValueError:  # same as request.args.get(..., type=int)
+        limit = DEFAULT_SEARCH_RESULTS
+
+    if not query or len(query) < 3:
+        return await _send_json(send, headers, 400, {"message": "Query parameter is required and must be at least 3 characters long."})
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SEARCH_DEADLINE_SECONDS
+    external_task = asyncio.ensure_future(search_books_external_async(query, MAX_EXTERNAL_RESULTS))
+
+    url_root = _host_url(scope, headers)
+    local_books = []
+    new_hits = []
+    popularity = {}
+    partial = False
+
+    try:
+        async with async_session(read_only=True) as session:
+            local_books = await search_local_books_async(session, query, MAX_LOCAL_RESULTS)
+            if local_books:
+                popularity = dict((await session.execute(popularity_stmt([book.id for book in local_books]))).all())
+    except Exception as e:
+        flask_app.logger.error(f"Error searching local database: {e}")
+
+    try:
+        # The upstream call itself is shielded, so timing out here only stops the wait
+        external_results_raw = await asyncio.wait_for(external_task, timeout=max(deadline - loop.time(), 0))
+    except asyncio.TimeoutError:
+        flask_app.logger.warning(f"External search for '{query}' exceeded the {settings.SEARCH_DEADLINE_SECONDS}s budget")
+        external_results_raw = None
+        partial = True
+    except UpstreamUnavailable:
+        external_results_raw = None
+        partial = True
+    except Exception as e:
+        flask_app.logger.error(f"Error searching external API: {e}")
+        external_results_raw = None
+
+    if external_results_raw:
+        new_hits = new_external_hits(external_results_raw, local_books)
+        if new_hits and settings.ENRICHMENT_ENABLED:
+            # The enrichment queue is written through the sync session, so it goes to a thread
+            loop.run_in_executor(None, enqueue_hits_in_background, flask_app, new_hits)
+
+    ranked = rank_results(query, local_books, new_hits, popularity, limit)
+    return await _send_json(send, headers, 200, format_ranked(ranked, url_root),
+                            [(b'x-search-partial', b'true' if partial else b'false')], cacheable=not partial)
+
+
+class AsyncSearchApp:
+    """ASGI app serving search natively and delegating everything else to the Flask app."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi = WsgiToAsgi(wsgi_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'] == SEARCH_PATH:
+            stats = start_request_stats() if settings.METRICS_ENABLED else None
+            status = await search_all_books(scope, send)
+            if stats is not None:
+                finish_request(stats, 'GET', SEARCH_PATH, status)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await asyncio.to_thread(_prepare_database)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_async_client()
+                await dispose_async_engine()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = AsyncSearchApp(flask_app)
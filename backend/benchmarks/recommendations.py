@@ -0,0 +1,140 @@
+"""Benchmark: "readers also shelved" from a per-request self-join vs the precomputed neighbour table.
+
+Run from the backend directory:
+
+    python -m benchmarks.recommendations --users 5000 --books 20000 --output recommendations.json
+
+Reports the time to build the whole table (with the SciPy model when it is
+installed, and with the pure-Python fallback), to refresh it after a few
+changed entries, and per request to serve a book's neighbours both ways.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.serialization import _time
+
+URL_ROOT = 'http://localhost/'
+
+
+def _naive_stmt():
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import aliased
+
+    from models import LibraryEntry
+
+    # What serving without a precomputed table looks like: readers of the book, joined back to everything they shelved
+    mine, theirs = aliased(LibraryEntry), aliased(LibraryEntry)
+    return select(theirs.book_id, func.count().label('co_readers')) \
+        .join(mine, mine.user_id == theirs.user_id) \
+        .where(mine.book_id == 1, theirs.book_id != mine.book_id) \
+        .group_by(theirs.book_id).order_by(func.count().desc(), theirs.book_id).limit(10)
+
+
+def _score_all(model):
+    return dict(model.neighbours(model.book_ids, 50, 1))
+
+
+def _seconds(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=20_000)
+    parser.add_argument('--users', type=int, default=5_000)
+    parser.add_argument('--entries-per-user', type=int, default=50)
+    parser.add_argument('--popular-readers', type=int, default=1_000,
+                        help="Readers of the book whose neighbours are served (the self-join grows with them)")
+    parser.add_argument('--changes', type=int, default=20, help="Entries changed before timing a refresh")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='haven-bench-'), 'bench.db')}"
+    os.environ['RECOMMENDATIONS_MIN_CO_READERS'] = '1'
+
+    from sqlalchemy import exists, literal, select, update
+
+    from run import create_app
+    from models import db, LibraryEntry, User
+    from benchmarks.seed import seed_database
+    from services import similarity
+    from services.recommendations import queue_similarity_refresh, similar_books_stmt
+    from services.serializers import book_card
+
+    app = create_app()
+    results = {}
+    with app.app_context():
+        db.create_all()
+        seed_database(args.books, users=args.users, entries_per_user=args.entries_per_user)
+        # Seeded shelves are uniform; make book 1 a bestseller, which is where the self-join hurts
+        db.session.execute(LibraryEntry.__table__.insert().from_select(
+            ['user_id', 'book_id', 'status'],
+            select(User.id, literal(1), literal(2)).where(~exists().where(
+                LibraryEntry.user_id == User.id, LibraryEntry.book_id == 1)).limit(args.popular_readers)))
+        db.session.commit()
+
+        seconds, pairs = _seconds(similarity.rebuild_similarities)
+        results["rebuild_seconds"] = round(seconds, 3)
+        results["model"] = "scipy" if similarity.sparse is not None else "python"
+        results["pairs"] = pairs
+        print(f"rebuild ({results['model']}) {seconds:8.3f}s  {pairs} pairs", file=sys.stderr)
+
+        if similarity.sparse is not None:
+            # Both models on the same entries, in memory only: scoring without the database writes
+            users, books, weights = similarity.load_entries()
+            models = (("scipy", similarity.SparseModel, lambda values: values),
+                      ("python", similarity.DictModel, lambda values: values.tolist()))
+            for name, model_class, convert in models:
+                seconds, _ = _seconds(lambda: _score_all(model_class(convert(users), convert(books), convert(weights))))
+                results[f"{name}_model_seconds"] = round(seconds, 3)
+                print(f"{name + ' model':<17}{seconds:8.3f}s", file=sys.stderr)
+
+        rng = random.Random(7)
+        changed = rng.sample(range(1, args.users * args.entries_per_user + 1), args.changes)
+        books = [book_id for (book_id,) in db.session.execute(
+            update(LibraryEntry).where(LibraryEntry.id.in_(changed)).values(status=2, user_rating=5)
+            .returning(LibraryEntry.book_id))]
+        queue_similarity_refresh(books)
+        db.session.commit()
+        seconds, (queued, affected) = _seconds(similarity.refresh_similarities)
+        results["refresh_seconds"] = round(seconds, 3)
+        results["refresh_books"] = queued + affected
+        print(f"refresh          {seconds:8.3f}s  {queued} changed, {affected} affected books", file=sys.stderr)
+
+        naive = _naive_stmt()
+
+        def serve_naive():
+            rows = db.session.execute(naive).all()
+            db.session.remove()
+            return rows
+
+        def serve_precomputed():
+            payload = [book_card(row, URL_ROOT) for row in db.session.execute(similar_books_stmt(1, 10))]
+            db.session.remove()
+            return payload
+
+        for name, fn in (("serve_self_join", serve_naive), ("serve_precomputed", serve_precomputed)):
+            us = _time(fn, args.iterations) * 1e6
+            results[f"{name}_us"] = round(us, 1)
+            print(f"{name:<17}{us:9.1f}us", file=sys.stderr)
+
+    report = {"meta": {"python": platform.python_version(), "params": vars(args)}, "results": results}
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""Load-test the search, library and auth endpoints against a seeded database.
+
+Run from the backend directory:
+
+    python -m benchmarks.run_benchmarks --books 100000 --users 1000 --duration 15 --output bench.json
+    python -m benchmarks.run_benchmarks --compare bench.json   # rerun and diff against a saved run
+
+The app is served in-process by a threaded werkzeug server, and openlibrary.org
+is replaced by a local stub (see stub_openlibrary.py) with configurable latency.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from benchmarks.stub_openlibrary import StubOpenLibrary
+
+SCENARIOS = ('search', 'add', 'login')
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def summarize(latencies, errors, elapsed):
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "max_ms": _ms(latencies[-1] if latencies else None),
+    }
+
+
+def _login(session, base_url, user_id, password):
+    response = session.post(f"{base_url}/auth/login",
+                            json={"email": f"bench{user_id}@example.com", "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def _make_request(scenario, session, base_url, rng, ctx, token):
+    if scenario == 'search':
+        if ctx["queries"]:
+            query = rng.choice(ctx["queries"])
+        else:
+            query = ' '.join(rng.sample(ctx["words"], rng.choice((1, 2))))
+        return session.get(f"{base_url}/api/search/books", params={"query": query})
+    if scenario == 'add':
+        status = rng.randint(0, 2)
+        return session.post(f"{base_url}/api/library/add", headers={"Authorization": f"Bearer {token}"}, json={
+            "source": "local",
+            "local_book_id": rng.randint(1, ctx["books"]),
+            "status": status,
+            "rating": rng.randint(1, 5) if status == 2 else None,
+        })
+    if scenario == 'login':
+        user_id = rng.randint(1, ctx["users"])
+        return session.post(f"{base_url}/auth/login",
+                            json={"email": f"bench{user_id}@example.com", "password": ctx["password"]})
+    raise ValueError(scenario)
+
+
+def run_scenario(scenario, base_url, concurrency, duration, ctx, seed):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = [0.0]
+    ready = threading.Barrier(concurrency + 1)
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        session = requests.Session()
+        token = _login(session, base_url, rng.randint(1, ctx["users"]), ctx["password"]) if scenario == 'add' else None
+        local = []
+        local_errors = 0
+        ready.wait()
+        while time.perf_counter() < stop_at[0]:
+            start = time.perf_counter()
+            try:
+                response = _make_request(scenario, session, base_url, rng, ctx, token)
+                response.content  # include body transfer in the timing
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            if ok:
+                local.append(time.perf_counter() - start)
+            else:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    stop_at[0] = time.perf_counter() + duration + 60  # provisional, reset once every worker has logged in
+    ready.wait()
+    started = time.perf_counter()
+    stop_at[0] = started + duration
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None, stream=sys.stderr):
+    columns = ("requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+    print(f"{'scenario':<10}" + ''.join(f"{c:>16}" for c in columns), file=stream)
+    for name, result in report["results"].items():
+        row = f"{name:<10}" + ''.join(f"{str(result[c]):>16}" for c in columns)
+        print(row, file=stream)
+        base = (baseline or {}).get("results", {}).get(name)
+        if base:
+            deltas = []
+            for c in columns:
+                if isinstance(result[c], (int, float)) and base.get(c):
+                    deltas.append(f"{(result[c] - base[c]) / base[c] * 100:+15.1f}%")
+                else:
+                    deltas.append(f"{'-':>16}")
+            print(f"{'  vs base':<10}" + ''.join(deltas), file=stream)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help="Database to seed and serve (default: a temporary SQLite file)")
+    parser.add_argument('--books', type=int, default=100_000)
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--entries-per-user', type=int, default=50)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="Comma-separated subset of: " + ', '.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument('--upstream-latency-ms', type=float, default=200.0)
+    parser.add_argument('--upstream-jitter-ms', type=float, default=0.0)
+    parser.add_argument('--query-pool', type=int, default=0,
+                        help="Draw search queries from a fixed pool of this size (0 = random each time)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Write the JSON report here (default: stdout)")
+    parser.add_argument('--compare', help="Previous JSON report to print deltas against")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    stub = StubOpenLibrary(latency=args.upstream_latency_ms / 1000, jitter=args.upstream_jitter_ms / 1000).start()
+
+    # Settings are read at import time, so point the app at the stub and database first
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='haven-bench-'), 'bench.db')}"
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['OPEN_LIBRARY_SEARCH_URL'] = stub.search_url
+    # Every simulated client shares one address, which per-IP budgets would throttle
+    os.environ['RATE_LIMIT_ENABLED'] = 'false'
+
+    from werkzeug.serving import make_server
+    from run import create_app
+    from models import db
+    from benchmarks.seed import BENCH_PASSWORD, is_seeded, seed_database, title_words
+
+    app = create_app()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    with app.app_context():
+        db.create_all()
+        if is_seeded():
+            seeded = {"reused": True}
+        else:
+            print(f"Seeding {args.books} books, {args.users} users...", file=sys.stderr)
+            seeded = seed_database(args.books, args.users, args.entries_per_user, args.seed)
+            print(f"Seeded in {seeded['seconds']}s", file=sys.stderr)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    rng = random.Random(args.seed)
+    words = title_words()
+    ctx = {
+        "books": args.books,
+        "users": args.users,
+        "password": BENCH_PASSWORD,
+        "words": words,
+        "queries": [' '.join(rng.sample(words, rng.choice((1, 2)))) for _ in range(args.query_pool)],
+    }
+
+    results = {}
+    for scenario in scenarios:
+        print(f"Running {scenario} x{args.concurrency} for {args.duration}s...", file=sys.stderr)
+        results[scenario] = run_scenario(scenario, base_url, args.concurrency, args.duration, ctx, args.seed)
+
+    server.shutdown()
+    upstream_requests = stub.request_count
+    stub.stop()
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "database": database_url.split(':', 1)[0],
+            "seeded": seeded,
+            "params": {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'database_url')},
+            "upstream_requests": upstream_requests,
+        },
+        "results": results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import random
+import time
+
+from werkzeug.security import generate_password_hash
+
+from models import db, Book, User, LibraryEntry
+from services.library_stats import rebuild_library_stats
+
+BENCH_PASSWORD = "bench-password"
+
+_WORDS = (
+    "night sea river shadow garden empire silent winter glass fire stone house city light dark "
+    "storm queen king lost secret last first song war peace time star moon sun blood bone iron "
+    "golden forest mountain road journey dream memory letter island ocean north south wind ghost "
+    "thief witch dragon crown sword tower machine world heart mind book library summer autumn"
+).split()
+_FIRST_NAMES = "Ada Alan Mary Leo Iris Toni Jorge Ursula Octavia Haruki Chimamanda Kazuo Zadie Italo".split()
+_LAST_NAMES = "Lovelace Turing Shelley Tolstoy Murdoch Morrison Borges LeGuin Butler Murakami Adichie Ishiguro Smith Calvino".split()
+
+BATCH_SIZE = 5000
+
+
+def title_words():
+    """Vocabulary used for seeded titles, handy for generating search queries that hit."""
+    return list(_WORDS)
+
+
+def _batched_insert(table, rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(table.insert(), rows[i:i + BATCH_SIZE])
+
+
+def seed_database(books=100_000, users=1_000, entries_per_user=50, seed=42):
+    """Fill an empty database with deterministic benchmark data. Returns row counts and timing."""
+    rng = random.Random(seed)
+    start = time.perf_counter()
+
+    # Hashing is deliberately slow, so every bench user shares one precomputed hash
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    _batched_insert(User.__table__, [
+        # Every seeded shelf is one library write: version 1, as on its entries below
+        {"id": i, "username": f"bench{i}", "email": f"bench{i}@example.com", "password_hash": password_hash,
+         "library_version": 1}
+        for i in range(1, users + 1)
+    ])
+
+    _batched_insert(Book.__table__, [
+        {
+            "id": i,
+            "title": ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(2, 5))).title(),
+            "author": f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}",
+            "isbn": f"979{i:010d}",
+            "image_url": None,
+            "public_rating": round(rng.uniform(2.5, 5.0), 1),
+        }
+        for i in range(1, books + 1)
+    ])
+
+    entries = []
+    for user_id in range(1, users + 1):
+        for book_id in rng.sample(range(1, books + 1), min(entries_per_user, books)):
+            status = rng.randint(0, 2)
+            entries.append({
+                "user_id": user_id,
+                "book_id": book_id,
+                "status": status,
+                "user_rating": rng.randint(1, 5) if status == 2 and rng.random() < 0.7 else None,
+                "version": 1,
+            })
+    _batched_insert(LibraryEntry.__table__, entries)
+
+    db.session.commit()
+    # The inserts above bypass the library write path, which keeps these counters current
+    rebuild_library_stats()
+    return {
+        "users": users,
+        "books": books,
+        "library_entries": len(entries),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def is_seeded():
+    return db.session.query(Book.id).first() is not None
@@ -0,0 +1,149 @@
+"""Micro-benchmark: ORM hydration + per-row dicts/Pydantic vs column-only rows + precompiled serializers.
+
+Run from the backend directory:
+
+    python -m benchmarks.serialization --books 20000 --iterations 300 --output serialization.json
+
+Each case times the old and the lean way of producing the same response
+payload, in-process and without HTTP, and reports microseconds per call.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+URL_ROOT = 'http://localhost/'
+
+
+def _time(fn, iterations):
+    fn()  # warm up statement caches
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def _cases(user_id, book_ids):
+    from sqlalchemy import select
+    from sqlalchemy.orm import joinedload
+
+    from models import db, Book, LibraryEntry, User
+    from schemas.user import UserPublic
+    from services.cover_cache import proxy_cover_url
+    from services.isbn import to_isbn13
+    from services.serializers import BOOK_CARD_COLUMNS, LIBRARY_ENTRY_COLUMNS, book_card, library_entry, user_public
+
+    def search_cards_orm():
+        books = db.session.scalars(select(Book).where(Book.id.in_(book_ids))).all()
+        payload = [{
+            "local_book_id": book.id,
+            "external_id": book.external_id,
+            "title": book.title,
+            "authors": book.author.split(', ') if book.author else [],
+            "isbn": to_isbn13(book.isbn) or book.isbn,
+            "first_publish_year": book.first_publish_year,
+            "publisher": [book.publisher] if book.publisher else None,
+            "description": book.description,
+            "cover_url": proxy_cover_url(URL_ROOT, book.image_url, book.id),
+            "public_rating": book.public_rating,
+            "source": "local",
+        } for book in books]
+        db.session.remove()  # every request starts with an empty identity map
+        return payload
+
+    def search_cards_lean():
+        rows = db.session.execute(select(*BOOK_CARD_COLUMNS).where(Book.id.in_(book_ids))).all()
+        payload = [book_card(row, URL_ROOT) for row in rows]
+        db.session.remove()
+        return payload
+
+    def library_page_orm():
+        entries = db.session.scalars(
+            select(LibraryEntry).options(joinedload(LibraryEntry.book))
+            .where(LibraryEntry.user_id == user_id).order_by(LibraryEntry.status, LibraryEntry.id)
+        ).all()
+        payload = [{
+            "id": entry.id,
+            "book_id": entry.book_id,
+            "status": entry.status,
+            "rating": entry.user_rating,
+            "notes": entry.user_notes,
+            "date_added": entry.date_added.isoformat() if entry.date_added else None,
+            "updated_at": entry.updated_at.isoformat() if entry.updated_at else None,
+            "book": {
+                "id": entry.book.id,
+                "title": entry.book.title,
+                "author": entry.book.author,
+                "isbn": entry.book.isbn,
+                "image_url": proxy_cover_url(URL_ROOT, entry.book.image_url, entry.book.id),
+                "public_rating": entry.book.public_rating,
+            },
+        } for entry in entries]
+        db.session.remove()
+        return payload
+
+    def library_page_lean():
+        rows = db.session.execute(
+            select(*LIBRARY_ENTRY_COLUMNS).join(Book, LibraryEntry.book_id == Book.id)
+            .where(LibraryEntry.user_id == user_id).order_by(LibraryEntry.status, LibraryEntry.id)
+        ).all()
+        payload = [library_entry(row, URL_ROOT) for row in rows]
+        db.session.remove()
+        return payload
+
+    user = db.session.get(User, user_id)
+    db.session.expunge(user)
+
+    return {
+        "search_cards": (search_cards_orm, search_cards_lean),
+        "library_page": (library_page_orm, library_page_lean),
+        "user_public": (lambda: UserPublic.model_validate(user).model_dump(), lambda: user_public(user)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=20_000)
+    parser.add_argument('--entries-per-user', type=int, default=200, help="Size of the library page being serialized")
+    parser.add_argument('--cards', type=int, default=40, help="Books per search response")
+    parser.add_argument('--iterations', type=int, default=300)
+    parser.add_argument('--output', help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='haven-bench-'), 'bench.db')}"
+
+    from run import create_app
+    from models import db
+    from benchmarks.seed import seed_database
+
+    app = create_app()
+    results = {}
+    with app.app_context():
+        db.create_all()
+        seed_database(args.books, users=10, entries_per_user=args.entries_per_user)
+        step = max(1, args.books // args.cards)
+        cases = _cases(1, list(range(1, args.books + 1, step))[:args.cards])
+
+        for name, (old, lean) in cases.items():
+            if old() != lean():
+                raise SystemExit(f"{name}: lean payload differs from the old one")
+            old_us = _time(old, args.iterations) * 1e6
+            lean_us = _time(lean, args.iterations) * 1e6
+            results[name] = {"old_us": round(old_us, 1), "lean_us": round(lean_us, 1),
+                             "speedup": round(old_us / lean_us, 2)}
+            print(f"{name:<14} old {old_us:9.1f}us  lean {lean_us:9.1f}us  x{old_us / lean_us:.2f}", file=sys.stderr)
+
+    report = {"meta": {"python": platform.python_version(), "params": vars(args)}, "results": results}
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Cold-start profile: time to import run.py and to create the app, in fresh interpreters.
+
+Run from the backend directory:
+
+    python -m benchmarks.startup --runs 10 --output startup.json
+    python -m benchmarks.startup --compare startup.json                # diff against a saved run
+    python -m benchmarks.startup --blueprints search                   # a search-only worker
+
+Each run is a new `python -X importtime` process, so nothing is cached in
+memory between runs. The report has the median timings and the slowest
+modules imported while creating the app.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.run_benchmarks import _git_commit
+
+_PROBE = """
+import json, time
+start = time.perf_counter()
+import run
+imported = time.perf_counter()
+run.create_app()
+created = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000, "create_app_ms": (created - imported) * 1000}))
+"""
+
+
+def _top_level(stderr, limit):
+    """The slowest imports (cumulative) made by the probe itself, by run.py, or lazily by create_app()."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        module = name.lstrip()
+        # -X importtime indents each nesting level by two spaces, after one separating space
+        if (len(name) - len(module) - 1) // 2 <= 1 and module != 'run':
+            rows.append((int(cumulative_us), module))
+    rows.sort(reverse=True)
+    return {name: round(us / 1000, 1) for us, name in rows[:limit]}
+
+
+def run_once(env):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', _PROBE], env=env,
+                            capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    return timings, result.stderr
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--blueprints', help="Comma-separated APP_BLUEPRINTS for the probe (default: all)")
+    parser.add_argument('--top', type=int, default=15, help="How many of the slowest imports to report")
+    parser.add_argument('--output', help="Write the JSON report here (default: stdout)")
+    parser.add_argument('--compare', help="Previous JSON report to print deltas against")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    # No database is touched while importing or creating the app, but point it somewhere harmless anyway
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='haven-bench-'), 'startup.db')}")
+    if args.blueprints:
+        env['APP_BLUEPRINTS'] = json.dumps([name.strip() for name in args.blueprints.split(',') if name.strip()])
+
+    samples = []
+    stderr = ''
+    for _ in range(args.runs):
+        timings, stderr = run_once(env)
+        samples.append(timings)
+
+    results = {
+        key: round(statistics.median(sample[key] for sample in samples), 1)
+        for key in ('import_ms', 'create_app_ms')
+    }
+    results['total_ms'] = round(results['import_ms'] + results['create_app_ms'], 1)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "params": {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        },
+        "results": results,
+        # From the last run; milliseconds, cumulative
+        "slowest_imports_ms": _top_level(stderr, args.top),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    for key, value in results.items():
+        line = f"{key:<14} {value:8.1f}"
+        if baseline and key in baseline.get("results", {}):
+            line += f"  (was {baseline['results'][key]:.1f})"
+        print(line, file=sys.stderr)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _stub_doc(query, i):
+    # crc32 rather than hash() so results are stable across runs
+    key = zlib.crc32(f"{query}:{i}".encode())
+    return {
+        "key": f"/works/OL{key % 10_000_000}W",
+        "title": f"{query.title()} Volume {i + 1}",
+        "author_name": [f"Stub Author {i % 7}"],
+        "isbn": [f"978{key % 10**10:010d}"],
+        "cover_i": 1000 + i,
+        "first_publish_year": 1950 + i,
+        "publisher": ["Stub Press"],
+        "ratings_average": 3.5 + (i % 3) / 2,
+    }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        params = parse_qs(urlparse(self.path).query)
+        query = params.get('q', [''])[0]
+        limit = int(params.get('limit', ['10'])[0])
+
+        delay = server.latency + (random.uniform(-server.jitter, server.jitter) if server.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+        with server.lock:
+            server.request_count += 1
+
+        docs = [_stub_doc(query, i) for i in range(limit)]
+
+        body = json.dumps({"numFound": limit, "docs": docs}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections under the async serving mode's fan-out
+    request_queue_size = 1024
+
+
+class StubOpenLibrary:
+    """Local stand-in for openlibrary.org/search.json with configurable latency (seconds)."""
+
+    def __init__(self, latency=0.2, jitter=0.0, host='127.0.0.1', port=0):
+        self.server = _StubServer((host, port), _StubHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self.server.jitter = jitter
+        self.server.lock = threading.Lock()
+        self.server.request_count = 0
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def search_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/search.json"
+
+    @property
+    def request_count(self):
+        return self.server.request_count
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,30 @@
+# gunicorn -c gunicorn.conf.py run:app
+#
+# The app is created and warmed up (run.warm_up) once in the master, before the
+# workers fork, so they start serving straight away and share the imported modules,
+# ORM configuration and search index copy-on-write instead of each building their own.
+import os
+
+from config import settings
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", "4"))
+threads = int(os.environ.get("GUNICORN_THREADS", str(settings.DB_POOL_SIZE)))
+preload_app = True
+
+
+def when_ready(server):
+    import run
+    run.warm_up(run.app)
+
+
+def post_fork(server, worker):
+    # Each worker opens its own database and upstream connections
+    import run
+    from models import db
+    from services.http import close_sessions
+
+    with run.app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    close_sessions()
@@ -1,7 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import DDL, event, func, literal_column
+from sqlalchemy.dialects import postgresql  # noqa: F401 - registers the typed to_tsvector/to_tsquery functions
+
+from services.db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Text search configuration used by the PostgreSQL full-text index on books
+SEARCH_TS_CONFIG = literal_column("'simple'::regconfig")
+
+
+def book_search_vector(title, author):
+    # Must stay identical to the indexed expression for the planner to use ix_books_search_vector
+    return db.func.to_tsvector(
+        SEARCH_TS_CONFIG,
+        db.func.coalesce(title, literal_column("''")) + literal_column("' '")
+        + db.func.coalesce(author, literal_column("''"))
+    )
 
-db = SQLAlchemy()
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -10,15 +26,11 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
+    # Bumped on every write to the user's library; part of the ETag of library responses
+    library_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
     library_entries = db.relationship('LibraryEntry', back_populates='user', cascade='all, delete-orphan')
 
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-
     def __repr__(self):
         return f'<User {self.username}>'
 
@@ -33,12 +45,35 @@ class Book(db.Model):
     image_url = db.Column(db.String(300), nullable=True)
     public_rating = db.Column(db.Float, nullable=True)
 
+    # Open Library metadata, filled in by the catalog enrichment worker
+    # Open Library work key; several editions (ISBNs) can share one
+    external_id = db.Column(db.String(50), index=True, nullable=True)
+    first_publish_year = db.Column(db.Integer, nullable=True)
+    publisher = db.Column(db.String(200), nullable=True)
+    description = db.Column(db.Text, nullable=True)
+
     library_entries = db.relationship('LibraryEntry', back_populates='book')
 
+    # Full-text and trigram indexes backing local search (PostgreSQL only, requires pg_trgm)
+    __table_args__ = (
+        db.Index('ix_books_search_vector', book_search_vector(title, author),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+        db.Index('ix_books_title_trgm', title, postgresql_using='gin',
+                 postgresql_ops={'title': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_books_author_trgm', author, postgresql_using='gin',
+                 postgresql_ops={'author': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
+
     def __repr__(self):
         return f'<Book {self.title}>'
 
 
+event.listen(
+    Book.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+
 class LibraryEntry(db.Model):
     __tablename__ = 'library_entries'
 
@@ -51,15 +86,121 @@ class LibraryEntry(db.Model):
     # Status: 0 = Want to Read, 1 = Reading, 2 = Read
     status = db.Column(db.Integer, default=0, nullable=False, index=True)
 
-    user_rating = db.Column(db.Integer, nullable=True)
+    # 1 to 5 in half stars; half steps are exact in a float
+    user_rating = db.Column(db.Float, nullable=True)
     user_notes = db.Column(db.Text, nullable=True) 
 
+    date_added = db.Column(db.DateTime, default=func.now(), server_default=func.now(), nullable=False)
+    updated_at = db.Column(db.DateTime, default=func.now(), server_default=func.now(), nullable=False)
+    # The owner's User.library_version as of the write that last changed this row; sync cursors compare against it
+    version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
     # Prevent a user from adding the same book info twice
-    __table_args__ = (db.UniqueConstraint('user_id', 'book_id', name='_user_book_uc'),)
+    # The (user_id, status, id) index backs keyset pagination of a user's library
+    # The (user_id, version) index backs the sync change feed
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'book_id', name='_user_book_uc'),
+        db.Index('ix_library_entries_user_status_id', 'user_id', 'status', 'id'),
+        db.Index('ix_library_entries_user_version', 'user_id', 'version'),
+    )
 
     # Define relationships explicitly here for clarity
     user = db.relationship('User', back_populates='library_entries')
     book = db.relationship('Book', back_populates='library_entries')
 
     def __repr__(self):
-        return f'<LibraryEntry for User {self.user_id} - Book {self.book_id}>' 
\ No newline at end of file
+        return f'<LibraryEntry for User {self.user_id} - Book {self.book_id}>' 
+
+
+class LibraryTombstone(db.Model):
+    """A removed library entry, kept so that sync clients learn about the deletion.
+
+    Pruned after LIBRARY_TOMBSTONE_RETENTION_DAYS (`flask prune-library-tombstones`);
+    cursors older than that get a full resync instead of a delta.
+    """
+    __tablename__ = 'library_tombstones'
+
+    entry_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    book_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=func.now(), server_default=func.now(), nullable=False, index=True)
+
+    __table_args__ = (
+        db.Index('ix_library_tombstones_user_version', 'user_id', 'version'),
+    )
+
+    def __repr__(self):
+        return f'<LibraryTombstone entry {self.entry_id} of User {self.user_id}>'
+
+
+class LibraryStat(db.Model):
+    """Per-user entry counts by status and rating, kept current by writes to library_entries.
+
+    Rebuild with `flask rebuild-library-stats` if they drift.
+    """
+    __tablename__ = 'library_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    status = db.Column(db.Integer, primary_key=True)
+    # Rating in half stars (4.5 -> 9); 0 = unrated
+    rating_halves = db.Column(db.Integer, primary_key=True)
+    entry_count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<LibraryStat user {self.user_id} status {self.status} rating {self.rating_halves / 2}: {self.entry_count}>'
+
+
+class BookSimilarity(db.Model):
+    """One of a book's RECOMMENDATIONS_TOP_K "readers also shelved" neighbours.
+
+    Built by `flask rebuild-recommendations` and kept current by `flask refresh-recommendations`;
+    see services/similarity.py.
+    """
+    __tablename__ = 'book_similarities'
+
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    similar_book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    # Readers who shelved both books
+    co_readers = db.Column(db.Integer, nullable=False)
+
+    # Finds the books whose lists contain a book whose readers changed
+    __table_args__ = (
+        db.Index('ix_book_similarities_similar_book_id', 'similar_book_id'),
+    )
+
+    def __repr__(self):
+        return f'<BookSimilarity {self.book_id} -> {self.similar_book_id}: {self.score:.3f}>'
+
+
+class SimilarityRefresh(db.Model):
+    """A book whose readers changed since its similarities were last computed.
+
+    Append-only, one row per write: writers never wait on each other, and a
+    refresh deletes exactly the rows it read, so writes committing while it
+    runs are left for the next one.
+    """
+    __tablename__ = 'similarity_refresh_queue'
+
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<SimilarityRefresh book {self.book_id}>'
+
+
+class EnrichmentJob(db.Model):
+    """An external search hit waiting to be persisted into `books` by the enrichment worker."""
+    __tablename__ = 'enrichment_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Open Library key, or ISBN when there is none; duplicates are dropped on enqueue
+    dedupe_key = db.Column(db.String(60), unique=True, nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    # Set while a worker holds the job; it is deleted once its book is committed
+    claimed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<EnrichmentJob {self.dedupe_key}>'
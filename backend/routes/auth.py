@@ -1,11 +1,15 @@
 from flask import Blueprint, request, jsonify, current_app
 from pydantic import ValidationError
-from sqlalchemy.exc import IntegrityError
-from flask_jwt_extended import create_access_token
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from flask_jwt_extended import create_access_token, current_user, jwt_required
 
 from models import db, User
+from services.passwords import HashingBusyError, hash_password, verify_password
+from services.rate_limit import rate_limit
+from services.user_cache import invalidate_user
 
-from schemas.user import UserCreate, UserPublic 
+from schemas.user import UserCreate
+from services.serializers import user_public
 
 from pydantic import BaseModel, EmailStr
 from config import settings
@@ -18,13 +22,14 @@ class UserLogin(BaseModel):
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limit('register')
 def register_user():
     json_data = request.get_json()
     if not json_data:
         return jsonify({"message": "No input data provided"}), 400
 
     try:
-        user_data = UserCreate(**json_data)
+        user_data = UserCreate.model_validate(json_data)
     except ValidationError as e:
         return jsonify({"message": "Validation Error", "errors": e.errors()}), 400
 
@@ -34,11 +39,16 @@ def register_user():
     if existing_user:
         return jsonify({"message": "Username or Email already exists"}), 409 # 409 Conflict
 
+    try:
+        password_hash = hash_password(user_data.password)
+    except HashingBusyError:
+        return jsonify({"message": "Server busy, please retry"}), 503
+
     new_user = User(
         username=user_data.username,
-        email=user_data.email
+        email=user_data.email,
+        password_hash=password_hash
     )
-    new_user.set_password(user_data.password) # Hash password
 
     try:
         db.session.add(new_user)
@@ -50,28 +60,53 @@ def register_user():
         db.session.rollback()
         return jsonify({"message": "Could not create user"}), 500
 
-    user_public_data = UserPublic.model_validate(new_user)
-    
-    return jsonify(user_public_data.model_dump()), 201
+    return jsonify(user_public(new_user)), 201
 
 
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit('login')
 def login_user():
     json_data = request.get_json()
     if not json_data:
         return jsonify({"message": "No input data provided"}), 400
     
     try:
-        login_data = UserLogin(**json_data)
+        login_data = UserLogin.model_validate(json_data)
     except ValidationError as e:
         return jsonify({"message": "Validation Error", "errors": e.errors()}), 400
 
     # Find user by email
     user = User.query.filter_by(email=login_data.email).first()
+    if not user:
+        return jsonify({"message": "Invalid credentials"}), 401 # 401 Unauthorized
 
-    if user and user.check_password(login_data.password):
-        access_token = create_access_token(identity=str(user.id))
-        return jsonify(access_token=access_token), 200
-    else:
-        return jsonify({"message": "Invalid credentials"}), 401 # 401 Unauthorized
\ No newline at end of file
+    try:
+        matches, needs_rehash = verify_password(user.password_hash, login_data.password)
+    except HashingBusyError:
+        return jsonify({"message": "Server busy, please retry"}), 503
+
+    if not matches:
+        return jsonify({"message": "Invalid credentials"}), 401 # 401 Unauthorized
+
+    user_id = user.id
+    if needs_rehash:
+        # Hash parameters changed since this password was stored; upgrade it now that we have the plaintext.
+        # Best effort: the login already succeeded, and the next one can upgrade it instead
+        try:
+            user.password_hash = hash_password(login_data.password)
+            db.session.commit()
+            invalidate_user(user_id)
+        except (HashingBusyError, SQLAlchemyError) as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Could not upgrade password hash for user {user_id}: {e}")
+
+    access_token = create_access_token(identity=str(user_id))
+    return jsonify(access_token=access_token), 200
+
+
+@auth_bp.route('/me', methods=['GET'])
+@jwt_required()
+def get_current_user():
+    # current_user comes from the per-process user cache, not a fresh query
+    return jsonify(current_user._asdict()), 200
\ No newline at end of file
@@ -0,0 +1,86 @@
+import io
+
+from flask import Blueprint, request, jsonify, current_app, send_file
+
+from config import settings
+from models import db, Book
+from services.cover_cache import (
+    COVER_SIZES, DEFAULT_COVER_SIZE, CoverNotFound, get_openlibrary_cover, get_url_cover, sniff_mimetype
+)
+from services.rate_limit import limiter, request_identity, too_many_requests
+
+covers_bp = Blueprint('covers', __name__)
+
+
+class _UpstreamBudgetExceeded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+def _requested_size():
+    size = request.args.get('size', DEFAULT_COVER_SIZE).upper()
+    return size if size in COVER_SIZES else None
+
+
+def _charge_upstream_fetch():
+    # Cached covers are served freely; only misses, which download from upstream, spend the budget
+    retry_after = limiter.check('covers', request_identity())
+    if retry_after is not None:
+        raise _UpstreamBudgetExceeded(retry_after)
+
+
+def _read_cover(fetch):
+    """Bytes and digest of the cover `fetch(on_miss)` resolves, fetching again if it is evicted before we read it."""
+    for _ in range(2):
+        path, digest = fetch(_charge_upstream_fetch)
+        try:
+            with open(path, 'rb') as f:
+                return f.read(), digest
+        except FileNotFoundError:
+            # The lookup now misses, so the next fetch downloads it again
+            continue
+    raise FileNotFoundError(path)
+
+
+def _send_cover(data, digest):
+    # Blobs are content-addressed, so the digest is a strong ETag and the bytes never change
+    response = send_file(io.BytesIO(data), mimetype=sniff_mimetype(data[:16]), etag=digest,
+                         max_age=settings.COVER_MAX_AGE, conditional=True)
+    response.headers['Cache-Control'] = f"public, max-age={settings.COVER_MAX_AGE}, immutable"
+    return response
+
+
+def _cover_response(fetch, description):
+    try:
+        data, digest = _read_cover(fetch)
+    except CoverNotFound:
+        return jsonify({"message": "Cover not found"}), 404
+    except _UpstreamBudgetExceeded as e:
+        current_app.logger.info(f"Rate limited {request.path} (covers)")
+        return too_many_requests(e.retry_after)
+    except Exception as e:
+        current_app.logger.error(f"Error fetching {description}: {e}")
+        return jsonify({"message": "Could not fetch cover"}), 502
+    return _send_cover(data, digest)
+
+
+@covers_bp.route('/ol/<int:cover_id>', methods=['GET'])
+def openlibrary_cover(cover_id):
+    size = _requested_size()
+    if not size:
+        return jsonify({"message": f"size must be one of {', '.join(COVER_SIZES)}"}), 400
+    return _cover_response(lambda on_miss: get_openlibrary_cover(cover_id, size, on_miss),
+                           f"Open Library cover {cover_id}")
+
+
+@covers_bp.route('/book/<int:book_id>', methods=['GET'])
+def book_cover(book_id):
+    size = _requested_size()
+    if not size:
+        return jsonify({"message": f"size must be one of {', '.join(COVER_SIZES)}"}), 400
+    image_url = db.session.query(Book.image_url).filter(Book.id == book_id).scalar()
+    if not image_url:
+        return jsonify({"message": "Cover not found"}), 404
+    return _cover_response(lambda on_miss: get_url_cover(image_url, size, on_miss),
+                           f"cover for book {book_id}")
@@ -1,12 +1,41 @@
-from flask import Blueprint, request, jsonify, current_app
+import base64
+import binascii
+import io
+import json
+import shutil
+import tempfile
+
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from pydantic import BaseModel, Field, ValidationError, root_validator
+from sqlalchemy import Float, and_, insert, literal, or_, select
 from typing import List, Optional
 
+from config import settings
 from models import db, Book, LibraryEntry
+from services.book_search_index import index_books
+from services.cover_cache import upstream_cover_url
+from services.db_routing import statement_timeout, use_read_replica
+from services.library_stats import (get_library_stats, library_version, next_library_version, previous_entries,
+                                    record_entry_changes)
+from services.rate_limit import rate_limit
+from services.responses import body_etag, etag_matches, not_modified
+from services.serializers import LIBRARY_ENTRY_COLUMNS, library_entry
+from services.upsert import book_upsert, library_entry_upsert
+from services.isbn import canonical_isbn
+from services.library_import import IMPORT_BATCH_SIZE, import_batch, iter_import_records
+from services.library_sync import (InvalidCursor, cursor_expired, decode_cursor, encode_cursor, library_changes,
+                                   remove_entry)
 
 library_bp = Blueprint('library', __name__)
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 200
+IMPORT_SPOOL_MAX_MEMORY = 4 * 1024 * 1024
+# Library reads may be stored by the browser but must be revalidated (cheaply, via the ETag)
+LIBRARY_CACHE_CONTROL = 'private, no-cache'
+
 
 class BookDataPayload(BaseModel):
     external_id: Optional[str] = None
@@ -23,12 +52,17 @@ class LibraryEntryPayload(BaseModel):
     status: int = Field(..., ge=0, le=2)
     rating: Optional[float] = Field(None, ge=1, le=5)
 
+class ImportRowPayload(BookDataPayload):
+    status: int = Field(0, ge=0, le=2)
+    rating: Optional[float] = Field(None, ge=1, le=5)
+
 
 
 @library_bp.route('/add', methods=['POST'])
 @jwt_required()
+@rate_limit('library_write')
 def add_or_update_library_entry():
-    user_id = get_jwt_identity() 
+    user_id = int(get_jwt_identity())
     json_data = request.get_json(silent=True)
 
     if not json_data:
@@ -37,7 +71,7 @@ def add_or_update_library_entry():
     
 
     try:
-        payload = LibraryEntryPayload(**json_data)
+        payload = LibraryEntryPayload.model_validate(json_data)
     except ValidationError as e:
         current_app.logger.error(f"Pydantic Validation Error for user {user_id}: {e.errors()}") 
         return jsonify({"message": "Validation Error", "details": e.errors()}), 422
@@ -48,76 +82,355 @@ def add_or_update_library_entry():
     if payload.rating is not None and round(payload.rating * 2) / 2 != payload.rating:
          return jsonify({"message": "Validation Error: Rating must be a whole or half number (e.g., 3, 4.5)"}), 400
 
-    book_id = None
-
-    # --- Handle based on source --- 
-    if payload.source == 'local':
-        if payload.local_book_id:
-             book_exists = Book.query.get(payload.local_book_id)
-             if not book_exists:
-                 return jsonify({"message": f"Book with local ID {payload.local_book_id} not found"}), 404
-             book_id = payload.local_book_id
-
-    elif payload.source == 'external':
-        if payload.book_data:
-            book = None
-            if payload.book_data.isbn:
-                book = Book.query.filter_by(isbn=payload.book_data.isbn).first()
-
-            if not book:
-                author_str = ', '.join(payload.book_data.authors) if payload.book_data.authors else None
-                existing_book_check = Book.query.filter_by(title=payload.book_data.title, author=author_str).first()
-                if existing_book_check:
-                    book = existing_book_check
-                    if not book.isbn and payload.book_data.isbn: book.isbn = payload.book_data.isbn
-                    if not book.image_url and payload.book_data.cover_url: book.image_url = payload.book_data.cover_url
-                else:
-                    new_book = Book(
-                        title=payload.book_data.title,
-                        author=author_str,
-                        isbn=payload.book_data.isbn,
-                        image_url=payload.book_data.cover_url
-                    )
-                    db.session.add(new_book)
-                    try:
-                        db.session.flush()
-                        book = new_book
-                    except Exception as e:
-                         db.session.rollback()
-                         # Keep DB error log
-                         current_app.logger.error(f"Error flushing new book: {e}")
-                         return jsonify({"message": "Database error creating book"}), 500
-
-            if not book or not book.id:
-                 current_app.logger.error("Failed to find or create book object with ID for external source")
-                 return jsonify({"message": "Could not find or create book record from external data"}), 500
-            book_id = book.id
-
-
-    # --- Find or Create/Update Library Entry --- 
-    if not book_id:
-         current_app.logger.error(f"Internal error: Book ID not determined for user {user_id}")
-         return jsonify({"message": "Internal error: Book ID not determined"}), 500
-
-    library_entry = LibraryEntry.query.filter_by(user_id=user_id, book_id=book_id).first()
-
-    if library_entry:
-        library_entry.status = payload.status
-        library_entry.user_rating = payload.rating
-    else:
-        library_entry = LibraryEntry(
-            user_id=user_id,
-            book_id=book_id,
-            status=payload.status,
-            user_rating=payload.rating
-        )
-        db.session.add(library_entry)
-
+    # Each branch is an upsert, so concurrent adds of the same book converge on one
+    # Book and one LibraryEntry row instead of tripping the unique constraints
+    entry_row = None
     try:
+        if payload.source == 'local' and payload.local_book_id:
+            # Version first: its users-row lock serializes this user's writes, so the pre-read below
+            # cannot miss an entry a concurrent add of the same book is about to insert
+            version = next_library_version(user_id)
+            previous = previous_entries(user_id, [payload.local_book_id])
+            # Inserting from a SELECT on books doubles as the existence check
+            entry_row = db.session.execute(library_entry_upsert(select=select(
+                literal(user_id), Book.id, literal(payload.status), literal(payload.rating, Float), literal(version)
+            ).where(Book.id == payload.local_book_id))).first()
+            if entry_row is None:
+                db.session.rollback()
+                return jsonify({"message": f"Book with local ID {payload.local_book_id} not found"}), 404
+
+        elif payload.source == 'external' and payload.book_data:
+            book_id = _upsert_external_book(payload.book_data)
+            version = next_library_version(user_id)
+            previous = previous_entries(user_id, [book_id])
+            entry_row = db.session.execute(library_entry_upsert({
+                "user_id": user_id,
+                "book_id": book_id,
+                "status": payload.status,
+                "user_rating": payload.rating,
+                "version": version,
+            })).first()
+
+        if entry_row is None:
+            current_app.logger.error(f"Internal error: Book ID not determined for user {user_id}")
+            return jsonify({"message": "Internal error: Book ID not determined"}), 500
+
+        # Move the shelf/rating counters from the entry's old bucket to its new one
+        record_entry_changes(user_id, previous, [entry_row])
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Error committing library entry for user {user_id}: {e}")
         return jsonify({"message": "Database error saving library entry"}), 500
 
-    return jsonify({"message": "Library entry saved successfully"}), 200
\ No newline at end of file
+    entry_id, book_id = entry_row.id, entry_row.book_id
+    return jsonify({"message": "Library entry saved successfully", "entry_id": entry_id, "book_id": book_id}), 200
+
+
+def _upsert_external_book(book_data):
+    """Find or create the Book for external search data and return its id.
+
+    With an ISBN this is a single INSERT ... ON CONFLICT (isbn) statement. Without
+    one there is no unique key to upsert on, so it falls back to the title/author
+    lookup and inserts only when that misses.
+    """
+    author_str = ', '.join(book_data.authors) if book_data.authors else None
+    isbn = canonical_isbn(book_data.isbn)
+    # Search results hand out proxied cover URLs; store the upstream one
+    cover_url = upstream_cover_url(book_data.cover_url)
+
+    if isbn:
+        book_id, _, title, author = db.session.execute(book_upsert({
+            "title": book_data.title,
+            "author": author_str,
+            "isbn": isbn,
+            "image_url": cover_url,
+            "external_id": book_data.external_id,
+            "first_publish_year": book_data.first_publish_year,
+        })).one()
+        index_books([(book_id, title, author)])
+        return book_id
+
+    existing = db.session.query(Book.id, Book.image_url).filter_by(title=book_data.title, author=author_str).first()
+    if existing:
+        if not existing.image_url and cover_url:
+            Book.query.filter_by(id=existing.id).update({"image_url": cover_url})
+        return existing.id
+
+    book_id = db.session.execute(
+        insert(Book.__table__).values(title=book_data.title, author=author_str, image_url=cover_url,
+                                      external_id=book_data.external_id,
+                                      first_publish_year=book_data.first_publish_year)
+        .returning(Book.__table__.c.id)
+    ).scalar_one()
+    index_books([(book_id, book_data.title, author_str)])
+    return book_id
+
+
+
+def _library_etag(user_id):
+    """ETag for a read of the user's library: it changes with every write to it (library_version)
+    and with the URL, so a revalidation costs one primary-key lookup."""
+    version = library_version(user_id)
+    return body_etag(f"{user_id}:{version}:{request.host_url}:{request.full_path}".encode())
+
+
+def _cacheable(response, etag):
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = LIBRARY_CACHE_CONTROL
+    return response
+
+
+@library_bp.route('/stats', methods=['GET'])
+@use_read_replica
+@statement_timeout(settings.LIBRARY_READ_STATEMENT_TIMEOUT_MS)
+@jwt_required()
+def library_stats():
+    """Shelf counts and rating distribution, served from precomputed per-user counters."""
+    user_id = int(get_jwt_identity())
+    etag = _library_etag(user_id)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag, LIBRARY_CACHE_CONTROL)
+    return _cacheable(jsonify(get_library_stats(user_id)), etag)
+
+
+def _encode_cursor(status, entry_id):
+    return base64.urlsafe_b64encode(f"{status}:{entry_id}".encode()).decode()
+
+
+def _decode_cursor(cursor):
+    status, entry_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+    return int(status), int(entry_id)
+
+
+@library_bp.route('/entries', methods=['GET'])
+@use_read_replica
+@statement_timeout(settings.LIBRARY_READ_STATEMENT_TIMEOUT_MS)
+@jwt_required()
+def list_library_entries():
+    """Keyset-paginated listing of the user's library, ordered by (status, id).
+
+    Query params: limit, cursor (from a previous page's next_cursor), status,
+    rating (exact) and min_rating. Book columns are joined into the same query
+    and rows are streamed out in batches, so large pages never materialize
+    a full list of ORM objects. Responses carry an ETag; a matching If-None-Match
+    gets a 304 without running the query.
+    """
+    user_id = int(get_jwt_identity())
+
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    status = request.args.get('status', type=int)
+    rating = request.args.get('rating', type=float)
+    min_rating = request.args.get('min_rating', type=float)
+    cursor = request.args.get('cursor')
+
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        return jsonify({"message": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    if status is not None and status not in (0, 1, 2):
+        return jsonify({"message": "status must be 0, 1 or 2"}), 400
+
+    etag = _library_etag(user_id)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag, LIBRARY_CACHE_CONTROL)
+
+    query = db.session.query(*LIBRARY_ENTRY_COLUMNS) \
+        .join(Book, LibraryEntry.book_id == Book.id).filter(LibraryEntry.user_id == user_id)
+
+    if status is not None:
+        query = query.filter(LibraryEntry.status == status)
+    if rating is not None:
+        query = query.filter(LibraryEntry.user_rating == rating)
+    if min_rating is not None:
+        query = query.filter(LibraryEntry.user_rating >= min_rating)
+
+    if cursor:
+        try:
+            after_status, after_id = _decode_cursor(cursor)
+        except (ValueError, binascii.Error, UnicodeDecodeError):
+            return jsonify({"message": "Invalid cursor"}), 400
+        query = query.filter(or_(
+            LibraryEntry.status > after_status,
+            and_(LibraryEntry.status == after_status, LibraryEntry.id > after_id)
+        ))
+
+    # One extra row tells us whether there is a next page
+    query = query.order_by(LibraryEntry.status, LibraryEntry.id).limit(limit + 1)
+
+    url_root = request.host_url
+
+    def generate():
+        dumps = current_app.json.dumps
+        last = None
+        has_more = False
+        yield '{"entries":['
+        for i, row in enumerate(query.yield_per(STREAM_BATCH_SIZE)):
+            if i == limit:
+                has_more = True
+                break
+            entry = library_entry(row, url_root)
+            yield (',' if i else '') + dumps(entry)
+            last = row
+        next_cursor = _encode_cursor(last[2], last[0]) if has_more else None
+        yield '],"next_cursor":' + dumps(next_cursor) + '}'
+
+    return _cacheable(Response(stream_with_context(generate()), mimetype='application/json'), etag)
+
+
+@library_bp.route('/entries/<int:entry_id>', methods=['DELETE'])
+@jwt_required()
+@rate_limit('library_write')
+def delete_library_entry(entry_id):
+    """Remove a book from the user's library. Sync clients see the removal as a tombstone in /changes."""
+    user_id = int(get_jwt_identity())
+    try:
+        removed = remove_entry(user_id, entry_id)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error deleting library entry {entry_id} for user {user_id}: {e}")
+        return jsonify({"message": "Database error removing library entry"}), 500
+    if not removed:
+        return jsonify({"message": f"Library entry {entry_id} not found"}), 404
+    return jsonify({"message": "Library entry removed", "entry_id": entry_id}), 200
+
+
+@library_bp.route('/changes', methods=['GET'])
+@use_read_replica
+@statement_timeout(settings.LIBRARY_READ_STATEMENT_TIMEOUT_MS)
+@jwt_required()
+def library_changes_since():
+    """Incremental sync feed: entries added or changed, and ids of entries removed, since a cursor.
+
+    Without ?since= (or with a cursor older than the tombstone retention)
+    the whole library is returned with "reset": true, and the client should
+    replace its cache. Every response carries the next cursor. The body is
+    streamed like /entries.
+    """
+    user_id = int(get_jwt_identity())
+
+    since = 0
+    reset = True
+    cursor = request.args.get('since')
+    if cursor:
+        try:
+            since, issued_at = decode_cursor(cursor)
+        except InvalidCursor:
+            return jsonify({"message": "Invalid cursor"}), 400
+        reset = cursor_expired(issued_at)
+        if reset:
+            since = 0
+
+    etag = _library_etag(user_id)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag, LIBRARY_CACHE_CONTROL)
+
+    version, entries, deleted = library_changes(user_id, since)
+    url_root = request.host_url
+
+    def generate():
+        dumps = current_app.json.dumps
+        yield '{"entries":['
+        for i, row in enumerate(entries.yield_per(STREAM_BATCH_SIZE)):
+            yield (',' if i else '') + dumps(library_entry(row, url_root))
+        yield '],"deleted":' + dumps(deleted)
+        yield ',"reset":' + dumps(reset) + ',"cursor":' + dumps(encode_cursor(version)) + '}'
+
+    return _cacheable(Response(stream_with_context(generate()), mimetype='application/json'), etag)
+
+
+def _parse_import_row(row_number, record):
+    """Validate one imported record. Returns (row, None) or (None, error_result)."""
+    if isinstance(record, Exception):
+        return None, {"row": row_number, "status": "error", "message": f"Invalid JSON: {record}"}
+    try:
+        payload = ImportRowPayload.model_validate(record)
+    except ValidationError as e:
+        return None, {"row": row_number, "status": "error", "message": "Validation Error",
+                      "details": json.loads(e.json(include_url=False))}
+
+    if payload.status != 2 and payload.rating is not None:
+        return None, {"row": row_number, "status": "error",
+                      "message": "Validation Error: Rating can only be provided if status is 'Read'"}
+    if payload.rating is not None and round(payload.rating * 2) / 2 != payload.rating:
+        return None, {"row": row_number, "status": "error",
+                      "message": "Validation Error: Rating must be a whole or half number (e.g., 3, 4.5)"}
+
+    author_str = ', '.join(payload.authors) if payload.authors else None
+    return {
+        "row": row_number,
+        "title": payload.title[:200],
+        "author": author_str[:150] if author_str else None,
+        "isbn": canonical_isbn(payload.isbn),
+        "cover_url": upstream_cover_url(payload.cover_url),
+        "status": payload.status,
+        "rating": payload.rating,
+    }, None
+
+
+@library_bp.route('/import', methods=['POST'])
+@jwt_required()
+@rate_limit('library_import')
+def import_library_entries():
+    """Bulk import from a Goodreads/generic CSV export or JSON lines.
+
+    Accepts a multipart 'file' upload or a raw request body; the format comes
+    from ?format=csv|jsonl, else the file name or content type. The response
+    is streamed as JSON lines: one result per row, a progress line after each
+    committed batch, and a final summary.
+    """
+    user_id = int(get_jwt_identity())
+
+    upload = request.files.get('file')
+    source = upload.stream if upload else request.stream
+    name = (upload.filename if upload else '') or ''
+    content_type = (upload.mimetype if upload else request.mimetype) or ''
+
+    fmt = request.args.get('format')
+    if not fmt:
+        fmt = 'jsonl' if name.endswith(('.jsonl', '.ndjson')) or 'ndjson' in content_type or 'jsonl' in content_type else 'csv'
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({"message": "format must be 'csv' or 'jsonl'"}), 400
+
+    # The request's own streams are closed once the view returns, before the response
+    # body is generated, so copy the upload into a spool file this view owns
+    spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_MAX_MEMORY)
+    shutil.copyfileobj(source, spool)
+    spool.seek(0)
+    stream = io.TextIOWrapper(spool, encoding='utf-8-sig', newline='')
+
+    def generate():
+        dumps = current_app.json.dumps
+        processed = imported = failed = 0
+        batch = []
+
+        def flush():
+            nonlocal imported, failed
+            results, inserted = import_batch(user_id, batch)
+            index_books(inserted)
+            batch.clear()
+            for result in results:
+                if result["status"] == "imported":
+                    imported += 1
+                else:
+                    failed += 1
+                yield dumps(result) + '\n'
+            yield dumps({"progress": {"processed": processed, "imported": imported, "failed": failed}}) + '\n'
+
+        for row_number, record in iter_import_records(stream, fmt):
+            processed += 1
+            row, error = _parse_import_row(row_number, record)
+            if error:
+                failed += 1
+                yield dumps(error) + '\n'
+                continue
+            batch.append(row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                yield from flush()
+
+        if batch:
+            yield from flush()
+
+        current_app.logger.info(f"Library import for user {user_id}: {imported} imported, {failed} failed")
+        yield dumps({"summary": {"processed": processed, "imported": imported, "failed": failed}}) + '\n'
+        stream.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
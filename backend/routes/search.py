@@ -1,82 +1,240 @@
 # backend/routes/search.py
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
 from flask import Blueprint, request, jsonify, current_app
-from sqlalchemy import or_ # For OR queries
 
-# Import external search service and models
-from services.book_search_api import search_books_external
-from models import db, Book
+# Import external and local search services
+from services.book_lookup import InvalidReference, external_query, lookup_local, parse_reference
+from services.book_search_api import UpstreamUnavailable, search_books_external
+from services.book_search_index import search_local_books, suggest_books
+from services.catalog_enrichment import enqueue_hits_in_background
+from services.cover_cache import proxy_cover_url
+from services.db_routing import statement_timeout, use_read_replica
+from services.rate_limit import rate_limit
+from services.recommendations import similar_books_stmt
+from services.isbn import to_isbn13
+from services.search_ranking import popularity_stmt, rank_results
+from services.serializers import book_card
+from models import db
+from config import settings
 
 search_bp = Blueprint('search', __name__)
 
 MAX_LOCAL_RESULTS = 20
 MAX_EXTERNAL_RESULTS = 20
+DEFAULT_SEARCH_RESULTS = 20
+MAX_SEARCH_RESULTS = 40
+DEFAULT_SUGGESTIONS = 8
+DEFAULT_SIMILAR_BOOKS = 10
+MAX_SUGGESTIONS = 20
+
+# Open Library calls run here so they overlap with the local query
+_external_pool = ThreadPoolExecutor(max_workers=settings.SEARCH_FANOUT_WORKERS, thread_name_prefix="external-search")
+
+def format_external_hit(book_data, url_root):
+    return {
+        "local_book_id": None,
+        "external_id": book_data.get("external_id"),
+        "title": book_data.get("title"),
+        "authors": book_data.get("authors"),
+        "isbn": to_isbn13(book_data.get("isbn")) or book_data.get("isbn"),
+        "first_publish_year": book_data.get("first_publish_year"),
+        "publisher": book_data.get("publisher"),
+        "description": book_data.get("description"),
+        "cover_url": proxy_cover_url(url_root, book_data.get("cover_url")),
+        "public_rating": book_data.get("public_rating"),
+        "source": "external" # Mark source
+    }
+
+
+def new_external_hits(external_results_raw, local_books):
+    """External hits for books not already in the local results, matched by ISBN (as ISBN-13) or Open Library key."""
+    local_ISBNs = {to_isbn13(book.isbn) or book.isbn for book in local_books if book.isbn}
+    local_external_ids = {book.external_id for book in local_books if book.external_id}
+    return [
+        book_data for book_data in external_results_raw or ()
+        if not (book_data.get("isbn") and (to_isbn13(book_data["isbn"]) or book_data["isbn"]) in local_ISBNs)
+        and not (book_data.get("external_id") and book_data["external_id"] in local_external_ids)
+    ]
+
+
+def format_ranked(ranked, url_root):
+    return [
+        book_card(item, url_root) if source == 'local' else format_external_hit(item, url_root)
+        for source, item in ranked
+    ]
+
 
 @search_bp.route('/books', methods=['GET'])
+@rate_limit('search')
+@use_read_replica
+@statement_timeout(settings.SEARCH_STATEMENT_TIMEOUT_MS)
 def search_all_books():
     query = request.args.get('query', type=str)
-    # Consider adding page/limit parameters later for pagination
+    limit = request.args.get('limit', DEFAULT_SEARCH_RESULTS, type=int)
 
     if not query or len(query) < 3:
         return jsonify({"message": "Query parameter is required and must be at least 3 characters long."}), 400
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+
+    deadline = time.monotonic() + settings.SEARCH_DEADLINE_SECONDS
+    external_future = _external_pool.submit(search_books_external, query, MAX_EXTERNAL_RESULTS)
 
-    local_results_formatted = []
-    external_results_formatted = []
-    local_ISBNs = set()
+    url_root = request.host_url
+    local_books = []
+    new_hits = []
+    popularity = {}
+    partial = False
 
     try:
-        search_term = f"%{query}%"
-        local_books = Book.query.filter(
-            or_(
-                Book.title.ilike(search_term),
-                Book.author.ilike(search_term)
-            )
-        ).limit(MAX_LOCAL_RESULTS).all()
-
-        for book in local_books:
-            local_results_formatted.append({
-                "local_book_id": book.id,
-                "external_id": None,
-                "title": book.title,
-                "authors": book.author.split(', ') if book.author else [],
-                "isbn": book.isbn,
-                "first_publish_year": None,
-                "publisher": None,
-                "description": None,
-                "cover_url": book.image_url,
-                "public_rating": book.public_rating,
-                "source": "local"
-            })
-            if book.isbn:
-                local_ISBNs.add(book.isbn)
+        local_books = search_local_books(query, MAX_LOCAL_RESULTS)
+        if local_books:
+            popularity = dict(db.session.execute(popularity_stmt([book.id for book in local_books])).all())
     except Exception as e:
         current_app.logger.error(f"Error searching local database: {e}")
 
+    try:
+        # Whatever time the local query left over is what the upstream call gets;
+        # on timeout it keeps running in the pool and warms the cache for the next request
+        external_results_raw = external_future.result(timeout=max(deadline - time.monotonic(), 0))
+    except FutureTimeoutError:
+        current_app.logger.warning(f"External search for '{query}' exceeded the {settings.SEARCH_DEADLINE_SECONDS}s budget")
+        external_results_raw = None
+        partial = True
+    except UpstreamUnavailable:
+        # Circuit breaker is open: answer with local results straight away
+        external_results_raw = None
+        partial = True
+    except Exception as e:
+        current_app.logger.error(f"Error searching external API: {e}")
+        external_results_raw = None
 
     try:
-        external_results_raw = search_books_external(query, MAX_EXTERNAL_RESULTS)
         if external_results_raw:
-             for book_data in external_results_raw:
-                 # Filter out external results if a matching ISBN exists locally
-                 if book_data.get("isbn") and book_data["isbn"] in local_ISBNs:
-                     continue
-
-                 external_results_formatted.append({
-                    "local_book_id": None,
-                    "external_id": book_data.get("external_id"),
-                    "title": book_data.get("title"),
-                    "authors": book_data.get("authors"),
-                    "isbn": book_data.get("isbn"),
-                    "first_publish_year": book_data.get("first_publish_year"),
-                    "publisher": book_data.get("publisher"),
-                    "description": book_data.get("description"),
-                    "cover_url": book_data.get("cover_url"),
-                    "public_rating": book_data.get("public_rating"),
-                    "source": "external" # Mark source
-                 })
+             new_hits = new_external_hits(external_results_raw, local_books)
+
+             # Hand hits we do not have yet to the enrichment queue, off the request path
+             if new_hits and settings.ENRICHMENT_ENABLED:
+                 _external_pool.submit(enqueue_hits_in_background, current_app._get_current_object(), new_hits)
     except Exception as e:
         current_app.logger.error(f"Error searching external API: {e}")
 
-    # Add sorting logic here
-    combined_results = local_results_formatted + external_results_formatted
-    
-    return jsonify(combined_results), 200 
\ No newline at end of file
+    # Collapse editions, rank, and only then build dicts for the `limit` results that are returned
+    ranked = rank_results(query, local_books, new_hits, popularity, limit)
+
+    response = jsonify(format_ranked(ranked, url_root))
+    # The body stays a plain list for existing clients; partial results are flagged in a header
+    response.headers['X-Search-Partial'] = 'true' if partial else 'false'
+    if partial:
+        response.headers['Cache-Control'] = 'no-store'
+    else:
+        # Local rows can gain metadata without their ids changing, so the ETag hashes the body
+        response.headers['Cache-Control'] = f'public, max-age={settings.SEARCH_RESULTS_MAX_AGE}'
+        response.add_etag(weak=True)
+        response.make_conditional(request)
+    return response
+
+
+def _lookup_external(refs, deadline):
+    """Search Open Library for each of `refs` concurrently, within `deadline`.
+
+    Returns ({ref: hit}, partial), partial being set when a call ran out of time or upstream is unavailable.
+    """
+    futures = {ref: _external_pool.submit(search_books_external, external_query(ref), 1) for ref in refs}
+    hits = {}
+    partial = False
+    for ref, future in futures.items():
+        try:
+            results = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except (FutureTimeoutError, UpstreamUnavailable):
+            partial = True
+            continue
+        except Exception as e:
+            current_app.logger.error(f"Error looking up {ref} on external API: {e}")
+            continue
+        if results is None:
+            partial = True
+        elif results:
+            # Copied: cached result lists are shared between requests
+            hit = dict(results[0])
+            if ref[0] == 'isbn':
+                # The work's first ISBN may be another edition's; report the one that was asked for
+                hit["isbn"] = ref[1]
+            hits[ref] = hit
+    return hits, partial
+
+
+@search_bp.route('/books/lookup', methods=['POST'])
+@rate_limit('lookup')
+@use_read_replica
+@statement_timeout(settings.SEARCH_STATEMENT_TIMEOUT_MS)
+def lookup_books():
+    """Resolve many books in one request: {"books": [12, "9780441013593", "/works/OL45804W", ...]}.
+
+    Integers are local book ids, strings ISBNs or Open Library keys. The response is a list in
+    request order holding a search result, or null when the book could not be found.
+    """
+    data = request.get_json(silent=True) or {}
+    values = data.get('books')
+    if not isinstance(values, list) or not values:
+        return jsonify({"message": "'books' must be a non-empty list of book ids, ISBNs or Open Library keys."}), 400
+    if len(values) > settings.BOOK_LOOKUP_MAX_ITEMS:
+        return jsonify({"message": f"At most {settings.BOOK_LOOKUP_MAX_ITEMS} books can be looked up at once."}), 400
+    try:
+        refs = [parse_reference(value) for value in values]
+    except InvalidReference as e:
+        return jsonify({"message": str(e)}), 400
+
+    deadline = time.monotonic() + settings.SEARCH_DEADLINE_SECONDS
+    unique_refs = list(dict.fromkeys(refs))
+    local_rows = lookup_local(unique_refs)
+
+    # Local ids that were not found do not exist anywhere; ISBNs and keys can still be on Open Library
+    misses = [ref for ref in unique_refs if ref not in local_rows and external_query(ref)]
+    hits, partial = _lookup_external(misses[:settings.BOOK_LOOKUP_MAX_EXTERNAL], deadline)
+    if len(misses) > settings.BOOK_LOOKUP_MAX_EXTERNAL:
+        partial = True
+
+    if hits and settings.ENRICHMENT_ENABLED:
+        _external_pool.submit(enqueue_hits_in_background, current_app._get_current_object(), list(hits.values()))
+
+    url_root = request.host_url
+    cards = {ref: book_card(row, url_root) for ref, row in local_rows.items()}
+    cards.update((ref, format_external_hit(hit, url_root)) for ref, hit in hits.items())
+
+    response = jsonify([cards.get(ref) for ref in refs])
+    response.headers['X-Search-Partial'] = 'true' if partial else 'false'
+    return response
+
+
+@search_bp.route('/books/<int:book_id>/similar', methods=['GET'])
+@rate_limit('similar')
+@use_read_replica
+@statement_timeout(settings.SEARCH_STATEMENT_TIMEOUT_MS)
+def similar_books(book_id):
+    """Books readers of this one also shelved, from the precomputed neighbours, best first (empty until computed)."""
+    limit = request.args.get('limit', DEFAULT_SIMILAR_BOOKS, type=int)
+    limit = max(1, min(limit, settings.RECOMMENDATIONS_TOP_K))
+
+    url_root = request.host_url
+    rows = db.session.execute(similar_books_stmt(book_id, limit)).all()
+
+    response = jsonify([book_card(row, url_root) for row in rows])
+    response.headers['Cache-Control'] = f'public, max-age={settings.SEARCH_RESULTS_MAX_AGE}'
+    response.add_etag(weak=True)
+    response.make_conditional(request)
+    return response
+
+
+@search_bp.route('/suggest', methods=['GET'])
+@rate_limit('suggest')
+def suggest_books_by_prefix():
+    query = request.args.get('query', type=str)
+    limit = request.args.get('limit', DEFAULT_SUGGESTIONS, type=int)
+
+    if not query or len(query.strip()) < 2:
+        return jsonify({"message": "Query parameter is required and must be at least 2 characters long."}), 400
+    limit = max(1, min(limit, MAX_SUGGESTIONS))
+
+    return jsonify(suggest_books(query, limit)), 200
@@ -1,42 +1,85 @@
-from flask import Flask, jsonify
-from flask_migrate import Migrate
+from importlib import import_module
+
+from flask import Flask
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from config import settings
+import click
 import logging
 from logging.config import dictConfig
 
 from models import db
-
-dictConfig({
-    'version': 1,
-    'formatters': {'default': {
-        'format': '[%(asctime)s] %(levelname)s in %(module)s: %(message)s',
-    }},
-    'handlers': {'wsgi': {
-        'class': 'logging.StreamHandler',
-        'stream': 'ext://flask.logging.wsgi_errors_stream',
-        'formatter': 'default'
-    }},
-    'root': {
-        'level': 'INFO',
-        'handlers': ['wsgi']
-    }
-})
+from services import db_routing, metrics, responses
+from services.rate_limit import limiter
+from services.user_cache import register_user_loader
 
 jwt = JWTManager()
 log = logging.getLogger(__name__)
 
+# name -> (module, blueprint attribute, URL prefix). APP_BLUEPRINTS picks the ones a process serves,
+# and only those modules are imported
+BLUEPRINTS = {
+    'auth': ('routes.auth', 'auth_bp', '/auth'),
+    'search': ('routes.search', 'search_bp', '/api/search'),
+    'library': ('routes.library', 'library_bp', '/api/library'),
+    'covers': ('routes.covers', 'covers_bp', '/api/covers'),
+}
+
+
+def configure_logging():
+    dictConfig({
+        'version': 1,
+        'formatters': {'default': {
+            'format': '[%(asctime)s] %(levelname)s in %(module)s: %(message)s',
+        }},
+        'handlers': {'wsgi': {
+            'class': 'logging.StreamHandler',
+            'stream': 'ext://flask.logging.wsgi_errors_stream',
+            'formatter': 'default'
+        }},
+        'root': {
+            'level': 'INFO',
+            'handlers': ['wsgi']
+        }
+    })
+
+
+class MigrateCommands(click.Group):
+    """`flask db ...`. Flask-Migrate (and with it Alembic) is only imported and wired up
+    when one of these commands runs, not in every worker."""
+
+    def __init__(self, app):
+        super().__init__('db', help="Perform database migrations (Flask-Migrate).")
+        self.app = app
+
+    def _commands(self):
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as migrate_commands
+        if 'migrate' not in self.app.extensions:
+            # Column type changes (e.g. library_entries.user_rating to float) are part of autogenerated migrations
+            Migrate(self.app, db, compare_type=True)
+        return migrate_commands
+
+    def list_commands(self, ctx):
+        return self._commands().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._commands().get_command(ctx, name)
+
+
 def create_app():
+    """Build the app. Cheap by design: no database access and no cache building here, see warm_up()."""
+    configure_logging()
     app = Flask(__name__)
 
     app.logger.info("Logger configured, creating app...")
 
-    CORS(app)
+    CORS(app, expose_headers=['X-Search-Partial', 'Retry-After'])
 
     # Configure the application using settings from config.py
     app.config['SQLALCHEMY_DATABASE_URI'] = settings.DATABASE_URL
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db_routing.configure_app(app)
     app.config['SECRET_KEY'] = settings.SECRET_KEY
     
     app.config["JWT_SECRET_KEY"] = settings.SECRET_KEY 
@@ -44,20 +87,68 @@ def create_app():
     app.config["JWT_TOKEN_LOCATION"] = ["headers"]
     app.config["JWT_CSRF_PROTECTION"] = False
 
-    # Log the JWT Secret Key being used by the app
-    app.logger.info(f"JWT Secret Key configured: {app.config['JWT_SECRET_KEY']}")
-
     jwt.init_app(app)
+    register_user_loader(jwt)
     db.init_app(app)
-    Migrate(app, db)
+    app.cli.add_command(MigrateCommands(app))
+    metrics.init_app(app)
+    responses.init_app(app)
+    limiter.init_app(app)
 
-    from routes.auth import auth_bp 
-    from routes.search import search_bp 
-    from routes.library import library_bp
+    for name in settings.APP_BLUEPRINTS:
+        module, attribute, url_prefix = BLUEPRINTS[name]
+        app.register_blueprint(getattr(import_module(module), attribute), url_prefix=url_prefix)
 
-    app.register_blueprint(auth_bp, url_prefix='/auth')
-    app.register_blueprint(search_bp, url_prefix='/api/search')
-    app.register_blueprint(library_bp, url_prefix='/api/library')
+    @app.cli.command('enrich-worker')
+    @click.option('--batch-size', type=int, default=None, help="Jobs per batch (default: ENRICHMENT_BATCH_SIZE)")
+    @click.option('--once', is_flag=True, help="Exit when the queue is empty instead of polling")
+    def enrich_worker(batch_size, once):
+        """Persist queued external search hits into the books table."""
+        from services.catalog_enrichment import run_worker
+        run_worker(batch_size=batch_size, once=once)
+
+    @app.cli.command('rebuild-library-stats')
+    @click.option('--user-id', type=int, default=None, help="Only rebuild this user's counters")
+    def rebuild_library_stats_command(user_id):
+        """Recompute the per-user shelf and rating counters from library_entries."""
+        from services.library_stats import rebuild_library_stats
+        rows = rebuild_library_stats(user_id)
+        print(f"Rebuilt library stats ({rows} counter rows).")
+
+    @app.cli.command('prune-library-tombstones')
+    def prune_library_tombstones_command():
+        """Delete sync tombstones older than LIBRARY_TOMBSTONE_RETENTION_DAYS."""
+        from services.library_sync import prune_tombstones
+        print(f"Pruned {prune_tombstones()} library tombstones.")
+
+    @app.cli.command('normalize-isbns')
+    def normalize_isbns_command():
+        """Store every ISBN as ISBN-13 and merge books that turn out to be the same edition."""
+        from services.book_merge import normalize_isbns
+        rewritten, merged = normalize_isbns()
+        print(f"Normalized {rewritten} ISBNs, merged {merged} duplicate books.")
+
+    @app.cli.command('rebuild-recommendations')
+    def rebuild_recommendations_command():
+        """Recompute every book's "readers also shelved" neighbours from library_entries."""
+        from services.similarity import rebuild_similarities
+        print(f"Rebuilt book similarities ({rebuild_similarities()} pairs).")
+
+    @app.cli.command('refresh-recommendations')
+    def refresh_recommendations_command():
+        """Recompute the neighbours of books whose readers changed since the last refresh."""
+        from services.similarity import refresh_similarities
+        changed, affected = refresh_similarities()
+        print(f"Refreshed book similarities ({changed} changed, {affected} affected books).")
+
+    @app.cli.command('create-search-index')
+    def create_search_index():
+        """Create the full-text and trigram search indexes on an existing PostgreSQL database."""
+        from services.book_search_index import ensure_search_indexes
+        if ensure_search_indexes():
+            print("Search indexes are in place.")
+        else:
+            print("Not a PostgreSQL database; local search uses the in-process index.")
 
     @app.route('/')
     def hello():
@@ -67,7 +158,49 @@ def create_app():
     app.logger.info("Flask App Created and Configured")
     return app
 
-app = create_app()
+def warm_up(app):
+    """Do the work create_app() leaves for first use: configure the ORM mappers, create the upstream
+    HTTP sessions and build the in-process search index.
+
+    Meant for a preloading server's master process (see gunicorn.conf.py), so that forked workers
+    share the result copy-on-write. Database connections opened here are closed again, so no worker
+    inherits a socket.
+    """
+    from sqlalchemy.orm import configure_mappers
+    configure_mappers()
+
+    if 'search' in settings.APP_BLUEPRINTS:
+        from services import book_search_api
+        book_search_api.http_session()
+    if 'covers' in settings.APP_BLUEPRINTS:
+        from services import cover_cache
+        cover_cache.http_session()
+
+    with app.app_context():
+        if settings.PRELOAD_SUGGEST_INDEX and 'search' in settings.APP_BLUEPRINTS:
+            from services.book_search_index import ensure_local_index
+            try:
+                ensure_local_index()
+            except Exception as e:
+                # e.g. tables not created yet; the index is then built on first use
+                app.logger.warning(f"Could not preload the book suggestion index: {e}")
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    app.logger.info("Warm-up complete")
+
+
+def __getattr__(name):
+    # `run:app` (WSGI servers, asgi.py, the flask CLI) is created on first access, so importing
+    # this module does not build an app
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    app = create_app()
+    warm_up(app)
+    app.run(debug=True)
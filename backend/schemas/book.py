@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, HttpUrl
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl
 from typing import Optional
 
 
@@ -24,11 +24,7 @@ class BookUpdate(BaseModel):
 class BookInDBBase(BookBase):
     id: int
 
-    class Config:
-        def __init__(self):
-            pass
-
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Properties to return to client
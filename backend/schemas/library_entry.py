@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional
 from datetime import datetime
 from .book import BookPublic
@@ -39,11 +39,7 @@ class LibraryEntryInDBBase(LibraryEntryBase):
     date_added: datetime
     # Status is already inherited as integer
 
-    class Config:
-        def __init__(self):
-            pass
-
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Properties to return to client
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from typing import Optional
 
 
@@ -15,10 +15,7 @@ class UserInDBBase(BaseModel):
     username: str = Field(..., min_length=3, max_length=80)
     email: EmailStr
 
-    class Config:
-        def __init__(self):
-            pass
-        from_attributes = True 
+    model_config = ConfigDict(from_attributes=True)
 
 class UserPublic(UserInDBBase):
     pass
@@ -0,0 +1,73 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from config import settings
+from services.db_routing import set_local_statement_timeout
+
+# Async drivers used when ASYNC_DATABASE_URL is not set
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+_engines = []
+_sessionmaker = None
+_replica_sessionmaker = None
+
+
+def async_database_url(url):
+    """Swap a sync DATABASE_URL's driver for its async counterpart (postgresql -> postgresql+asyncpg)."""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver known for '{url.get_backend_name()}'; set ASYNC_DATABASE_URL")
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}")
+
+
+def _apply_search_timeout(conn):
+    # The async engines only serve the search route, so every transaction gets the @statement_timeout
+    # the sync search views run under (there is no flask.g to read it from here)
+    set_local_statement_timeout(conn, settings.SEARCH_STATEMENT_TIMEOUT_MS)
+
+
+def _sessionmaker_for(url):
+    # Imported here: sqlalchemy.ext.asyncio needs greenlet, which the sync app does not
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    url = make_url(url)
+    options = {}
+    if url.get_backend_name() != 'sqlite':
+        options = {"pool_size": settings.ASYNC_DB_POOL_SIZE, "pool_pre_ping": True}
+    engine = create_async_engine(url, **options)
+    event.listen(engine.sync_engine, 'begin', _apply_search_timeout)
+    _engines.append(engine)
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+
+def init_async_engine(sync_url, replica_url=None):
+    """Create the process-wide async engine, mirroring the sync engine's database.
+
+    Pass the sync engine's URL (db.engine.url) rather than DATABASE_URL, since
+    Flask-SQLAlchemy resolves relative SQLite paths against the instance folder;
+    likewise the replica bind's URL, when DATABASE_REPLICA_URL is set.
+    """
+    global _sessionmaker, _replica_sessionmaker
+    if _sessionmaker is None:
+        _sessionmaker = _sessionmaker_for(settings.ASYNC_DATABASE_URL or async_database_url(sync_url))
+        if replica_url is not None:
+            _replica_sessionmaker = _sessionmaker_for(
+                settings.ASYNC_DATABASE_REPLICA_URL or async_database_url(replica_url))
+    return _sessionmaker
+
+
+def async_session(read_only=False):
+    """A session on the async engine; read_only sessions use the replica when one is configured."""
+    if _sessionmaker is None:
+        raise RuntimeError("init_async_engine() has not been called")
+    if read_only and _replica_sessionmaker is not None:
+        return _replica_sessionmaker()
+    return _sessionmaker()
+
+
+async def dispose_async_engine():
+    global _sessionmaker, _replica_sessionmaker
+    while _engines:
+        await _engines.pop().dispose()
+    _sessionmaker = _replica_sessionmaker = None
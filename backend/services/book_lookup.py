@@ -0,0 +1,77 @@
+"""Resolve many book references (local ids, ISBNs, Open Library keys) at once.
+
+References are parsed into (kind, value) pairs, and every one of them is
+looked up in the catalog with a single IN query. Whatever that misses can
+be searched on Open Library with external_query(); the lookup route fans
+those calls out concurrently.
+"""
+import re
+
+from sqlalchemy import or_, select
+
+from models import db, Book
+from services.isbn import to_isbn13
+from services.serializers import BOOK_CARD_COLUMNS
+
+# '/works/OL45804W', 'works/OL45804W' or 'OL45804W'; M keys are editions (/books/)
+_KEY_RE = re.compile(r'^/?(?:(?:works|books)/)?(OL\d+([WM]))$', re.IGNORECASE)
+
+
+class InvalidReference(ValueError):
+    pass
+
+
+def parse_reference(value):
+    """A JSON integer is a local book id; a string is an Open Library key or an ISBN (10 or 13, any formatting)."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        if value > 0:
+            return ('id', value)
+    elif isinstance(value, str):
+        match = _KEY_RE.match(value.strip())
+        if match:
+            olid = match.group(1).upper()
+            return ('key', f"/works/{olid}" if olid.endswith('W') else f"/books/{olid}")
+        isbn = to_isbn13(value)
+        if isbn:
+            return ('isbn', isbn)
+    raise InvalidReference(f"{value!r} is not a book id, ISBN or Open Library key")
+
+
+def lookup_local(refs):
+    """Map each of `refs` found in the catalog to its BOOK_CARD_COLUMNS row, in one query."""
+    ids = {value for kind, value in refs if kind == 'id'}
+    isbns = {value for kind, value in refs if kind == 'isbn'}
+    keys = {value for kind, value in refs if kind == 'key'}
+
+    clauses = []
+    if ids:
+        clauses.append(Book.id.in_(ids))
+    if isbns:
+        # Stored as ISBN-13, see services.isbn.canonical_isbn
+        clauses.append(Book.isbn.in_(isbns))
+    if keys:
+        clauses.append(Book.external_id.in_(keys))
+    if not clauses:
+        return {}
+
+    found = {}
+    # By id, so that a key shared by several editions resolves to the same (oldest) book every time
+    for row in db.session.execute(select(*BOOK_CARD_COLUMNS).where(or_(*clauses)).order_by(Book.id)):
+        found.setdefault(('id', row.id), row)
+        if row.isbn:
+            found.setdefault(('isbn', to_isbn13(row.isbn) or row.isbn), row)
+        if row.external_id:
+            found.setdefault(('key', row.external_id), row)
+    return {ref: found[ref] for ref in refs if ref in found}
+
+
+def external_query(ref):
+    """The Open Library search query that finds `ref`, or None for local ids, which only exist here."""
+    kind, value = ref
+    if kind == 'isbn':
+        return f"isbn:{value}"
+    if kind == 'key':
+        if value.startswith('/works/'):
+            return f"key:{value}"
+        return f"edition_key:{value.rsplit('/', 1)[1]}"
+    return None
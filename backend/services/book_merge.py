@@ -0,0 +1,65 @@
+from collections import defaultdict
+
+from sqlalchemy import delete, func, or_, select, update
+
+from models import db, Book, BookSimilarity, LibraryEntry, LibraryTombstone
+from services.isbn import canonical_isbn
+from services.library_stats import next_library_version, record_entry_removal
+from services.recommendations import queue_similarity_refresh
+
+
+def merge_book(keep_id, duplicate_id):
+    """Fold a duplicate book into `keep_id` and delete it, in the caller's transaction.
+
+    Shelf entries move to the kept book. A user who shelved both keeps the
+    entry on the kept book; the other is removed like a DELETE would remove
+    it (tombstone, counters). Every user touched gets a new library version.
+    """
+    entries = db.session.execute(
+        select(LibraryEntry.id, LibraryEntry.user_id, LibraryEntry.status, LibraryEntry.user_rating)
+        .where(LibraryEntry.book_id == duplicate_id)
+    ).all()
+    if entries:
+        shelved_both = set(db.session.scalars(select(LibraryEntry.user_id).where(
+            LibraryEntry.book_id == keep_id, LibraryEntry.user_id.in_([entry.user_id for entry in entries]))))
+        for entry in entries:
+            version = next_library_version(entry.user_id)
+            if entry.user_id in shelved_both:
+                db.session.execute(delete(LibraryEntry).where(LibraryEntry.id == entry.id))
+                db.session.add(LibraryTombstone(entry_id=entry.id, user_id=entry.user_id,
+                                                book_id=duplicate_id, version=version))
+                record_entry_removal(entry.user_id, entry.status, entry.user_rating)
+            else:
+                db.session.execute(update(LibraryEntry).where(LibraryEntry.id == entry.id)
+                                   .values(book_id=keep_id, version=version, updated_at=func.now()))
+        queue_similarity_refresh([keep_id, duplicate_id])
+
+    db.session.execute(delete(BookSimilarity).where(
+        or_(BookSimilarity.book_id == duplicate_id, BookSimilarity.similar_book_id == duplicate_id)))
+    db.session.execute(delete(Book).where(Book.id == duplicate_id))
+
+
+def normalize_isbns():
+    """Rewrite stored ISBNs in canonical form (services.isbn.canonical_isbn), merging the books
+    that turn out to be the same edition. Commits. Returns (rewritten, merged) counts.
+
+    Web workers with an in-process search index keep merged books in it until restarted.
+    """
+    by_isbn = defaultdict(list)
+    for book_id, isbn in db.session.execute(select(Book.id, Book.isbn).where(Book.isbn.isnot(None))):
+        by_isbn[canonical_isbn(isbn)].append((book_id, isbn))
+
+    rewritten = merged = 0
+    for isbn, books in by_isbn.items():
+        # Keep the row already stored in canonical form, else the oldest
+        books.sort(key=lambda book: (book[1] != isbn, book[0]))
+        (keep_id, stored), duplicates = books[0], books[1:]
+        for duplicate_id, _ in duplicates:
+            merge_book(keep_id, duplicate_id)
+            merged += 1
+        if stored != isbn:
+            db.session.execute(update(Book).where(Book.id == keep_id).values(isbn=isbn))
+            rewritten += 1
+
+    db.session.commit()
+    return rewritten, merged
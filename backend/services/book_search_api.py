@@ -1,75 +1,444 @@
-import requests
+import asyncio
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
 
-OPEN_LIBRARY_SEARCH_URL = "https://openlibrary.org/search.json"
+try:
+    import httpx
+except ImportError:  # httpx is only needed by the async serving mode (asgi.py)
+    httpx = None
+
+from config import settings
+from services.cache import TTLCache, SingleFlight
+from services.http import shared_session
+from services.metrics import EXTERNAL_CALL_DURATION, EXTERNAL_DEGRADED
+from services.resilience import CircuitBreaker, LatencyTracker
+
+OPEN_LIBRARY_SEARCH_URL = settings.OPEN_LIBRARY_SEARCH_URL
+OPEN_LIBRARY_BASE_URL = OPEN_LIBRARY_SEARCH_URL.rsplit('/', 1)[0]
 OPEN_LIBRARY_COVER_URL = "https://covers.openlibrary.org/b/"
 
+SERVICE = "openlibrary_search"
+
 logger = logging.getLogger(__name__)
 
+
+def http_session():
+    # Shared across requests so that connections to Open Library are kept alive
+    return shared_session("openlibrary", pool_maxsize=settings.EXTERNAL_SEARCH_POOL_SIZE, pool_connections=1)
+
+
+# Entries are (fetched_at, results); they stay fresh for EXTERNAL_SEARCH_CACHE_TTL and are kept
+# until EXTERNAL_SEARCH_STALE_TTL as a fallback for when Open Library is unhealthy
+_search_cache = TTLCache(maxsize=settings.EXTERNAL_SEARCH_CACHE_SIZE,
+                         ttl=max(settings.EXTERNAL_SEARCH_STALE_TTL, settings.EXTERNAL_SEARCH_CACHE_TTL))
+_search_flight = SingleFlight()
+
+_breaker = CircuitBreaker(settings.EXTERNAL_BREAKER_FAILURES, settings.EXTERNAL_BREAKER_RESET_SECONDS)
+_latency = LatencyTracker()
+# Upstream attempts when hedging, sized so first attempts from every fan-out thread never queue;
+# refreshes of stale entries get their own pool since they wait on those attempts
+_upstream_pool = ThreadPoolExecutor(max_workers=settings.SEARCH_FANOUT_WORKERS + settings.EXTERNAL_SEARCH_POOL_SIZE,
+                                    thread_name_prefix="openlibrary")
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="openlibrary-refresh")
+
+# Async serving mode: one client per process, and in-flight upstream calls keyed like the cache
+_async_client = None
+_async_slots = None
+_async_flights = {}
+
+
+class UpstreamUnavailable(Exception):
+    """Open Library is failing and there is nothing cached for the query, not even stale.
+
+    Also raised by the fetches when the circuit breaker refuses the call (open,
+    or half-open with its probe already out); the search functions serve a
+    stale entry instead when they have one.
+    """
+
+
+def _cache_key(query: str, limit: int):
+    return (" ".join(query.lower().split()), limit)
+
+
+def _cached(key):
+    """Return (results, fresh) for a cached query, or (None, False)."""
+    entry = _search_cache.get(key)
+    if entry is None:
+        return None, False
+    fetched_at, results = entry
+    return results, time.monotonic() - fetched_at < settings.EXTERNAL_SEARCH_CACHE_TTL
+
+
+def _store(key, results):
+    _search_cache.set(key, (time.monotonic(), results))
+
+
+def _serve_stale(results, reason):
+    EXTERNAL_DEGRADED.inc(service=SERVICE, reason=reason)
+    return results
+
+
+def _adaptive_timeout():
+    """Timeout for the next attempt, derived from recent latency and capped at EXTERNAL_SEARCH_TIMEOUT."""
+    observed = _latency.percentile(settings.EXTERNAL_TIMEOUT_PERCENTILE)
+    # A half-open probe gets the full timeout, so an upstream that recovered but got slower
+    # can still succeed and move the percentiles up
+    if observed is None or _breaker.state == CircuitBreaker.HALF_OPEN:
+        return settings.EXTERNAL_SEARCH_TIMEOUT
+    return min(settings.EXTERNAL_SEARCH_TIMEOUT,
+               max(settings.EXTERNAL_TIMEOUT_MIN, observed * settings.EXTERNAL_TIMEOUT_MULTIPLIER))
+
+
+def _hedge_delay():
+    if not settings.EXTERNAL_HEDGE_PERCENTILE:
+        return None
+    return _latency.percentile(settings.EXTERNAL_HEDGE_PERCENTILE)
+
+
 def search_books_external(query: str, limit: int = 10):
+    """Search Open Library, serving repeat queries from an in-process cache.
+
+    Concurrent misses for the same normalized query are coalesced into a single
+    upstream request. While the circuit breaker is not closed, expired entries
+    are served stale and refreshed in the background; a failed fetch also falls
+    back to a stale entry. Failed lookups return None and are not cached, and
+    UpstreamUnavailable is raised once the breaker has opened or refuses the call.
+    """
     if not query:
         return []
 
-    params = {
-        "q": query,
-        "limit": limit,
-        "fields": "key,title,author_name,isbn,cover_i,first_publish_year,publisher,description,ratings_average"
-    }
-    
-    headers = {
-        "User-Agent": "StoryRoomApp/1.0 (Contact: your-email@example.com)"
-    }
+    key = _cache_key(query, limit)
+    cached, fresh = _cached(key)
+    if fresh:
+        return cached
+    if cached is not None and _breaker.state != CircuitBreaker.CLOSED:
+        _refresh_pool.submit(_search_flight.do, key, _fetch_and_cache, key, query, limit)
+        return _serve_stale(cached, "stale")
+
+    try:
+        results = _search_flight.do(key, _fetch_and_cache, key, query, limit)
+    except UpstreamUnavailable:
+        if cached is not None:
+            return _serve_stale(cached, "stale_on_error")
+        raise
+    if results is None:
+        if cached is not None:
+            return _serve_stale(cached, "stale_on_error")
+        if _breaker.state == CircuitBreaker.OPEN:
+            raise UpstreamUnavailable("Open Library circuit breaker is open")
+    return results
+
+
+def _short_circuit():
+    EXTERNAL_DEGRADED.inc(service=SERVICE, reason="short_circuit")
+    return UpstreamUnavailable("Open Library circuit breaker is not letting calls through")
+
+
+def _fetch_and_cache(key, query: str, limit: int):
+    # Another leader may have filled the cache between our miss and taking the flight
+    cached, fresh = _cached(key)
+    if fresh:
+        return cached
+
+    if not _breaker.allow():
+        raise _short_circuit()
+
+    results = _fetch_external(query, limit)
+    if results is not None:
+        _store(key, results)
+    return results
+
+
+SEARCH_FIELDS = "key,title,author_name,isbn,cover_i,first_publish_year,publisher,description,ratings_average"
+SEARCH_HEADERS = {
+    "User-Agent": "StoryRoomApp/1.0 (Contact: your-email@example.com)"
+}
+
+
+def _search_params(query: str, limit: int):
+    return {"q": query, "limit": limit, "fields": SEARCH_FIELDS}
+
+
+def _format_docs(data):
+    formatted_results = []
+    for doc in data.get("docs", []):
+        # Find the first valid ISBN (prefer 13 digits)
+        isbn = None
+        isbn_list = doc.get("isbn", [])
+        if isbn_list:
+            isbn13 = next((i for i in isbn_list if len(i) == 13), None)
+            isbn = isbn13 or isbn_list[0]
+
+        # Construct cover URL if cover ID exists
+        cover_url = None
+        cover_id = doc.get("cover_i")
+        if cover_id:
+            cover_url = f"{OPEN_LIBRARY_COVER_URL}id/{cover_id}-M.jpg" # Medium size cover
+
+        # Extract rating, round if necessary
+        raw_rating = doc.get("ratings_average")
+        public_rating = round(raw_rating, 1) if isinstance(raw_rating, (int, float)) else None
+
+        # Extract description (can be string or object)
+        desc_data = doc.get("description")
+        description = None
+        if isinstance(desc_data, str):
+            description = desc_data
+        elif isinstance(desc_data, dict) and desc_data.get("type") == "/type/text":
+            description = desc_data.get("value")
+
+        # Extract publisher (can be a list)
+        publisher = doc.get("publisher")
+
+        formatted_results.append({
+            "external_id": doc.get("key"), # Open Library work/edition key
+            "title": doc.get("title"),
+            "authors": doc.get("author_name"), # List of authors
+            "isbn": isbn, # Use the selected ISBN
+            "first_publish_year": doc.get("first_publish_year"),
+            "publisher": publisher, # Add publisher list
+            "description": description, # Add description
+            "cover_url": cover_url,
+            "public_rating": public_rating
+        })
+    return formatted_results
+
+
+
+def _record_attempt(start, outcome):
+    elapsed = time.perf_counter() - start
+    EXTERNAL_CALL_DURATION.observe(elapsed, service=SERVICE, outcome=outcome)
+    if outcome == "ok":
+        _latency.record(elapsed)
 
+
+def _search_once(query: str, limit: int, timeout: float):
+    from requests.exceptions import RequestException
+
+    start = time.perf_counter()
     try:
-        response = requests.get(OPEN_LIBRARY_SEARCH_URL, params=params, headers=headers, timeout=10)
+        response = http_session().get(OPEN_LIBRARY_SEARCH_URL, params=_search_params(query, limit),
+                                headers=SEARCH_HEADERS, timeout=timeout)
         response.raise_for_status()
+        # A body that is not JSON raises ValueError on older requests versions
         data = response.json()
+    except (RequestException, ValueError):
+        _record_attempt(start, "error")
+        raise
+    _record_attempt(start, "ok")
+    return _format_docs(data)
+
+
+def _search_hedged(query: str, limit: int, timeout: float, hedge_after: float):
+    from requests.exceptions import Timeout
+
+    first = _upstream_pool.submit(_search_once, query, limit, timeout)
+    try:
+        return first.result(timeout=hedge_after)
+    except FutureTimeoutError:
+        pass
 
-        # Format the results
-        formatted_results = []
-        for doc in data.get("docs", []):
-            # Find the first valid ISBN (prefer 13 digits)
-            isbn = None
-            isbn_list = doc.get("isbn", [])
-            if isbn_list:
-                isbn13 = next((i for i in isbn_list if len(i) == 13), None)
-                isbn = isbn13 or isbn_list[0]
-            
-            # Construct cover URL if cover ID exists
-            cover_url = None
-            cover_id = doc.get("cover_i")
-            if cover_id:
-                cover_url = f"{OPEN_LIBRARY_COVER_URL}id/{cover_id}-M.jpg" # Medium size cover
-
-            # Extract rating, round if necessary
-            raw_rating = doc.get("ratings_average")
-            public_rating = round(raw_rating, 1) if isinstance(raw_rating, (int, float)) else None
-
-            # Extract description (can be string or object)
-            desc_data = doc.get("description")
-            description = None
-            if isinstance(desc_data, str):
-                description = desc_data
-            elif isinstance(desc_data, dict) and desc_data.get("type") == "/type/text":
-                description = desc_data.get("value")
-                
-            # Extract publisher (can be a list)
-            publisher = doc.get("publisher")
-
-            formatted_results.append({
-                "external_id": doc.get("key"), # Open Library work/edition key
-                "title": doc.get("title"),
-                "authors": doc.get("author_name"), # List of authors
-                "isbn": isbn, # Use the selected ISBN
-                "first_publish_year": doc.get("first_publish_year"),
-                "publisher": publisher, # Add publisher list
-                "description": description, # Add description
-                "cover_url": cover_url,
-                "public_rating": public_rating
-            })
-        
-        return formatted_results
-
-    except requests.exceptions.RequestException as e:
+    # The first attempt is in the latency tail: race a second one and take whichever succeeds first
+    EXTERNAL_DEGRADED.inc(service=SERVICE, reason="hedge")
+    attempts = [first, _upstream_pool.submit(_search_once, query, limit, timeout)]
+    error = None
+    try:
+        for attempt in as_completed(attempts, timeout=timeout):
+            if attempt.exception() is None:
+                return attempt.result()
+            error = attempt.exception()
+    except FutureTimeoutError:
+        raise Timeout(f"Hedged Open Library search timed out after {timeout:.2f}s")
+    raise error
+
+
+def _fetch_external(query: str, limit: int):
+    from requests.exceptions import RequestException
+
+    timeout = _adaptive_timeout()
+    hedge_after = _hedge_delay()
+    try:
+        if hedge_after is not None and hedge_after < timeout:
+            results = _search_hedged(query, limit, timeout, hedge_after)
+        else:
+            results = _search_once(query, limit, timeout)
+    except (RequestException, ValueError) as e:
+        _breaker.record_failure()
         logger.error(f"Error calling Open Library API: {e}")
-        return None
\ No newline at end of file
+        return None
+    except BaseException:
+        # Anything else (a malformed payload, ...) still counts, and must release a half-open probe
+        _breaker.record_failure()
+        raise
+
+    _breaker.record_success()
+    return results
+
+
+def _get_async_client():
+    global _async_client, _async_slots
+    if _async_client is None:
+        if httpx is None:
+            raise RuntimeError("The async serving mode requires httpx")
+        max_connections = settings.ASYNC_EXTERNAL_MAX_CONNECTIONS
+        _async_client = httpx.AsyncClient(
+            headers=SEARCH_HEADERS,
+            timeout=settings.EXTERNAL_SEARCH_TIMEOUT,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        # Queue for a connection here rather than inside httpx, where time spent
+        # waiting for the pool counts against the connect timeout
+        _async_slots = asyncio.Semaphore(max_connections)
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client, _async_slots
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = _async_slots = None
+
+
+def _async_flight(key, query: str, limit: int):
+    flight = _async_flights.get(key)
+    if flight is None:
+        flight = asyncio.ensure_future(_fetch_and_cache_async(key, query, limit))
+        _async_flights[key] = flight
+        flight.add_done_callback(lambda done: _finish_async_flight(key, done))
+    return flight
+
+
+def _finish_async_flight(key, flight):
+    _async_flights.pop(key, None)
+    if not flight.cancelled():
+        # Retrieve the error here: stale refreshes are never awaited, and a short circuit is expected there
+        flight.exception()
+
+
+async def search_books_external_async(query: str, limit: int = 10):
+    """Event-loop counterpart of search_books_external, sharing its cache, breaker and fallbacks.
+
+    Concurrent misses await one upstream call. That call is shielded, so a
+    caller giving up on its deadline does not cancel it and it still warms
+    the cache.
+    """
+    if not query:
+        return []
+
+    key = _cache_key(query, limit)
+    cached, fresh = _cached(key)
+    if fresh:
+        return cached
+    if cached is not None and _breaker.state != CircuitBreaker.CLOSED:
+        _async_flight(key, query, limit)
+        return _serve_stale(cached, "stale")
+
+    try:
+        results = await asyncio.shield(_async_flight(key, query, limit))
+    except UpstreamUnavailable:
+        if cached is not None:
+            return _serve_stale(cached, "stale_on_error")
+        raise
+    if results is None:
+        if cached is not None:
+            return _serve_stale(cached, "stale_on_error")
+        if _breaker.state == CircuitBreaker.OPEN:
+            raise UpstreamUnavailable("Open Library circuit breaker is open")
+    return results
+
+
+async def _search_once_async(client, query: str, limit: int, timeout: float):
+    async with _async_slots:
+        start = time.perf_counter()
+        try:
+            response = await client.get(OPEN_LIBRARY_SEARCH_URL, params=_search_params(query, limit), timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (httpx.HTTPError, ValueError):
+            _record_attempt(start, "error")
+            raise
+    _record_attempt(start, "ok")
+    return _format_docs(data)
+
+
+async def _search_hedged_async(client, query: str, limit: int, timeout: float, hedge_after: float):
+    first = asyncio.ensure_future(_search_once_async(client, query, limit, timeout))
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+
+    EXTERNAL_DEGRADED.inc(service=SERVICE, reason="hedge")
+    pending = {first, asyncio.ensure_future(_search_once_async(client, query, limit, timeout))}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    return attempt.result()
+                error = attempt.exception()
+    finally:
+        for attempt in pending:
+            attempt.cancel()
+    raise error
+
+
+async def _fetch_and_cache_async(key, query: str, limit: int):
+    cached, fresh = _cached(key)
+    if fresh:
+        return cached
+
+    # Before allow(): raising after it would leave a half-open probe claimed for good
+    client = _get_async_client()
+    if not _breaker.allow():
+        raise _short_circuit()
+
+    timeout = _adaptive_timeout()
+    hedge_after = _hedge_delay()
+    try:
+        if hedge_after is not None and hedge_after < timeout:
+            results = await _search_hedged_async(client, query, limit, timeout, hedge_after)
+        else:
+            results = await _search_once_async(client, query, limit, timeout)
+    except (httpx.HTTPError, ValueError) as e:
+        _breaker.record_failure()
+        logger.error(f"Error calling Open Library API: {e!r}")
+        return None
+    except BaseException:
+        # Includes cancellation: a half-open probe must not stay claimed forever
+        _breaker.record_failure()
+        raise
+
+    _breaker.record_success()
+    _store(key, results)
+    return results
+
+
+def fetch_work_description(external_id: str):
+    """Fetch the description for an Open Library work/edition key (e.g. '/works/OL45804W').
+
+    Search results do not include descriptions, so the enrichment worker asks
+    for them separately. Returns None when there is none or the call fails.
+    """
+    if not external_id or not external_id.startswith('/'):
+        return None
+
+    from requests.exceptions import RequestException
+
+    start = time.perf_counter()
+    try:
+        response = http_session().get(f"{OPEN_LIBRARY_BASE_URL}{external_id}.json", timeout=settings.EXTERNAL_SEARCH_TIMEOUT)
+        response.raise_for_status()
+        desc_data = response.json().get("description")
+        EXTERNAL_CALL_DURATION.observe(time.perf_counter() - start, service="openlibrary_works", outcome="ok")
+    except (RequestException, ValueError) as e:
+        EXTERNAL_CALL_DURATION.observe(time.perf_counter() - start, service="openlibrary_works", outcome="error")
+        logger.warning(f"Error fetching Open Library work {external_id}: {e}")
+        return None
+
+    if isinstance(desc_data, str):
+        return desc_data
+    if isinstance(desc_data, dict):
+        return desc_data.get("value")
+    return None
@@ -0,0 +1,271 @@
+import bisect
+import heapq
+import logging
+import re
+import threading
+from collections import defaultdict
+
+from sqlalchemy import event, func, or_, select, text
+
+from models import db, Book, book_search_vector, SEARCH_TS_CONFIG
+from services.serializers import BOOK_CARD_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Matches on title count for more than matches on author when ranking
+TITLE_WEIGHT = 2
+AUTHOR_WEIGHT = 1
+
+
+def tokenize(value):
+    if not value:
+        return []
+    return _TOKEN_RE.findall(value.lower())
+
+
+class BookTokenIndex:
+    """In-process inverted index over book title and author tokens.
+
+    Tokens are kept in a sorted list so that prefix lookups ("dun" -> "dune")
+    are a bisect rather than a scan. It serves type-ahead suggestions, and local
+    search where PostgreSQL full-text search is not available (SQLite in
+    development). Each process holds its own copy, so it is only kept current
+    for books written by the same process.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(dict)  # token -> {book_id: weight}
+        self._tokens = []                   # sorted distinct tokens
+        self._docs = {}                     # book_id -> (tokens, title, author)
+        self._lock = threading.RLock()
+        self.loaded = False
+
+    def load(self, rows):
+        with self._lock:
+            self._postings.clear()
+            self._docs.clear()
+            for book_id, title, author in rows:
+                self._add(book_id, title, author)
+            self._tokens = sorted(self._postings)
+            self.loaded = True
+
+    def add(self, book_id, title, author):
+        with self._lock:
+            self._remove(book_id)
+            for token in self._add(book_id, title, author):
+                i = bisect.bisect_left(self._tokens, token)
+                if i == len(self._tokens) or self._tokens[i] != token:
+                    self._tokens.insert(i, token)
+
+    def remove(self, book_id):
+        with self._lock:
+            self._remove(book_id)
+
+    def _add(self, book_id, title, author):
+        weights = defaultdict(int)
+        for token in tokenize(title):
+            weights[token] = max(weights[token], TITLE_WEIGHT)
+        for token in tokenize(author):
+            weights[token] = max(weights[token], AUTHOR_WEIGHT)
+        for token, weight in weights.items():
+            self._postings[token][book_id] = weight
+        self._docs[book_id] = (tuple(weights), title, author)
+        return weights
+
+    def _remove(self, book_id):
+        tokens = self._docs.pop(book_id, ((),))[0]
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(book_id, None)
+            if not postings:
+                del self._postings[token]
+                i = bisect.bisect_left(self._tokens, token)
+                if i < len(self._tokens) and self._tokens[i] == token:
+                    del self._tokens[i]
+
+    def _prefix_matches(self, prefix):
+        i = bisect.bisect_left(self._tokens, prefix)
+        while i < len(self._tokens) and self._tokens[i].startswith(prefix):
+            yield self._tokens[i]
+            i += 1
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _token_scores(self, token, max_candidates=None, within=None):
+        """Best score per book over every indexed token `token` prefixes, limited to `within` when given.
+
+        With `max_candidates`, only the best that many books are kept. The
+        exact token is visited first and no later (prefix) match scores above
+        TITLE_WEIGHT, so the scan stops once that many books have reached it.
+        """
+        token_scores = {}
+        settled = 0  # books no later match can outrank
+        for match in self._prefix_matches(token):
+            if max_candidates and settled >= max_candidates:
+                break
+            # Exact token matches outrank prefix matches
+            bonus = 1 if match == token else 0
+            for book_id, weight in self._postings[match].items():
+                if within is not None and book_id not in within:
+                    continue
+                previous = token_scores.get(book_id, 0)
+                score = weight + bonus
+                if score > previous:
+                    token_scores[book_id] = score
+                    settled += score >= TITLE_WEIGHT > previous
+        if max_candidates and len(token_scores) > max_candidates:
+            token_scores = dict(heapq.nsmallest(max_candidates, token_scores.items(),
+                                                key=lambda item: (-item[1], item[0])))
+        return token_scores
+
+    def search(self, query, limit, max_candidates=None):
+        """Return up to `limit` book ids matching every query token (by prefix), best first.
+
+        `max_candidates` bounds the work for very short prefixes: each token
+        keeps its best that many books, and later tokens only score books the
+        earlier ones kept.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            scores = None
+            for token in tokens:
+                token_scores = self._token_scores(token, max_candidates, scores)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {book_id: scores[book_id] + s for book_id, s in token_scores.items()}
+                if not scores:
+                    return []
+
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [book_id for book_id, _ in ranked]
+
+    def suggest(self, query, limit, max_candidates=1000):
+        """Type-ahead matches as dicts with book_id, title and author, served entirely from memory."""
+        suggestions = []
+        for book_id in self.search(query, limit, max_candidates):
+            doc = self._docs.get(book_id)
+            if doc is not None:
+                suggestions.append({"book_id": book_id, "title": doc[1], "author": doc[2]})
+        return suggestions
+
+
+_local_index = BookTokenIndex()
+_local_index_lock = threading.Lock()
+
+
+def ensure_local_index():
+    """Build the in-process index from the books table if this process has not yet."""
+    if _local_index.loaded:
+        return _local_index
+    with _local_index_lock:
+        if not _local_index.loaded:
+            rows = db.session.query(Book.id, Book.title, Book.author).yield_per(5000)
+            _local_index.load(rows)
+            logger.info(f"Built in-process book search index ({len(_local_index)} books)")
+    return _local_index
+
+
+@event.listens_for(Book, 'after_insert')
+@event.listens_for(Book, 'after_update')
+def _index_book(mapper, connection, target):
+    if _local_index.loaded:
+        _local_index.add(target.id, target.title, target.author)
+
+
+@event.listens_for(Book, 'after_delete')
+def _unindex_book(mapper, connection, target):
+    if _local_index.loaded:
+        _local_index.remove(target.id)
+
+
+def index_books(rows):
+    """Add (id, title, author) rows written with Core inserts, which bypass the mapper events."""
+    if _local_index.loaded:
+        for book_id, title, author in rows:
+            _local_index.add(book_id, title, author)
+
+
+def _postgresql_search_stmt(query, limit):
+    pattern = f"%{query}%"
+    filters = [Book.title.ilike(pattern), Book.author.ilike(pattern)]
+    order_by = []
+
+    tokens = tokenize(query)
+    if tokens:
+        ts_query = func.to_tsquery(SEARCH_TS_CONFIG, " & ".join(f"{token}:*" for token in tokens))
+        vector = book_search_vector(Book.title, Book.author)
+        filters.insert(0, vector.op('@@')(ts_query))
+        order_by.append(func.ts_rank(vector, ts_query).desc())
+
+    order_by.append(func.greatest(func.similarity(Book.title, query),
+                                  func.similarity(Book.author, query)).desc())
+    return select(*BOOK_CARD_COLUMNS).where(or_(*filters)).order_by(*order_by, Book.id).limit(limit)
+
+
+def _search_postgresql(query, limit):
+    return db.session.execute(_postgresql_search_stmt(query, limit)).all()
+
+
+def _in_index_order(book_ids, books):
+    books = {book.id: book for book in books}
+    # Rows deleted or rolled back since they were indexed simply drop out here
+    return [books[book_id] for book_id in book_ids if book_id in books]
+
+
+def _search_in_process(query, limit):
+    book_ids = ensure_local_index().search(query, limit)
+    if not book_ids:
+        return []
+    rows = db.session.execute(select(*BOOK_CARD_COLUMNS).where(Book.id.in_(book_ids))).all()
+    return _in_index_order(book_ids, rows)
+
+
+def suggest_books(query: str, limit: int = 10):
+    """Prefix suggestions over local titles and authors; never touches the database once built."""
+    return ensure_local_index().suggest(query, limit)
+
+
+def search_local_books(query: str, limit: int = 20):
+    """Relevance-ranked search over the local `books` table, as BOOK_CARD_COLUMNS rows.
+
+    PostgreSQL uses the tsvector and trigram GIN indexes declared on Book;
+    other databases fall back to the in-process token index.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return _search_postgresql(query, limit)
+    return _search_in_process(query, limit)
+
+
+async def search_local_books_async(session, query: str, limit: int = 20):
+    """search_local_books on an AsyncSession, for the async serving mode.
+
+    Off PostgreSQL the in-process index must already be built (asgi.py does so at startup).
+    """
+    if session.bind.dialect.name == 'postgresql':
+        return (await session.execute(_postgresql_search_stmt(query, limit))).all()
+
+    book_ids = _local_index.search(query, limit)
+    if not book_ids:
+        return []
+    rows = (await session.execute(select(*BOOK_CARD_COLUMNS).where(Book.id.in_(book_ids)))).all()
+    return _in_index_order(book_ids, rows)
+
+
+def ensure_search_indexes():
+    """Create the pg_trgm extension and search indexes on an existing PostgreSQL database."""
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    with db.engine.begin() as connection:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for index in Book.__table__.indexes:
+            index.create(connection, checkfirst=True)
+    return True
@@ -0,0 +1,247 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, func, or_, update
+
+from config import settings
+from models import db, Book, EnrichmentJob
+from services.book_search_api import fetch_work_description
+from services.book_search_index import index_books
+from services.cache import TTLCache
+from services.isbn import canonical_isbn
+from services.upsert import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+# Keys this process enqueued recently, so hot queries do not re-write the same jobs
+_recently_enqueued = TTLCache(maxsize=50000, ttl=3600)
+
+_queue_depth = {"value": 0, "checked_at": 0.0}
+_queue_depth_lock = threading.Lock()
+QUEUE_DEPTH_CHECK_INTERVAL = 10.0
+
+_books = Book.__table__
+
+
+class TokenBucket:
+    """Blocking token bucket: acquire() waits until a token is available."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _dedupe_key(hit):
+    isbn = canonical_isbn(hit.get("isbn"))
+    return hit.get("external_id") or (f"isbn:{isbn}" if isbn else None)
+
+
+def _queue_is_full():
+    now = time.monotonic()
+    with _queue_depth_lock:
+        if now - _queue_depth["checked_at"] >= QUEUE_DEPTH_CHECK_INTERVAL:
+            _queue_depth["value"] = db.session.query(func.count(EnrichmentJob.id)).scalar()
+            _queue_depth["checked_at"] = now
+        return _queue_depth["value"] >= settings.ENRICHMENT_MAX_QUEUE
+
+
+def enqueue_hits(hits):
+    """Queue external search hits for persistence. Never blocks on a full queue: hits are dropped.
+
+    Returns the number of hits submitted. Must run inside an app context.
+    """
+    jobs = {}
+    for hit in hits or ():
+        key = _dedupe_key(hit)
+        if key and hit.get("title") and _recently_enqueued.get(key) is None:
+            jobs[key] = hit
+    if not jobs:
+        return 0
+
+    if _queue_is_full():
+        logger.warning(f"Enrichment queue is full, dropping {len(jobs)} hits")
+        return 0
+
+    stmt = dialect_insert(EnrichmentJob.__table__).values([
+        {"dedupe_key": key[:60], "payload": hit, "attempts": 0} for key, hit in jobs.items()
+    ]).on_conflict_do_nothing(index_elements=['dedupe_key'])
+    db.session.execute(stmt)
+    db.session.commit()
+
+    for key in jobs:
+        _recently_enqueued.set(key, True)
+    with _queue_depth_lock:
+        _queue_depth["value"] += len(jobs)
+    return len(jobs)
+
+
+def enqueue_hits_in_background(app, hits):
+    """Entry point for thread pools: enqueue with its own app context and swallow errors."""
+    with app.app_context():
+        try:
+            enqueue_hits(hits)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error enqueueing enrichment jobs: {e}")
+
+
+def _book_values(hit):
+    authors = hit.get("authors") or []
+    publishers = hit.get("publisher") or []
+    if isinstance(publishers, str):
+        publishers = [publishers]
+    author_str = ', '.join(authors) if authors else None
+    return {
+        "title": (hit.get("title") or '')[:200],
+        "author": author_str[:150] if author_str else None,
+        "isbn": canonical_isbn(hit.get("isbn")),
+        "image_url": hit.get("cover_url"),
+        "public_rating": hit.get("public_rating"),
+        "external_id": hit.get("external_id"),
+        "first_publish_year": hit.get("first_publish_year"),
+        "publisher": publishers[0][:200] if publishers else None,
+        "description": hit.get("description"),
+    }
+
+
+def _persist(rows):
+    """Fill metadata on books we already have and batch-insert the rest.
+
+    Returns (updated, inserted) counts.
+    """
+    isbns = {row["isbn"] for row in rows if row["isbn"]}
+    external_ids = {row["external_id"] for row in rows if row["external_id"]}
+    existing_by_isbn, existing_by_external = {}, {}
+    if isbns or external_ids:
+        for book_id, isbn, external_id in db.session.query(Book.id, Book.isbn, Book.external_id).filter(
+                or_(Book.isbn.in_(isbns), Book.external_id.in_(external_ids))):
+            if isbn:
+                existing_by_isbn[isbn] = book_id
+            if external_id:
+                existing_by_external[external_id] = book_id
+
+    updates, inserts = {}, {}
+    claimed_isbns, claimed_external_ids = set(), set()
+    for row in rows:
+        book_id = existing_by_external.get(row["external_id"]) or existing_by_isbn.get(row["isbn"])
+        if book_id:
+            updates[book_id] = row
+        elif row["isbn"] not in claimed_isbns and row["external_id"] not in claimed_external_ids:
+            # Two hits for the same edition in one batch collapse into one new book
+            inserts[row["external_id"] or row["isbn"]] = row
+            if row["isbn"]:
+                claimed_isbns.add(row["isbn"])
+            if row["external_id"]:
+                claimed_external_ids.add(row["external_id"])
+
+    if updates:
+        # Only fill gaps; values users or earlier runs already stored win
+        columns = ("external_id", "first_publish_year", "publisher", "description", "public_rating", "image_url")
+        stmt = update(_books).where(_books.c.id == bindparam("b_id")).values({
+            column: func.coalesce(_books.c[column], bindparam(f"b_{column}")) for column in columns
+        })
+        db.session.execute(stmt, [
+            dict({f"b_{column}": row[column] for column in columns}, b_id=book_id)
+            for book_id, row in updates.items()
+        ])
+
+    inserted = []
+    if inserts:
+        # A book added meanwhile (e.g. by /library/add) keeps its row; RETURNING skips it
+        result = db.session.execute(
+            dialect_insert(_books).values(list(inserts.values()))
+            .on_conflict_do_nothing(index_elements=['isbn'])
+            .returning(_books.c.id, _books.c.title, _books.c.author)
+        )
+        inserted = result.all()
+        index_books(inserted)
+
+    return len(updates), len(inserted)
+
+
+def _claim_jobs(batch_size):
+    # Claimed jobs are leased rather than deleted, so no transaction stays open while
+    # descriptions are fetched at the upstream rate limit, and a worker that dies mid-batch
+    # only delays its jobs until the lease expires
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    expired = now - timedelta(seconds=settings.ENRICHMENT_CLAIM_TIMEOUT)
+    jobs = db.session.query(EnrichmentJob.id, EnrichmentJob.dedupe_key, EnrichmentJob.payload, EnrichmentJob.attempts) \
+        .filter(or_(EnrichmentJob.claimed_at.is_(None), EnrichmentJob.claimed_at < expired)) \
+        .order_by(EnrichmentJob.id).limit(batch_size).with_for_update(skip_locked=True).all()
+    if jobs:
+        EnrichmentJob.query.filter(EnrichmentJob.id.in_([job.id for job in jobs])) \
+            .update({"claimed_at": now}, synchronize_session=False)
+    db.session.commit()
+    return jobs
+
+
+def _delete_jobs(jobs):
+    EnrichmentJob.query.filter(EnrichmentJob.id.in_([job.id for job in jobs])).delete(synchronize_session=False)
+
+
+def _requeue(jobs):
+    retry = [job for job in jobs if job.attempts + 1 < settings.ENRICHMENT_MAX_ATTEMPTS]
+    if retry:
+        EnrichmentJob.query.filter(EnrichmentJob.id.in_([job.id for job in retry])).update(
+            {"attempts": EnrichmentJob.attempts + 1, "claimed_at": None}, synchronize_session=False)
+    _delete_jobs([job for job in jobs if job.attempts + 1 >= settings.ENRICHMENT_MAX_ATTEMPTS])
+    db.session.commit()
+    logger.warning(f"Requeued {len(retry)} of {len(jobs)} enrichment jobs")
+
+
+def process_batch(batch_size, bucket=None):
+    """Claim up to batch_size jobs and persist them into books. Returns the number of jobs handled."""
+    jobs = _claim_jobs(batch_size)
+    if not jobs:
+        return 0
+
+    rows = []
+    for job in jobs:
+        row = _book_values(job.payload)
+        if settings.ENRICHMENT_FETCH_DESCRIPTIONS and not row["description"] and row["external_id"]:
+            if bucket is not None:
+                bucket.acquire()
+            row["description"] = fetch_work_description(row["external_id"])
+        rows.append(row)
+
+    try:
+        updated, inserted = _persist(rows)
+        # In the same transaction: the jobs are gone exactly when their books are stored
+        _delete_jobs(jobs)
+        db.session.commit()
+        logger.info(f"Enrichment batch: {inserted} books inserted, {updated} updated")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Enrichment batch failed: {e}")
+        _requeue(jobs)
+    return len(jobs)
+
+
+def run_worker(batch_size=None, once=False):
+    """Drain the enrichment queue, sleeping while it is empty. Must run inside an app context."""
+    batch_size = batch_size or settings.ENRICHMENT_BATCH_SIZE
+    bucket = TokenBucket(settings.ENRICHMENT_UPSTREAM_RPS)
+    logger.info(f"Enrichment worker started (batch size {batch_size}, {settings.ENRICHMENT_UPSTREAM_RPS} upstream req/s)")
+    while True:
+        handled = process_batch(batch_size, bucket)
+        if once and not handled:
+            return
+        if not handled:
+            time.sleep(settings.ENRICHMENT_POLL_INTERVAL)
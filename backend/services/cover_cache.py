@@ -0,0 +1,274 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+from urllib.parse import urlparse
+
+from config import settings
+from services.book_search_api import OPEN_LIBRARY_COVER_URL
+from services.cache import SingleFlight
+from services.http import shared_session
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it each size is fetched from Open Library directly
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Thumbnail widths generated locally when Pillow is available; the keys match Open Library's size suffixes
+COVER_SIZES = {'S': 90, 'M': 180, 'L': 360}
+DEFAULT_COVER_SIZE = 'M'
+
+_OL_COVER_RE = re.compile(r'^https?://covers\.openlibrary\.org/b/id/(\d+)-[SML]\.jpg')
+_PROXY_OL_RE = re.compile(r'/api/covers/ol/(\d+)')
+
+_fetch_flight = SingleFlight()
+
+
+def http_session():
+    return shared_session("covers", pool_maxsize=settings.EXTERNAL_SEARCH_POOL_SIZE)
+
+
+class CoverNotFound(Exception):
+    pass
+
+
+class CoverTooLarge(Exception):
+    pass
+
+
+def sniff_mimetype(data):
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data.startswith(b'GIF8'):
+        return 'image/gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+class ContentAddressedCache:
+    """Disk cache storing blobs under their SHA-256, with a small key -> digest index.
+
+    Identical images (the same cover reached through different keys) share one
+    blob. When the blobs exceed `max_bytes`, the least recently served are
+    deleted along with the index entries pointing at them. A blob can still
+    vanish between lookup() and reading it; callers treat that as a miss.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._blobs = os.path.join(root, 'blobs')
+        self._keys = os.path.join(root, 'keys')
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def _key_path(self, key):
+        return os.path.join(self._keys, hashlib.sha1(key.encode()).hexdigest())
+
+    def _blob_path(self, digest):
+        return os.path.join(self._blobs, digest[:2], digest)
+
+    @staticmethod
+    def _write_atomic(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def lookup(self, key):
+        """Return (path, digest) for a cached key, or None."""
+        key_path = self._key_path(key)
+        try:
+            with open(key_path) as f:
+                digest = f.read().strip()
+        except (FileNotFoundError, ValueError):
+            return None
+        path = self._blob_path(digest)
+        try:
+            os.utime(path)  # mtime doubles as last-served time for eviction
+        except FileNotFoundError:
+            self._remove(key_path)
+            return None
+        return path, digest
+
+    def store(self, key, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            self._write_atomic(path, data)
+            self._account(len(data))
+        self._write_atomic(self._key_path(key), digest.encode())
+        return path, digest
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _drop_keys(self, digests):
+        """Delete the index entries pointing at `digests`."""
+        removed = 0
+        if not digests or not os.path.isdir(self._keys):
+            return removed
+        for entry in os.scandir(self._keys):
+            try:
+                with open(entry.path) as f:
+                    if f.read().strip() not in digests:
+                        continue
+            except (FileNotFoundError, ValueError):
+                continue
+            removed += self._remove(entry.path)
+        return removed
+
+    def _scan(self):
+        blobs = []
+        for dirpath, _, filenames in os.walk(self._blobs):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, path))
+        return blobs
+
+    def _account(self, added):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._total_bytes += added
+            if self._total_bytes <= self.max_bytes:
+                return
+            # Evict down to 90% so we are not scanning on every store near the limit
+            target = self.max_bytes * 0.9
+            evicted = set()
+            for _, size, path in sorted(self._scan()):
+                if self._total_bytes <= target:
+                    break
+                if self._remove(path):
+                    self._total_bytes -= size
+                    evicted.add(os.path.basename(path))
+            keys = self._drop_keys(evicted)
+            logger.info(f"Cover cache evicted {len(evicted)} blobs and {keys} keys, down to {self._total_bytes} bytes")
+
+
+cover_cache = ContentAddressedCache(settings.COVER_CACHE_DIR, settings.COVER_CACHE_MAX_BYTES)
+
+
+def _download(url):
+    limit = settings.COVER_MAX_BYTES
+    # Streamed so an oversized body is dropped after COVER_MAX_BYTES instead of being read into memory
+    with http_session().get(url, timeout=settings.EXTERNAL_SEARCH_TIMEOUT, stream=True) as response:
+        if response.status_code == 404:
+            raise CoverNotFound(url)
+        response.raise_for_status()
+        declared = response.headers.get('Content-Length', '')
+        if declared.isdigit() and int(declared) > limit:
+            raise CoverTooLarge(f"{url} is {declared} bytes, over COVER_MAX_BYTES ({limit})")
+        # Content-Length can be missing or wrong, so count what is actually read too
+        data = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            data += chunk
+            if len(data) > limit:
+                raise CoverTooLarge(f"{url} is over COVER_MAX_BYTES ({limit})")
+        return bytes(data)
+
+
+def _resize(data, width):
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert('RGB')
+        if image.width > width:
+            image.thumbnail((width, width * 4))
+        out = io.BytesIO()
+        image.save(out, format='JPEG', quality=85, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def _fill(key_prefix, source_url, size):
+    """Download once and store the variants under key_prefix: all sizes with Pillow, else just `size`."""
+    if cover_cache.lookup(f"{key_prefix}:{size}"):
+        return
+
+    original = _download(source_url)
+    if Image is None:
+        cover_cache.store(f"{key_prefix}:{size}", original)
+        return
+
+    for variant, width in COVER_SIZES.items():
+        try:
+            cover_cache.store(f"{key_prefix}:{variant}", _resize(original, width))
+        except OSError as e:  # not an image Pillow can read; serve it untouched
+            logger.warning(f"Could not resize cover {source_url}: {e}")
+            cover_cache.store(f"{key_prefix}:{variant}", original)
+
+
+def _get_variant(key_prefix, source_url, size, on_miss=None):
+    key = f"{key_prefix}:{size}"
+    cached = cover_cache.lookup(key)
+    if cached:
+        return cached
+    if on_miss is not None:
+        on_miss()
+    # Concurrent misses share one download; with Pillow one download fills every size
+    flight_key = key_prefix if Image is not None else key
+    _fetch_flight.do(flight_key, _fill, key_prefix, source_url, size)
+    cached = cover_cache.lookup(key)
+    if cached is None:
+        raise CoverNotFound(source_url)
+    return cached
+
+
+def get_openlibrary_cover(cover_id, size=DEFAULT_COVER_SIZE, on_miss=None):
+    """Return (path, digest) for an Open Library cover id. `on_miss` is called before fetching upstream."""
+    # With Pillow, fetch the large image and derive every size from it
+    source_size = 'L' if Image is not None else size
+    source_url = f"{OPEN_LIBRARY_COVER_URL}id/{cover_id}-{source_size}.jpg?default=false"
+    return _get_variant(f"ol:{cover_id}", source_url, size, on_miss)
+
+
+def is_proxyable(url):
+    # Book.image_url is user-supplied, so only fetch from hosts we trust
+    parsed = urlparse(url or '')
+    return parsed.scheme in ('http', 'https') and parsed.hostname in settings.COVER_PROXY_ALLOWED_HOSTS
+
+
+def get_url_cover(url, size=DEFAULT_COVER_SIZE, on_miss=None):
+    """Return (path, digest) for an image URL on an allowed host (e.g. a Book.image_url)."""
+    ol_match = _OL_COVER_RE.match(url)
+    if ol_match:
+        return get_openlibrary_cover(int(ol_match.group(1)), size, on_miss)
+    if not is_proxyable(url):
+        raise CoverNotFound(url)
+    return _get_variant(f"url:{hashlib.sha1(url.encode()).hexdigest()}", url, size, on_miss)
+
+
+def proxy_cover_url(url_root, image_url, book_id=None, size=DEFAULT_COVER_SIZE):
+    """Rewrite an upstream cover URL to the cover proxy. url_root is the request's host URL."""
+    if not image_url or not settings.COVER_PROXY_ENABLED:
+        return image_url
+    ol_match = _OL_COVER_RE.match(image_url)
+    if ol_match:
+        return f"{url_root}api/covers/ol/{ol_match.group(1)}?size={size}"
+    if book_id is not None and is_proxyable(image_url):
+        return f"{url_root}api/covers/book/{book_id}?size={size}"
+    return image_url
+
+
+def upstream_cover_url(url):
+    """Inverse of proxy_cover_url for Open Library covers, so proxy URLs are never stored on books."""
+    if url:
+        match = _PROXY_OL_RE.search(url)
+        if match:
+            return f"{OPEN_LIBRARY_COVER_URL}id/{match.group(1)}-M.jpg"
+    return url
@@ -0,0 +1,103 @@
+from functools import wraps
+
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.sql import Select
+
+from config import settings
+
+# SQLALCHEMY_BINDS key of the read replica engine
+REPLICA_BIND_KEY = 'replica'
+
+
+def engine_options(url):
+    """SQLAlchemy engine/pool options from Settings. SQLite (development) keeps Flask-SQLAlchemy's defaults."""
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        return {}
+    options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if backend == 'postgresql' and settings.DB_STATEMENT_TIMEOUT_MS:
+        # Server-side default for every connection; routes can tighten it with @statement_timeout
+        options["connect_args"] = {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
+def configure_app(app):
+    """Set the engine options, and the replica bind when DATABASE_REPLICA_URL is set."""
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(settings.DATABASE_URL)
+    if settings.DATABASE_REPLICA_URL:
+        app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND_KEY: {"url": settings.DATABASE_REPLICA_URL, **engine_options(settings.DATABASE_REPLICA_URL)}
+        }
+
+    if not event.contains(Engine, 'begin', _apply_statement_timeout):
+        event.listen(Engine, 'begin', _apply_statement_timeout)
+
+
+def _routes_to_replica(clause):
+    if not has_request_context() or not g.get('_db_use_replica'):
+        return False
+    # Only plain SELECTs; SELECT ... FOR UPDATE needs the primary
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """db.session that sends SELECTs to the read replica inside views marked @use_read_replica.
+
+    Flushes, DML and locking reads always go to the primary, as does everything
+    when no replica is configured.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _routes_to_replica(clause):
+            replica = self._db.engines.get(REPLICA_BIND_KEY)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_read_replica(view):
+    """Serve the view's reads from the replica bind (when configured). For read-only views."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g._db_use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def statement_timeout(milliseconds):
+    """Cap every statement the view runs on PostgreSQL at `milliseconds` (0 = leave the default)."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g._db_statement_timeout_ms = milliseconds
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _apply_statement_timeout(conn):
+    if not has_request_context():
+        return
+    set_local_statement_timeout(conn, g.get('_db_statement_timeout_ms'))
+
+
+def set_local_statement_timeout(conn, milliseconds):
+    """Cap the transaction `conn` is beginning at `milliseconds` on PostgreSQL. For 'begin' listeners."""
+    if not milliseconds or conn.dialect.name != 'postgresql':
+        return
+    # SET LOCAL lasts until the transaction ends, so the pooled connection goes back unchanged.
+    # Issued on the DBAPI cursor: the transaction Connection.begin() is starting is not usable yet.
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"SET LOCAL statement_timeout = {int(milliseconds)}")
+    finally:
+        cursor.close()
@@ -0,0 +1,34 @@
+import threading
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def shared_session(name, pool_maxsize, pool_connections=10):
+    """The keep-alive requests.Session registered under `name`, created on first use.
+
+    `requests` is imported here rather than at module import, so a worker
+    that never calls upstream does not load it at startup. warm_up() in
+    run.py creates the sessions ahead of time when preloading.
+    """
+    session = _sessions.get(name)
+    if session is None:
+        with _lock:
+            session = _sessions.get(name)
+            if session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[name] = session
+    return session
+
+
+def close_sessions():
+    """Drop pooled upstream connections, e.g. in a freshly forked worker that must not share sockets."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
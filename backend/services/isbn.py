@@ -0,0 +1,45 @@
+import re
+
+_ISBN_CHARS_RE = re.compile(r'[^0-9Xx]')
+
+
+def clean_isbn(value):
+    # Goodreads exports ISBNs as ="0439023483"
+    if not value:
+        return None
+    isbn = _ISBN_CHARS_RE.sub('', str(value)).upper()
+    return isbn or None
+
+
+def _isbn10_is_valid(isbn):
+    if len(isbn) != 10 or not isbn[:9].isdigit() or not (isbn[9].isdigit() or isbn[9] == 'X'):
+        return False
+    total = sum((10 - i) * (10 if c == 'X' else int(c)) for i, c in enumerate(isbn))
+    return total % 11 == 0
+
+
+def _isbn13_check_digit(first12):
+    total = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def to_isbn13(value):
+    """Canonical ISBN-13 for an ISBN-10 or ISBN-13 in any formatting, or None if it is not a valid ISBN."""
+    isbn = clean_isbn(value)
+    if not isbn:
+        return None
+    if len(isbn) == 13:
+        return isbn if isbn.isdigit() and _isbn13_check_digit(isbn[:12]) == isbn[12] else None
+    if _isbn10_is_valid(isbn):
+        first12 = '978' + isbn[:9]
+        return first12 + _isbn13_check_digit(first12)
+    return None
+
+
+def canonical_isbn(value):
+    """The form ISBNs are stored and looked up in: ISBN-13 for a valid ISBN, else just cleaned.
+
+    Storing one form is what lets ON CONFLICT (isbn) and IN (...) lookups match
+    the ISBN-10 and ISBN-13 of the same edition.
+    """
+    return to_isbn13(value) or clean_isbn(value)
@@ -0,0 +1,171 @@
+import csv
+import json
+import logging
+
+from sqlalchemy import tuple_
+
+from models import db, Book
+from services.isbn import canonical_isbn
+from services.library_stats import next_library_version, previous_entries, record_entry_changes
+from services.upsert import book_upsert, dialect_insert, library_entry_upsert
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 500
+
+# Goodreads "Exclusive Shelf" values mapped onto LibraryEntry.status
+GOODREADS_SHELVES = {'to-read': 0, 'currently-reading': 1, 'read': 2}
+
+_book_columns = Book.__table__.c
+
+
+def _from_goodreads(record):
+    authors = [record.get('Author')] if record.get('Author') else []
+    authors += [a.strip() for a in (record.get('Additional Authors') or '').split(',') if a.strip()]
+    rating = record.get('My Rating')
+    return {
+        'title': record.get('Title'),
+        'authors': authors,
+        'isbn': canonical_isbn(record.get('ISBN13')) or canonical_isbn(record.get('ISBN')),
+        'status': GOODREADS_SHELVES.get((record.get('Exclusive Shelf') or '').strip(), 0),
+        # Goodreads uses 0 for "not rated"
+        'rating': rating if rating and rating != '0' else None,
+    }
+
+
+def _from_csv(record):
+    authors = record.get('authors') or record.get('author') or ''
+    return {
+        'title': record.get('title'),
+        'authors': [a.strip() for a in authors.split(';') if a.strip()],
+        'isbn': canonical_isbn(record.get('isbn')),
+        'cover_url': record.get('cover_url') or None,
+        'status': record.get('status') or 0,
+        'rating': record.get('rating') or None,
+    }
+
+
+def iter_import_records(stream, fmt):
+    """Yield (row_number, raw_dict) pairs from a CSV (generic or Goodreads) or JSON lines text stream."""
+    if fmt == 'jsonl':
+        for row_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield row_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield row_number, e
+        return
+
+    reader = csv.DictReader(stream)
+    convert = _from_goodreads if 'Exclusive Shelf' in (reader.fieldnames or []) else _from_csv
+    for row_number, record in enumerate(reader, start=1):
+        yield row_number, convert(record)
+
+
+def _resolve_books(rows):
+    """Map every row to a book id using set-based lookups, inserting the books that are missing.
+
+    Returns ({row_number: book_id}, [(id, title, author), ...] of books inserted).
+    """
+    book_ids = {}
+    # Books are stored under ISBN-13 (services.isbn.canonical_isbn), so look them up that way
+    isbn_of = {row['row']: canonical_isbn(row['isbn']) for row in rows}
+
+    isbns = {isbn for isbn in isbn_of.values() if isbn}
+    by_isbn = dict(db.session.query(Book.isbn, Book.id).filter(Book.isbn.in_(isbns))) if isbns else {}
+
+    # A row with an ISBN is that edition: when it is missing it is inserted, never matched by title
+    new_by_isbn = {}
+    unresolved = []
+    for row in rows:
+        isbn = isbn_of[row['row']]
+        if isbn in by_isbn:
+            book_ids[row['row']] = by_isbn[isbn]
+        elif isbn:
+            new_by_isbn.setdefault(isbn, row)
+        else:
+            unresolved.append(row)
+
+    # Rows without one get the same title/author fallback as the single add path
+    pairs = {(row['title'], row['author']) for row in unresolved if row['author']}
+    bare_titles = {row['title'] for row in unresolved if not row['author']}
+    by_title = {}
+    if pairs:
+        for book_id, title, author in db.session.query(Book.id, Book.title, Book.author) \
+                .filter(tuple_(Book.title, Book.author).in_(pairs)).order_by(Book.id.desc()):
+            by_title[(title, author)] = book_id
+    if bare_titles:
+        for book_id, title in db.session.query(Book.id, Book.title) \
+                .filter(Book.title.in_(bare_titles), Book.author.is_(None)).order_by(Book.id.desc()):
+            by_title[(title, None)] = book_id
+
+    new_by_title = {}
+    for row in unresolved:
+        key = (row['title'], row['author'])
+        if key in by_title:
+            book_ids[row['row']] = by_title[key]
+        else:
+            new_by_title.setdefault(key, row)
+
+    inserted = []
+    if new_by_isbn:
+        # A concurrent writer may have added the ISBN since our lookup; book_upsert keeps its row
+        stmt = book_upsert([
+            {"title": row['title'], "author": row['author'], "isbn": isbn, "image_url": row['cover_url']}
+            for isbn, row in new_by_isbn.items()
+        ])
+        for book_id, isbn, title, author in db.session.execute(stmt):
+            by_isbn[isbn] = book_id
+            inserted.append((book_id, title, author))
+
+    if new_by_title:
+        stmt = dialect_insert(Book.__table__).values([
+            {"title": title, "author": author, "isbn": None, "image_url": row['cover_url']}
+            for (title, author), row in new_by_title.items()
+        ]).returning(_book_columns.id, _book_columns.title, _book_columns.author)
+        for book_id, title, author in db.session.execute(stmt):
+            by_title[(title, author)] = book_id
+            inserted.append((book_id, title, author))
+
+    for row in rows:
+        if row['row'] not in book_ids:
+            isbn = isbn_of[row['row']]
+            book_ids[row['row']] = by_isbn[isbn] if isbn else by_title[(row['title'], row['author'])]
+
+    return book_ids, inserted
+
+
+def import_batch(user_id, rows):
+    """Upsert one batch of parsed rows for a user and commit it.
+
+    Returns (per-row results, books inserted). On a database error the batch
+    is rolled back and every row in it is reported as failed.
+    """
+    try:
+        book_ids, inserted = _resolve_books(rows)
+
+        # Version first, so the users-row lock is held before the previous state is read
+        version = next_library_version(user_id)
+        previous = previous_entries(user_id, list({book_ids[row['row']] for row in rows}))
+
+        # Later rows for the same book win, as they would with repeated /add calls
+        entries = {}
+        for row in rows:
+            entries[book_ids[row['row']]] = {
+                "user_id": user_id,
+                "book_id": book_ids[row['row']],
+                "status": row['status'],
+                "user_rating": row['rating'],
+                "version": version,
+            }
+        stored = db.session.execute(library_entry_upsert(list(entries.values()))).all()
+        record_entry_changes(user_id, previous, stored)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error importing batch for user {user_id}: {e}")
+        return [{"row": row['row'], "status": "error", "message": "Database error saving library entry"}
+                for row in rows], []
+
+    return [{"row": row['row'], "status": "imported", "book_id": book_ids[row['row']]} for row in rows], inserted
@@ -0,0 +1,129 @@
+from collections import Counter
+
+from sqlalchemy import Integer, cast, func, select, update
+
+from models import db, LibraryEntry, LibraryStat, User
+from services.recommendations import queue_similarity_refresh
+from services.upsert import dialect_insert
+
+# Names for LibraryEntry.status values
+SHELVES = {0: "want_to_read", 1: "reading", 2: "read"}
+
+_stats = LibraryStat.__table__
+
+
+def rating_halves(rating):
+    return int(round(rating * 2)) if rating is not None else 0
+
+
+def previous_entries(user_id, book_ids):
+    """{book_id: (status, user_rating)} for the user's existing entries, locked until commit.
+
+    Read before an upsert so that the counters can be moved from the old bucket to the new one,
+    and after next_library_version(): FOR UPDATE cannot lock an entry that does not exist yet,
+    but the users-row lock taken there keeps a concurrent add of the same book out until commit.
+    """
+    if not book_ids:
+        return {}
+    rows = db.session.query(LibraryEntry.book_id, LibraryEntry.status, LibraryEntry.user_rating) \
+        .filter(LibraryEntry.user_id == user_id, LibraryEntry.book_id.in_(book_ids)) \
+        .with_for_update().all()
+    return {book_id: (status, rating) for book_id, status, rating in rows}
+
+
+def next_library_version(user_id):
+    """Bump the user's library version and return it, in the caller's transaction.
+
+    Call once per library write, before the write itself, and stamp the new
+    value on every entry it touches. The users row stays locked until commit,
+    so one user's writes commit in version order.
+    """
+    return db.session.execute(
+        update(User).where(User.id == user_id)
+        .values(library_version=User.library_version + 1).returning(User.library_version)
+    ).scalar_one()
+
+
+def _apply_deltas(user_id, deltas):
+    values = [{"user_id": user_id, "status": status, "rating_halves": halves, "entry_count": delta}
+              for (status, halves), delta in deltas.items() if delta]
+    if not values:
+        return
+    stmt = dialect_insert(_stats).values(values)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['user_id', 'status', 'rating_halves'],
+        set_={"entry_count": _stats.c.entry_count + stmt.excluded.entry_count}
+    ))
+
+
+def record_entry_changes(user_id, previous, stored_rows):
+    """Adjust the user's counters for upserted entries, in the caller's transaction.
+
+    `previous` comes from previous_entries(); `stored_rows` are the
+    (id, book_id, status, user_rating) rows returned by library_entry_upsert.
+    Books whose status or rating changed are also queued for a similarity refresh.
+    """
+    deltas = Counter()
+    changed = []
+    for _, book_id, status, rating in stored_rows:
+        old = previous.get(book_id)
+        if old is not None:
+            deltas[(old[0], rating_halves(old[1]))] -= 1
+        deltas[(status, rating_halves(rating))] += 1
+        if old != (status, rating):
+            changed.append(book_id)
+    _apply_deltas(user_id, deltas)
+    queue_similarity_refresh(changed)
+
+
+def record_entry_removal(user_id, status, rating):
+    """Take a deleted entry out of the user's counters, in the caller's transaction."""
+    _apply_deltas(user_id, Counter({(status, rating_halves(rating)): -1}))
+
+
+def library_version(user_id):
+    return db.session.query(User.library_version).filter(User.id == user_id).scalar()
+
+
+def get_library_stats(user_id):
+    """Shelf counts and rating distribution for a user, read from the precomputed counters."""
+    shelves = dict.fromkeys(SHELVES.values(), 0)
+    ratings = {}
+    rated = rating_sum = 0
+    for status, halves, count in db.session.query(
+            LibraryStat.status, LibraryStat.rating_halves, LibraryStat.entry_count
+    ).filter(LibraryStat.user_id == user_id, LibraryStat.entry_count > 0):
+        shelf = SHELVES.get(status)
+        if shelf is not None:
+            shelves[shelf] += count
+        if halves:
+            rating = halves / 2
+            key = str(int(rating)) if rating.is_integer() else str(rating)
+            ratings[key] = ratings.get(key, 0) + count
+            rated += count
+            rating_sum += rating * count
+
+    return {
+        "total": sum(shelves.values()),
+        "shelves": shelves,
+        "ratings": dict(sorted(ratings.items(), key=lambda item: float(item[0]))),
+        "rated": rated,
+        "average_rating": round(rating_sum / rated, 2) if rated else None,
+    }
+
+
+def rebuild_library_stats(user_id=None):
+    """Recompute counters from library_entries with one INSERT ... SELECT, for one user or everyone."""
+    halves = func.coalesce(cast(func.round(LibraryEntry.user_rating * 2), Integer), 0)
+    counts = select(LibraryEntry.user_id, LibraryEntry.status, halves, func.count()) \
+        .group_by(LibraryEntry.user_id, LibraryEntry.status, halves)
+    delete = _stats.delete()
+    if user_id is not None:
+        counts = counts.where(LibraryEntry.user_id == user_id)
+        delete = delete.where(_stats.c.user_id == user_id)
+
+    db.session.execute(delete)
+    result = db.session.execute(
+        _stats.insert().from_select(['user_id', 'status', 'rating_halves', 'entry_count'], counts))
+    db.session.commit()
+    return result.rowcount
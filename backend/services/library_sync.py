@@ -0,0 +1,89 @@
+import base64
+import binascii
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+
+from config import settings
+from models import db, Book, LibraryEntry, LibraryTombstone
+from services.library_stats import library_version, next_library_version, record_entry_removal
+from services.recommendations import queue_similarity_refresh
+from services.serializers import LIBRARY_ENTRY_COLUMNS
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(version, issued_at=None):
+    """Opaque sync cursor: the library version the client is caught up to, and when it was issued."""
+    issued_at = int(time.time() if issued_at is None else issued_at)
+    return base64.urlsafe_b64encode(f"{version}:{issued_at}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(version, issued_at) from a cursor. Raises InvalidCursor."""
+    try:
+        version, issued_at = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return int(version), int(issued_at)
+    except (ValueError, binascii.Error, UnicodeDecodeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def cursor_expired(issued_at):
+    """Tombstones older than the retention period may be gone, so such a delta could miss deletions."""
+    return time.time() - issued_at > settings.LIBRARY_TOMBSTONE_RETENTION_DAYS * 86400
+
+
+def library_changes(user_id, since):
+    """What changed in the user's library after version `since`.
+
+    Returns (version, entries query, deleted entry ids). `version` is read
+    first and bounds both reads: writes commit in version order, so everything
+    up to it is visible, and anything newer is picked up by the next delta.
+    """
+    version = library_version(user_id)
+    entries = db.session.query(*LIBRARY_ENTRY_COLUMNS) \
+        .join(Book, LibraryEntry.book_id == Book.id) \
+        .filter(LibraryEntry.user_id == user_id, LibraryEntry.version > since, LibraryEntry.version <= version) \
+        .order_by(LibraryEntry.version, LibraryEntry.id)
+    deleted = []
+    if since:
+        # A first sync (since=0) starts from an empty cache, so it has nothing to delete
+        deleted = db.session.scalars(
+            select(LibraryTombstone.entry_id).where(
+                LibraryTombstone.user_id == user_id,
+                LibraryTombstone.version > since, LibraryTombstone.version <= version,
+            ).order_by(LibraryTombstone.version, LibraryTombstone.entry_id)
+        ).all()
+    return version, entries, deleted
+
+
+def remove_entry(user_id, entry_id):
+    """Delete one of the user's entries, leaving a tombstone and updating the counters and similarity queue. Commits.
+
+    Returns False when the user has no such entry.
+    """
+    entry = db.session.execute(
+        select(LibraryEntry.book_id, LibraryEntry.status, LibraryEntry.user_rating)
+        .where(LibraryEntry.id == entry_id, LibraryEntry.user_id == user_id).with_for_update()
+    ).first()
+    if entry is None:
+        return False
+
+    version = next_library_version(user_id)
+    db.session.execute(delete(LibraryEntry).where(LibraryEntry.id == entry_id))
+    db.session.add(LibraryTombstone(entry_id=entry_id, user_id=user_id, book_id=entry.book_id, version=version))
+    record_entry_removal(user_id, entry.status, entry.user_rating)
+    queue_similarity_refresh([entry.book_id])
+    db.session.commit()
+    return True
+
+
+def prune_tombstones():
+    """Delete tombstones past the retention period. Returns how many were removed."""
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=settings.LIBRARY_TOMBSTONE_RETENTION_DAYS)
+    result = db.session.execute(delete(LibraryTombstone).where(LibraryTombstone.deleted_at < cutoff))
+    db.session.commit()
+    return result.rowcount
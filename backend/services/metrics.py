@@ -0,0 +1,224 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Slowest statements included in a slow-request log line
+SLOW_LOG_TOP_QUERIES = 5
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram rendered in the Prometheus text format."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ('le',)
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(names, key + (bound,))} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {series[-1]}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+
+def counter(name, documentation, labelnames=()):
+    metric = Counter(name, documentation, labelnames)
+    REGISTRY.append(metric)
+    return metric
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    metric = Histogram(name, documentation, labelnames, buckets)
+    REGISTRY.append(metric)
+    return metric
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_DURATION = histogram(
+    'haven_http_request_duration_seconds', 'Time spent handling a request, including streamed bodies.',
+    ('method', 'route', 'status'))
+REQUEST_QUERIES = histogram(
+    'haven_http_request_db_queries', 'SQL statements executed per request.',
+    ('route',), buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100))
+REQUEST_DB_TIME = histogram(
+    'haven_http_request_db_seconds', 'Total SQL time per request.', ('route',))
+DB_QUERY_DURATION = histogram(
+    'haven_db_query_duration_seconds', 'Duration of individual SQL statements.')
+EXTERNAL_CALL_DURATION = histogram(
+    'haven_external_call_duration_seconds', 'Duration of calls to upstream APIs.',
+    ('service', 'outcome'))
+EXTERNAL_DEGRADED = counter(
+    'haven_external_degraded_total', 'Upstream calls short-circuited, hedged or answered from stale cache.',
+    ('service', 'reason'))
+RATE_LIMITED = counter(
+    'haven_rate_limited_total', 'Requests rejected with 429 by a rate limit budget.', ('budget',))
+SLOW_REQUESTS = counter(
+    'haven_http_slow_requests_total', 'Requests slower than SLOW_REQUEST_THRESHOLD_MS.', ('route',))
+
+
+class _RequestStats:
+    __slots__ = ('start', 'query_count', 'query_time', 'queries')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.query_count = 0
+        self.query_time = 0.0
+        self.queries = []  # (duration, statement), only kept when slow logging is on
+
+
+# Stats of a request served outside Flask (the native search route in asgi.py), where there is no flask.g.
+# A ContextVar follows the request's task into the async engine's greenlets, where its cursor events fire.
+_native_request_stats = ContextVar('native_request_stats', default=None)
+
+
+def start_request_stats():
+    """Count the current task's SQL like a Flask request's; pass the result to finish_request()."""
+    stats = _RequestStats()
+    _native_request_stats.set(stats)
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    DB_QUERY_DURATION.observe(elapsed)
+
+    stats = g.get('_request_stats') if has_request_context() else _native_request_stats.get()
+    if stats is not None:
+        stats.query_count += 1
+        stats.query_time += elapsed
+        if settings.SLOW_REQUEST_THRESHOLD_MS:
+            stats.queries.append((elapsed, statement))
+
+
+def _handle_db_error(context):
+    # after_cursor_execute does not fire for failed statements
+    if context.connection is not None:
+        starts = context.connection.info.get('_query_start')
+        if starts:
+            starts.pop()
+
+
+def finish_request(stats, method, route, status):
+    elapsed = time.perf_counter() - stats.start
+    REQUEST_DURATION.observe(elapsed, method=method, route=route, status=status)
+    REQUEST_QUERIES.observe(stats.query_count, route=route)
+    REQUEST_DB_TIME.observe(stats.query_time, route=route)
+
+    threshold = settings.SLOW_REQUEST_THRESHOLD_MS
+    if threshold and elapsed * 1000 >= threshold:
+        SLOW_REQUESTS.inc(route=route)
+        slowest = sorted(stats.queries, key=lambda q: q[0], reverse=True)[:SLOW_LOG_TOP_QUERIES]
+        breakdown = '; '.join(f"{d * 1000:.1f}ms {' '.join(s.split())[:200]}" for d, s in slowest)
+        logger.warning(
+            f"Slow request {method} {route} -> {status}: {elapsed * 1000:.1f}ms, "
+            f"{stats.query_count} queries in {stats.query_time * 1000:.1f}ms. Slowest: {breakdown or 'none'}"
+        )
+
+
+def init_app(app):
+    """Wire request timing, SQL counting and the /metrics endpoint into the app."""
+    if not settings.METRICS_ENABLED:
+        return
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_db_error)
+
+    @app.before_request
+    def _start_request_timer():
+        g._request_stats = _RequestStats()
+
+    @app.after_request
+    def _record_request(response):
+        stats = g.get('_request_stats')
+        if stats is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            method, status = request.method, response.status_code
+            # Deferred to close so streamed bodies (and their queries) are included
+            response.call_on_close(lambda: finish_request(stats, method, route, status))
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,49 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from config import settings
+
+# Password hashing is CPU-bound by design. Running it on a small dedicated pool caps how many
+# hashes run at once per process; hashlib releases the GIL, so they still run in parallel.
+_hash_pool = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_pending = threading.BoundedSemaphore(settings.PASSWORD_HASH_MAX_PENDING)
+
+_current_method = None
+
+
+class HashingBusyError(Exception):
+    """Raised when too many hashes are already queued for the pool."""
+
+
+def _submit(fn, *args):
+    if not _pending.acquire(timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT):
+        raise HashingBusyError("Password hashing queue is full")
+    try:
+        future = _hash_pool.submit(fn, *args)
+    except BaseException:
+        _pending.release()
+        raise
+    future.add_done_callback(lambda _: _pending.release())
+    return future.result()
+
+
+def current_hash_method():
+    """The full method string (e.g. 'scrypt:32768:8:1') hashes are generated with today."""
+    global _current_method
+    if _current_method is None:
+        # werkzeug fills in default parameters, so read them back from a real hash
+        _current_method = generate_password_hash("", method=settings.PASSWORD_HASH_METHOD).split('$', 1)[0]
+    return _current_method
+
+
+def hash_password(password):
+    return _submit(generate_password_hash, password, settings.PASSWORD_HASH_METHOD)
+
+
+def verify_password(password_hash, password):
+    """Check a password on the hashing pool. Returns (matches, needs_rehash)."""
+    matches = _submit(check_password_hash, password_hash, password)
+    needs_rehash = matches and password_hash.split('$', 1)[0] != current_hash_method()
+    return matches, needs_rehash
@@ -0,0 +1,186 @@
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from config import settings
+from services.metrics import RATE_LIMITED
+
+try:
+    import redis
+except ImportError:  # redis is optional; without it only the in-process store is available
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_BUDGET_RE = re.compile(r'^\s*(\d+)\s*/\s*(second|minute|hour|day)\s*$')
+
+
+def parse_budget(value):
+    """Parse a budget such as '60/minute' into (capacity, tokens refilled per second).
+
+    Buckets start full, so a budget also allows a burst of its whole capacity.
+    """
+    match = _BUDGET_RE.match(value or '')
+    if not match:
+        raise ValueError(f"Invalid rate limit {value!r}; expected e.g. '60/minute'")
+    count = int(match.group(1))
+    return count, count / _PERIODS[match.group(2)]
+
+
+def _take(tokens, updated_at, now, capacity, rate):
+    """Refill a bucket up to `now` and try to take one token.
+
+    Returns (allowed, tokens left, seconds until a token is available).
+    """
+    tokens = min(capacity, tokens + (now - updated_at) * rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / rate
+
+
+class MemoryStore:
+    """Token buckets in this process, bounded LRU. Limits are per worker process.
+
+    Also the stand-in for a shared store in tests: pass a fake `clock` to control refills.
+    """
+
+    def __init__(self, max_keys=100_000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        with self._lock:
+            now = self.clock()
+            tokens, updated_at = self._buckets.pop(key, (capacity, now))
+            allowed, tokens, retry_after = _take(tokens, updated_at, now, capacity, rate)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                # A client evicted here just gets a full bucket back, which errs on the side of serving it
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+# Same arithmetic as _take, atomic on the Redis server and clocked by it, so every worker shares one bucket
+_REDIS_TAKE = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local allowed, retry_after = 0, 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RedisStore:
+    """Token buckets in Redis, shared by every worker and host pointing at the same server."""
+
+    prefix = 'haven:ratelimit:'
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_STORAGE_URL is set but the 'redis' package is not installed")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        self._script = self._client.register_script(_REDIS_TAKE)
+
+    def take(self, key, capacity, rate):
+        allowed, retry_after = self._script(keys=[self.prefix + key], args=[capacity, rate])
+        return bool(allowed), float(retry_after)
+
+
+class RateLimiter:
+    """Per-route token-bucket budgets (RATE_LIMIT_<NAME> settings), keyed by JWT identity or client IP."""
+
+    def __init__(self):
+        self.store = None
+        self._budgets = {}
+
+    def init_app(self, app):
+        if settings.RATE_LIMIT_STORAGE_URL:
+            self.store = RedisStore(settings.RATE_LIMIT_STORAGE_URL)
+        else:
+            self.store = MemoryStore(max_keys=settings.RATE_LIMIT_MAX_KEYS)
+        self._budgets = {}
+
+    def budget(self, name):
+        if name not in self._budgets:
+            self._budgets[name] = parse_budget(getattr(settings, f"RATE_LIMIT_{name.upper()}"))
+        return self._budgets[name]
+
+    def check(self, name, identity):
+        """Take a token from `identity`'s bucket for budget `name`. Returns None, or seconds to wait."""
+        if not settings.RATE_LIMIT_ENABLED or self.store is None:
+            return None
+        capacity, rate = self.budget(name)
+        try:
+            allowed, retry_after = self.store.take(f"{name}:{identity}", capacity, rate)
+        except Exception as e:
+            # An unreachable shared store must not take the API down with it
+            logger.warning(f"Rate limit store unavailable, letting request through: {e}")
+            return None
+        if allowed:
+            return None
+        if settings.METRICS_ENABLED:
+            RATE_LIMITED.inc(budget=name)
+        return retry_after
+
+
+limiter = RateLimiter()
+
+
+def request_identity():
+    """'user:<id>' for a request with a valid access token, else 'ip:<address>'."""
+    try:
+        # Already verified by @jwt_required when stacked under it; optional (and cheap) otherwise
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    return f"user:{identity}" if identity is not None else f"ip:{request.remote_addr}"
+
+
+def retry_after_header(retry_after):
+    return str(max(1, math.ceil(retry_after)))
+
+
+def too_many_requests(retry_after):
+    response = jsonify({"message": "Too many requests, please retry later"})
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after_header(retry_after)
+    return response
+
+
+def rate_limit(name):
+    """Limit the view to the RATE_LIMIT_<NAME> budget per caller. Stack it under @jwt_required
+    so that authenticated calls are counted per user rather than per address."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            retry_after = limiter.check(name, request_identity())
+            if retry_after is not None:
+                current_app.logger.info(f"Rate limited {request.path} ({name})")
+                return too_many_requests(retry_after)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,27 @@
+"""Serving side of "readers also shelved": queue changed books and read the precomputed neighbours.
+
+The neighbours themselves are computed offline by services/similarity.py,
+which needs NumPy/SciPy for large catalogs and is therefore only imported
+by the CLI commands, never by the web workers.
+"""
+from sqlalchemy import select
+
+from models import db, Book, BookSimilarity, SimilarityRefresh
+from services.serializers import BOOK_CARD_COLUMNS
+
+_queue = SimilarityRefresh.__table__
+
+
+def queue_similarity_refresh(book_ids):
+    """Queue books whose readers changed for the next `flask refresh-recommendations`, in the caller's transaction."""
+    if book_ids:
+        db.session.execute(_queue.insert(), [{"book_id": book_id} for book_id in set(book_ids)])
+
+
+def similar_books_stmt(book_id, limit):
+    """BOOK_CARD_COLUMNS rows of the book's best `limit` neighbours: at most RECOMMENDATIONS_TOP_K rows by primary key."""
+    return select(*BOOK_CARD_COLUMNS) \
+        .join(BookSimilarity, BookSimilarity.similar_book_id == Book.id) \
+        .where(BookSimilarity.book_id == book_id) \
+        .order_by(BookSimilarity.score.desc(), Book.id) \
+        .limit(limit)
@@ -0,0 +1,82 @@
+import math
+import threading
+import time
+from collections import deque
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    closed: calls go through. After `failure_threshold` failures in a row it
+    opens and allow() refuses calls for `reset_timeout` seconds. It then
+    turns half-open, which lets a single probe through: success closes the
+    breaker and failure opens it again. Every allow() that returns True must
+    be followed by record_success() or record_failure(), whatever the call
+    raised, or a half-open breaker never lets another probe through.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class LatencyTracker:
+    """Sliding window of recent call durations, for deriving timeouts and hedge delays."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        """The q-th percentile (0-100) of the window, or None until min_samples calls were seen."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, math.ceil(q / 100 * len(samples)) - 1)]
@@ -0,0 +1,129 @@
+import hashlib
+import zlib
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import parse_accept_header, parse_etags
+
+from config import settings
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; without it Flask's stdlib-based provider is used
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip is offered
+    brotli = None
+
+# Streamed NDJSON (the import progress feed) is left alone so that lines reach the client as they are produced
+COMPRESSIBLE_MIMETYPES = {'application/json'}
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """DefaultJSONProvider encoding with orjson.
+
+    Keys are still sorted and dates still go through Flask's default handler
+    (HTTP dates), so responses keep their shape. Non-ASCII text is emitted as
+    UTF-8 rather than escaped. Pretty-printed output (debug mode, indent=...)
+    falls back to the stdlib encoder.
+    """
+
+    def _options(self):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        kwargs.pop('separators', None)  # orjson output is always compact
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options() | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def body_etag(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison, as for GET: a gzip and an identity body of the same resource share their ETag."""
+    return bool(if_none_match) and parse_etags(if_none_match).contains_weak(etag)
+
+
+def not_modified(etag, cache_control):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def choose_encoding(accept_encoding):
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return parse_accept_header(accept_encoding).best_match(offered) if accept_encoding else None
+
+
+def _compressor(encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=settings.BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    # wbits 31: gzip container
+    compressor = zlib.compressobj(settings.GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress_bytes(data, encoding):
+    compress, finish = _compressor(encoding)
+    return compress(data) + finish()
+
+
+def _compress_stream(chunks, encoding):
+    compress, finish = _compressor(encoding)
+    for chunk in chunks:
+        data = compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def _compress_response(response):
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers):
+        return response
+    if not response.is_streamed and response.calculate_content_length() < settings.COMPRESSION_MIN_BYTES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compress_bytes(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+
+    # The compressed body differs byte for byte, so a strong ETag would be wrong here
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    """Switch JSON encoding to orjson when installed and compress large JSON responses."""
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+
+    if settings.RESPONSE_COMPRESSION_ENABLED:
+        app.after_request(_compress_response)
@@ -0,0 +1,141 @@
+import math
+import re
+
+from sqlalchemy import func, select
+
+from models import LibraryEntry
+from services.book_search_index import tokenize
+from services.isbn import to_isbn13
+
+# Relative weight of each signal in a result's score (each signal is scaled to 0..1)
+TEXT_WEIGHT = 0.6
+POPULARITY_WEIGHT = 0.25
+RATING_WEIGHT = 0.15
+# Breaks near-ties in favour of books already in our catalog, which can be added without an upstream lookup
+LOCAL_BONUS = 0.05
+
+# A trailing subtitle or parenthetical naming an edition rather than a different book. Other subtitles are
+# kept: "Dune: Messiah" is not "Dune"
+_EDITION_SUFFIX_RE = re.compile(
+    r'\s*[:(\[][^:(\[]*\b(?:edition|classics?|paperback|hardcover|hardback|unabridged|abridged|illustrated|'
+    r'annotated|anniversary|deluxe|reprint|large print|mass market|tie-in)\b[^:(\[]*$',
+    re.IGNORECASE)
+
+
+def _title_key(title):
+    # "Dune: Deluxe Edition" and "Dune (Penguin Classics) [Paperback]" collapse with "Dune"
+    title = title or ''
+    while True:
+        stripped = _EDITION_SUFFIX_RE.sub('', title)
+        if stripped == title:
+            return ' '.join(tokenize(title))
+        title = stripped
+
+
+def _author_key(author):
+    # Token set, so "Herbert, Frank" matches "Frank Herbert"
+    return ' '.join(sorted(tokenize(author)))
+
+
+class _Candidate:
+    __slots__ = ('source', 'item', 'title', 'author', 'isbn13', 'work_key', 'book_id', 'public_rating', 'score')
+
+    def __init__(self, source, item, title, author, isbn, work_key, book_id, public_rating):
+        self.source = source
+        self.item = item
+        self.title = title or ''
+        self.author = author or ''
+        self.isbn13 = to_isbn13(isbn)
+        self.work_key = work_key
+        self.book_id = book_id
+        self.public_rating = public_rating
+        self.score = 0.0
+
+    def keys(self):
+        if self.work_key:
+            yield ('work', self.work_key)
+        if self.isbn13:
+            yield ('isbn', self.isbn13)
+        title_key = _title_key(self.title)
+        if title_key:
+            yield ('title', title_key, _author_key(self.author))
+
+
+def _text_score(query_tokens, query_key, candidate):
+    if not query_tokens:
+        return 0.0
+    title_tokens = tokenize(candidate.title)
+    author_tokens = tokenize(candidate.author)
+    matched = 0.0
+    for token in query_tokens:
+        if token in title_tokens:
+            matched += 1.0
+        elif any(t.startswith(token) for t in title_tokens):
+            matched += 0.8
+        elif any(t.startswith(token) for t in author_tokens):
+            matched += 0.5
+    score = matched / len(query_tokens)
+    # Exact title matches go first ("dune" -> "Dune" before "Dune Messiah")
+    if query_key and _title_key(candidate.title) == query_key:
+        score += 0.5
+    return min(score, 1.5) / 1.5
+
+
+def popularity_stmt(book_ids):
+    """(book_id, entries) for the given books: how many of our users shelved each one."""
+    return select(LibraryEntry.book_id, func.count()) \
+        .where(LibraryEntry.book_id.in_(book_ids)).group_by(LibraryEntry.book_id)
+
+
+def rank_results(query, local_books, external_hits, popularity, limit):
+    """Collapse duplicate editions, score and truncate combined search results.
+
+    Results are merged when they share an Open Library work key, an ISBN
+    (compared as ISBN-13) or a normalized title plus author. Local books win
+    a merge. Each survivor is scored by text match against the query,
+    popularity within library_entries (`popularity` maps book_id to entry
+    count) and public_rating, and the best `limit` are returned as
+    (source, book or hit) pairs, ready to be formatted.
+    """
+    candidates = [
+        _Candidate('local', book, book.title, book.author.split(', ')[0] if book.author else None,
+                   book.isbn, book.external_id, book.id, book.public_rating)
+        for book in local_books
+    ] + [
+        _Candidate('external', hit, hit.get('title'), (hit.get('authors') or [None])[0],
+                   hit.get('isbn'), hit.get('external_id'), None, hit.get('public_rating'))
+        for hit in external_hits
+    ]
+
+    query_tokens = tokenize(query)
+    query_key = _title_key(query)
+    max_popularity = max(popularity.values(), default=0)
+
+    groups = []     # [representative, group score]
+    group_of = {}   # dedupe key -> index into groups
+    for candidate in candidates:
+        text = _text_score(query_tokens, query_key, candidate)
+        entries = popularity.get(candidate.book_id, 0)
+        popular = math.log1p(entries) / math.log1p(max_popularity) if max_popularity else 0.0
+        rating = (candidate.public_rating or 0) / 5
+        candidate.score = TEXT_WEIGHT * text + POPULARITY_WEIGHT * popular + RATING_WEIGHT * rating
+        if candidate.source == 'local':
+            candidate.score += LOCAL_BONUS
+
+        keys = list(candidate.keys())
+        index = next((group_of[key] for key in keys if key in group_of), None)
+        if index is None:
+            index = len(groups)
+            groups.append([candidate, candidate.score])
+        else:
+            group = groups[index]
+            # Local books are seen first, so an external edition never displaces one
+            if candidate.source == group[0].source and candidate.score > group[0].score:
+                group[0] = candidate
+            group[1] = max(group[1], candidate.score)
+        for key in keys:
+            group_of.setdefault(key, index)
+
+    # Stable sort: on equal scores local results stay ahead
+    groups.sort(key=lambda group: group[1], reverse=True)
+    return [(group[0].source, group[0].item) for group in groups[:limit]]
@@ -0,0 +1,67 @@
+"""Column-only reads and precompiled serializers for the hot read paths.
+
+Search and library listings select just the columns they return, so rows
+come back as plain tuples rather than hydrated, identity-mapped ORM
+objects, and each serializer turns one row into its response dict with
+positional lookups. Keep every *_COLUMNS tuple and its serializer in step.
+"""
+from models import Book, LibraryEntry
+from services.cover_cache import proxy_cover_url
+from services.isbn import to_isbn13
+
+# Rows of select(*BOOK_CARD_COLUMNS) also expose these by name (row.title, ...), like a Book would
+BOOK_CARD_COLUMNS = (
+    Book.id, Book.external_id, Book.title, Book.author, Book.isbn, Book.first_publish_year,
+    Book.publisher, Book.description, Book.image_url, Book.public_rating,
+)
+
+LIBRARY_ENTRY_COLUMNS = (
+    LibraryEntry.id, LibraryEntry.book_id, LibraryEntry.status, LibraryEntry.user_rating, LibraryEntry.user_notes,
+    Book.title, Book.author, Book.isbn, Book.image_url, Book.public_rating,
+    LibraryEntry.date_added, LibraryEntry.updated_at,
+)
+
+
+def book_card(row, url_root):
+    """A BOOK_CARD_COLUMNS row as a local search result."""
+    author, isbn, publisher = row[3], row[4], row[6]
+    return {
+        "local_book_id": row[0],
+        "external_id": row[1],
+        "title": row[2],
+        "authors": author.split(', ') if author else [],
+        "isbn": to_isbn13(isbn) or isbn,
+        "first_publish_year": row[5],
+        "publisher": [publisher] if publisher else None,
+        "description": row[7],
+        "cover_url": proxy_cover_url(url_root, row[8], row[0]),
+        "public_rating": row[9],
+        "source": "local",
+    }
+
+
+def library_entry(row, url_root):
+    """A LIBRARY_ENTRY_COLUMNS row as a /api/library/entries (and /changes) item."""
+    book_id, date_added, updated_at = row[1], row[10], row[11]
+    return {
+        "id": row[0],
+        "book_id": book_id,
+        "status": row[2],
+        "rating": row[3],
+        "notes": row[4],
+        "date_added": date_added.isoformat() if date_added else None,
+        "updated_at": updated_at.isoformat() if updated_at else None,
+        "book": {
+            "id": book_id,
+            "title": row[5],
+            "author": row[6],
+            "isbn": row[7],
+            "image_url": proxy_cover_url(url_root, row[8], book_id),
+            "public_rating": row[9],
+        },
+    }
+
+
+def user_public(user):
+    """Same fields as schemas.user.UserPublic, without re-validating what was just stored."""
+    return {"id": user.id, "username": user.username, "email": user.email}
@@ -0,0 +1,311 @@
+"""Offline computation of "readers also shelved" neighbours from library_entries.
+
+Each book is a vector over its readers, weighted by how strongly each one
+shelved it (entry_weight), and two books score the cosine of their vectors.
+Only pairs with at least RECOMMENDATIONS_MIN_CO_READERS readers in common
+count. Each book's best RECOMMENDATIONS_TOP_K are stored in book_similarities
+and served from there (services/recommendations.py).
+
+With NumPy and SciPy installed the reader x book matrix is a scipy.sparse
+matrix and a batch of books is scored with one sparse product; without them
+the same scores come from dicts, which is only practical for small catalogs.
+
+An entry only changes its own book's vector, so a refresh recomputes the
+queued books plus the books whose stored lists a queued book enters, leaves
+or moves within, instead of the whole table. Scoring a set of books only
+needs the entries of the books shelved alongside them, so a refresh reads
+just those rather than every library entry.
+"""
+import heapq
+import logging
+import math
+from collections import Counter, defaultdict
+from itertools import chain
+
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.orm import aliased
+
+from config import settings
+from models import db, Book, BookSimilarity, LibraryEntry, SimilarityRefresh
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # NumPy/SciPy are optional; without them similarities are computed in pure Python
+    np = sparse = None
+
+logger = logging.getLogger(__name__)
+
+# How much shelving a book says about a reader's taste, by LibraryEntry.status
+STATUS_WEIGHTS = (0.5, 0.8, 1.0)
+# Books scored per sparse product; bounds the memory of one batch of rows
+BATCH_SIZE = 1024
+# Keeps IN (...) lists within every database's parameter limit
+CHUNK_SIZE = 5000
+# A refresh that needs the entries of more than this share of the catalog reads the whole table instead
+FULL_SCAN_SHARE = 0.25
+
+_similarities = BookSimilarity.__table__
+_queue = SimilarityRefresh.__table__
+
+
+def entry_weight(status, rating):
+    """A reader's weight in a book's vector: by shelf, scaled down for low ratings (1 -> 0.6, 5 -> 1.0)."""
+    weight = STATUS_WEIGHTS[status] if 0 <= status < len(STATUS_WEIGHTS) else STATUS_WEIGHTS[0]
+    if rating is not None and rating >= 0:
+        weight *= 0.5 + rating / 10
+    return weight
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class SparseModel:
+    """Reader x book matrix as scipy.sparse CSR; rows are scored in batches of BATCH_SIZE books."""
+
+    def __init__(self, users, books, weights):
+        users = np.asarray(users, dtype=np.int32)
+        books = np.asarray(books, dtype=np.int32)
+        weights = np.asarray(weights, dtype=np.float64)
+        self.book_ids, book_index = np.unique(books, return_inverse=True)
+        user_ids, user_index = np.unique(users, return_inverse=True)
+
+        shape = (len(user_ids), len(self.book_ids))
+        self._shelves = sparse.csr_matrix((weights, (user_index, book_index)), shape=shape)
+        self._readers = self._shelves.T.tocsr()
+        # Same pattern with ones, so that the same product counts readers in common
+        self._shelved = sparse.csr_matrix((np.ones_like(weights), (user_index, book_index)), shape=shape)
+        self._read_by = self._shelved.T.tocsr()
+        self._norms = np.sqrt(np.asarray(self._shelves.multiply(self._shelves).sum(axis=0)).ravel())
+
+    def neighbours(self, book_ids, top_k, min_co_readers):
+        """Yield (book_id, [(similar_book_id, score, co_readers), ...]) best first, at most top_k (None = all)."""
+        requested = np.asarray(list(book_ids), dtype=np.int64)
+        if len(self.book_ids):
+            positions = np.minimum(np.searchsorted(self.book_ids, requested), len(self.book_ids) - 1)
+            known = self.book_ids[positions] == requested
+        else:
+            positions = known = np.zeros(len(requested), dtype=bool)
+
+        for book_id in requested[~known]:
+            # Nobody shelves it (any more)
+            yield int(book_id), []
+
+        rows = positions[known]
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            dots = (self._readers[batch] @ self._shelves).tocsr()
+            co = (self._read_by[batch] @ self._shelved).tocsr()
+            # Weights are positive, so both products have the same non-zero pattern; it normally
+            # comes out in the same order too, and sorting is only needed when it does not
+            if not (np.array_equal(dots.indptr, co.indptr) and np.array_equal(dots.indices, co.indices)):
+                dots.sort_indices()
+                co.sort_indices()
+            for i, row in enumerate(batch):
+                lo, hi = dots.indptr[i], dots.indptr[i + 1]
+                columns = dots.indices[lo:hi]
+                counts = co.data[lo:hi]
+                keep = (columns != row) & (counts >= min_co_readers)
+                columns, counts = columns[keep], counts[keep]
+                scores = dots.data[lo:hi][keep] / (self._norms[row] * self._norms[columns])
+                if top_k is not None and len(scores) > top_k:
+                    top = np.argpartition(-scores, top_k - 1)[:top_k]
+                    columns, counts, scores = columns[top], counts[top], scores[top]
+                similar_ids = self.book_ids[columns]
+                order = np.lexsort((similar_ids, -scores))
+                yield int(self.book_ids[row]), list(zip(
+                    similar_ids[order].tolist(), scores[order].tolist(), counts[order].astype(np.int64).tolist()))
+
+
+class DictModel:
+    """Pure-Python fallback with the same scores: readers per book and books per reader as dicts."""
+
+    def __init__(self, users, books, weights):
+        self._readers = defaultdict(dict)
+        self._shelves = defaultdict(dict)
+        for user_id, book_id, weight in zip(users, books, weights):
+            self._readers[book_id][user_id] = weight
+            self._shelves[user_id][book_id] = weight
+        self._norms = {book_id: math.sqrt(sum(w * w for w in readers.values()))
+                       for book_id, readers in self._readers.items()}
+        self.book_ids = sorted(self._readers)
+
+    def neighbours(self, book_ids, top_k, min_co_readers):
+        for book_id in book_ids:
+            readers = self._readers.get(book_id)
+            if not readers:
+                yield book_id, []
+                continue
+            dots = defaultdict(float)
+            co = Counter()
+            for user_id, weight in readers.items():
+                for other_id, other_weight in self._shelves[user_id].items():
+                    if other_id != book_id:
+                        dots[other_id] += weight * other_weight
+                        co[other_id] += 1
+            norm = self._norms[book_id]
+            scored = [(other_id, dot / (norm * self._norms[other_id]), co[other_id])
+                      for other_id, dot in dots.items() if co[other_id] >= min_co_readers]
+            key = lambda item: (-item[1], item[0])
+            yield book_id, sorted(scored, key=key) if top_k is None else heapq.nsmallest(top_k, scored, key=key)
+
+
+def build_model(users, books, weights):
+    """SparseModel when NumPy/SciPy are installed, DictModel otherwise."""
+    if sparse is not None:
+        return SparseModel(users, books, weights)
+    return DictModel(users, books, weights)
+
+
+def co_shelved(book_ids):
+    """`book_ids` and every book shelved by one of their readers."""
+    mine, theirs = aliased(LibraryEntry), aliased(LibraryEntry)
+    books = set(book_ids)
+    for chunk in _chunks(book_ids):
+        books.update(db.session.scalars(
+            select(theirs.book_id).distinct().join(mine, mine.user_id == theirs.user_id)
+            .where(mine.book_id.in_(chunk))))
+    return books
+
+
+def load_entries(book_ids=None):
+    """(user ids, book ids, weights) of every library entry, or of the entries on `book_ids`,
+    read as four integer columns: ratings come as half stars, -1 when unrated."""
+    columns = (LibraryEntry.user_id, LibraryEntry.book_id, LibraryEntry.status,
+               func.coalesce(cast(func.round(LibraryEntry.user_rating * 2), Integer), -1))
+    if book_ids is None:
+        rows = db.session.execute(select(*columns)).all()
+    else:
+        rows = []
+        for chunk in _chunks(book_ids):
+            rows.extend(db.session.execute(select(*columns).where(LibraryEntry.book_id.in_(chunk))))
+    if np is not None:
+        # Ids, statuses and half-star ratings are all integers that fit in 32 bits
+        columns = np.fromiter(chain.from_iterable(rows), dtype=np.int32, count=4 * len(rows)).reshape(-1, 4)
+        status = columns[:, 2]
+        status[(status < 0) | (status >= len(STATUS_WEIGHTS))] = 0
+        halves = columns[:, 3]
+        weights = np.asarray(STATUS_WEIGHTS)[status] * np.where(halves >= 0, 0.5 + halves / 20, 1.0)
+        return columns[:, 0], columns[:, 1], weights
+    return [row[0] for row in rows], [row[1] for row in rows], \
+        [entry_weight(row[2], row[3] / 2 if row[3] >= 0 else None) for row in rows]
+
+
+def load_model():
+    return build_model(*load_entries())
+
+
+def entry_scope(book_ids):
+    """Books whose entries scoring `book_ids` needs, or None when that is over FULL_SCAN_SHARE of the catalog.
+
+    A book's scores depend on its readers' shelves and on the norms of the
+    books on them, i.e. on the entries of co_shelved(book_ids). Other books
+    in a model of just those entries may score differently than in the full one.
+    """
+    books = co_shelved(book_ids)
+    if len(books) > FULL_SCAN_SHARE * db.session.scalar(select(func.count()).select_from(Book)):
+        return None
+    return books
+
+
+def _replace_rows(neighbours):
+    """Overwrite the stored lists of the books in `neighbours` ({book_id: [(similar, score, co), ...]})."""
+    for chunk in _chunks(neighbours):
+        db.session.execute(_similarities.delete().where(_similarities.c.book_id.in_(chunk)))
+    values = [
+        {"book_id": book_id, "similar_book_id": similar_id, "score": score, "co_readers": co_readers}
+        for book_id, rows in neighbours.items() for similar_id, score, co_readers in rows
+    ]
+    for chunk in _chunks(values):
+        db.session.execute(_similarities.insert(), chunk)
+    return len(values)
+
+
+def _claim_queue():
+    """(ids, book ids) of the queued changes present now; later ones stay queued for the next refresh."""
+    rows = db.session.execute(select(_queue.c.id, _queue.c.book_id)).all()
+    return [row[0] for row in rows], {row[1] for row in rows}
+
+
+def _delete_queued(ids):
+    for chunk in _chunks(ids):
+        db.session.execute(_queue.delete().where(_queue.c.id.in_(chunk)))
+
+
+def rebuild_similarities():
+    """Recompute every book's neighbours from scratch. Returns the number of stored pairs."""
+    queued, _ = _claim_queue()
+    model = load_model()
+    neighbours = dict(model.neighbours(model.book_ids, settings.RECOMMENDATIONS_TOP_K,
+                                       settings.RECOMMENDATIONS_MIN_CO_READERS))
+    db.session.execute(_similarities.delete())
+    pairs = _replace_rows(neighbours)
+    _delete_queued(queued)
+    db.session.commit()
+    logger.info(f"Rebuilt similarities for {len(neighbours)} books ({pairs} pairs)")
+    return pairs
+
+
+def _stored_bounds(book_ids):
+    """{book_id: (list length, lowest score)} for the stored lists of `book_ids`."""
+    bounds = {}
+    for chunk in _chunks(book_ids):
+        bounds.update(
+            (book_id, (count, lowest)) for book_id, count, lowest in db.session.execute(
+                select(_similarities.c.book_id, func.count(), func.min(_similarities.c.score))
+                .where(_similarities.c.book_id.in_(chunk)).group_by(_similarities.c.book_id)
+            )
+        )
+    return bounds
+
+
+def _listing(book_ids):
+    """Books whose stored lists contain one of `book_ids`."""
+    listing = set()
+    for chunk in _chunks(book_ids):
+        listing.update(db.session.scalars(
+            select(_similarities.c.book_id).where(_similarities.c.similar_book_id.in_(chunk))))
+    return listing
+
+
+def refresh_similarities():
+    """Recompute the neighbours of queued books and of the books their changes affect.
+
+    A queued book's score against another book B can only change B's list
+    if the book is on it already, or now beats B's lowest stored score (or
+    B's list is not full); only those lists are recomputed.
+    Returns (queued books, other books recomputed).
+    """
+    queued, changed = _claim_queue()
+    if not queued:
+        return 0, 0
+    top_k = settings.RECOMMENDATIONS_TOP_K
+    min_co_readers = settings.RECOMMENDATIONS_MIN_CO_READERS
+
+    scope = entry_scope(changed)
+    model = build_model(*load_entries(scope))
+    # Untruncated: a pair outside a changed book's own top K may still enter the other book's list
+    scored = dict(model.neighbours(changed, None, min_co_readers))
+    candidates = {other_id for rows in scored.values() for other_id, _, _ in rows} - changed
+    bounds = _stored_bounds(candidates)
+
+    affected = _listing(changed) - changed
+    for rows in scored.values():
+        for other_id, score, _ in rows:
+            count, lowest = bounds.get(other_id, (0, None))
+            if other_id not in changed and (count < top_k or score > lowest):
+                affected.add(other_id)
+
+    neighbours = {book_id: rows[:top_k] for book_id, rows in scored.items()}
+    if affected:
+        if scope is not None:
+            model = build_model(*load_entries(entry_scope(affected)))
+        neighbours.update(model.neighbours(sorted(affected), top_k, min_co_readers))
+    _replace_rows(neighbours)
+    _delete_queued(queued)
+    db.session.commit()
+    logger.info(f"Refreshed similarities for {len(changed)} changed and {len(affected)} affected books")
+    return len(changed), len(affected)
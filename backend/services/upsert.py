@@ -0,0 +1,52 @@
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Book, LibraryEntry
+
+_books = Book.__table__
+_entries = LibraryEntry.__table__
+
+
+def dialect_insert(table):
+    """Return an INSERT construct with on_conflict_do_* support for the bound database."""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Upserts are not supported on '{dialect}'")
+
+
+def book_upsert(values):
+    """INSERT one or more books keyed on ISBN, RETURNING (id, isbn, title, author) for every row.
+
+    An existing row with the same ISBN is kept as is, apart from filling in a
+    missing cover or Open Library metadata. Rows within one statement must have
+    distinct ISBNs.
+    """
+    stmt = dialect_insert(_books).values(values)
+    return stmt.on_conflict_do_update(
+        index_elements=['isbn'],
+        set_={column: func.coalesce(_books.c[column], stmt.excluded[column])
+              for column in ('image_url', 'external_id', 'first_publish_year')}
+    ).returning(_books.c.id, _books.c.isbn, _books.c.title, _books.c.author)
+
+
+def library_entry_upsert(values=None, select=None):
+    """INSERT library entries, updating status and rating when the user already shelved the book.
+
+    Pass `values` (dict or list of dicts) or a `select` yielding
+    (user_id, book_id, status, user_rating, version), where version comes from
+    next_library_version(). RETURNING (id, book_id, status, user_rating) as stored.
+    """
+    stmt = dialect_insert(_entries)
+    if select is not None:
+        stmt = stmt.from_select(['user_id', 'book_id', 'status', 'user_rating', 'version'], select)
+    else:
+        stmt = stmt.values(values)
+    # index_elements targets the _user_book_uc unique constraint (SQLite cannot name constraints here)
+    return stmt.on_conflict_do_update(
+        index_elements=['user_id', 'book_id'],
+        set_={"status": stmt.excluded.status, "user_rating": stmt.excluded.user_rating,
+              "version": stmt.excluded.version, "updated_at": func.now()}
+    ).returning(_entries.c.id, _entries.c.book_id, _entries.c.status, _entries.c.user_rating)
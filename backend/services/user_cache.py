@@ -0,0 +1,38 @@
+from collections import namedtuple
+
+from flask import current_app
+
+from config import settings
+from models import db, User
+from services.cache import TTLCache
+
+# What protected routes need to know about the caller, without an ORM instance tied to a session
+CachedUser = namedtuple('CachedUser', ['id', 'username', 'email'])
+
+_users = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+
+
+def get_user(identity):
+    """Resolve a JWT identity to a CachedUser, hitting the database only on a cache miss."""
+    user_id = int(identity)
+    user = _users.get(user_id)
+    if user is None:
+        row = db.session.query(User.id, User.username, User.email).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        user = CachedUser(*row)
+        _users.set(user_id, user)
+    return user
+
+
+def invalidate_user(user_id):
+    """Drop a user from this process's cache; call after every commit that updates or deletes a user row."""
+    _users.pop(int(user_id))
+
+
+def register_user_loader(jwt):
+    """Make flask_jwt_extended's `current_user` resolve through the per-process cache."""
+
+    @jwt.user_lookup_loader
+    def _load_user(jwt_header, jwt_data):
+        return get_user(jwt_data[current_app.config['JWT_IDENTITY_CLAIM']])
@@ -0,0 +1,82 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Settings are read once, at first import of config: point them at a throwaway database first.
+# Tests empty every table, so never inherit DATABASE_URL; set TEST_DATABASE_URL to run them on PostgreSQL
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL') or \
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='haven-tests-'), 'test.db')}"
+# No replica and no shared rate-limit store, whatever .env says
+os.environ['DATABASE_REPLICA_URL'] = ''
+os.environ['RATE_LIMIT_STORAGE_URL'] = ''
+os.environ.setdefault('SECRET_KEY', 'test-secret-key-that-is-long-enough')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app():
+    from run import create_app
+    from models import db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def database(app):
+    """An app context over empty tables; whatever the test wrote is deleted afterwards."""
+    from models import db
+
+    with app.app_context():
+        yield db
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+
+@pytest.fixture
+def make_user(database):
+    from models import User
+
+    def make_user(name='reader'):
+        user = User(username=name, email=f"{name}@example.com", password_hash='x')
+        database.session.add(user)
+        database.session.commit()
+        return user.id
+    return make_user
+
+
+@pytest.fixture
+def make_book(database):
+    from models import Book
+
+    def make_book(title='Dune', isbn=None, **values):
+        book = Book(title=title, isbn=isbn, **values)
+        database.session.add(book)
+        database.session.commit()
+        return book.id
+    return make_book
+
+
+@pytest.fixture
+def shelve(database):
+    """What a library write does: bump the version, read the old entry, upsert it, move the counters."""
+    from services.library_stats import next_library_version, previous_entries, record_entry_changes
+    from services.upsert import library_entry_upsert
+
+    def shelve(user_id, book_id, status, rating=None):
+        version = next_library_version(user_id)
+        previous = previous_entries(user_id, [book_id])
+        rows = database.session.execute(library_entry_upsert({
+            "user_id": user_id, "book_id": book_id, "status": status, "user_rating": rating, "version": version,
+        })).all()
+        record_entry_changes(user_id, previous, rows)
+        database.session.commit()
+        return rows[0].id
+    return shelve
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+
+pytest.importorskip('aiosqlite')
+pytest.importorskip('greenlet')
+
+
+def _sqlite_with_marker(name):
+    path = os.path.join(tempfile.mkdtemp(prefix='haven-tests-'), f'{name}.db')
+    import sqlite3
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE marker (name TEXT)")
+        connection.execute("INSERT INTO marker VALUES (?)", (name,))
+    return f"sqlite:///{path}"
+
+
+async def _marker(session_factory):
+    async with session_factory() as session:
+        return (await session.execute(text("SELECT name FROM marker"))).scalar_one()
+
+
+def test_read_only_sessions_use_the_replica(app):
+    from services.async_db import async_session, dispose_async_engine, init_async_engine
+
+    async def run():
+        init_async_engine(_sqlite_with_marker('primary'), _sqlite_with_marker('replica'))
+        try:
+            return await _marker(async_session), await _marker(lambda: async_session(read_only=True))
+        finally:
+            await dispose_async_engine()
+
+    assert asyncio.run(run()) == ('primary', 'replica')
+
+
+def test_read_only_sessions_fall_back_to_the_primary(app):
+    from services.async_db import async_session, dispose_async_engine, init_async_engine
+
+    async def run():
+        init_async_engine(_sqlite_with_marker('primary'))
+        try:
+            return await _marker(lambda: async_session(read_only=True))
+        finally:
+            await dispose_async_engine()
+
+    assert asyncio.run(run()) == 'primary'
+
+
+def test_async_queries_are_counted_in_the_request_stats(app):
+    from services.async_db import async_session, dispose_async_engine, init_async_engine
+    from services.metrics import start_request_stats
+
+    async def run():
+        init_async_engine(_sqlite_with_marker('primary'))
+        try:
+            stats = start_request_stats()
+            await _marker(async_session)
+            await _marker(async_session)
+            return stats
+        finally:
+            await dispose_async_engine()
+
+    stats = asyncio.run(run())
+    assert stats.query_count == 2
+    assert stats.query_time > 0
+
+
+def test_async_transactions_get_the_search_statement_timeout(app, monkeypatch):
+    from config import settings
+    from services import async_db
+
+    executed = []
+    cursor = SimpleNamespace(execute=executed.append, close=lambda: None)
+    postgres = SimpleNamespace(dialect=SimpleNamespace(name='postgresql'),
+                               connection=SimpleNamespace(cursor=lambda: cursor))
+    monkeypatch.setattr(settings, 'SEARCH_STATEMENT_TIMEOUT_MS', 1500)
+
+    async def run():
+        async_db.init_async_engine(_sqlite_with_marker('primary'))
+        try:
+            # What the engine runs when a transaction begins, against a PostgreSQL-like connection
+            engine = async_db._engines[0].sync_engine
+            engine.dispatch.begin(postgres)
+            # and on SQLite, where there is no statement_timeout, the same transaction just runs
+            return await _marker(async_db.async_session)
+        finally:
+            await async_db.dispose_async_engine()
+
+    assert asyncio.run(run()) == 'primary'
+    assert executed == ["SET LOCAL statement_timeout = 1500"]
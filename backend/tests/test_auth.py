@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+from werkzeug.security import generate_password_hash
+
+from models import User
+from routes import auth
+from services.passwords import HashingBusyError
+from services.rate_limit import MemoryStore, limiter
+
+
+@pytest.fixture
+def client(app, database, monkeypatch):
+    monkeypatch.setattr(limiter, 'store', MemoryStore())
+    return app.test_client()
+
+
+@pytest.fixture
+def outdated_user(database):
+    """A user whose password was hashed with parameters older than PASSWORD_HASH_METHOD."""
+    user = User(username='reader', email='reader@example.com',
+                password_hash=generate_password_hash('secret1', method='pbkdf2:sha256:1000'))
+    database.session.add(user)
+    database.session.commit()
+    return user.id
+
+
+def login(client):
+    return client.post('/auth/login', json={"email": "reader@example.com", "password": "secret1"})
+
+
+def busy(*args):
+    raise HashingBusyError("Password hashing queue is full")
+
+
+def test_login_upgrades_outdated_hash(client, database, outdated_user):
+    assert login(client).status_code == 200
+    assert not database.session.get(User, outdated_user).password_hash.startswith('pbkdf2:sha256:1000$')
+
+
+def test_login_succeeds_when_rehash_is_busy(client, database, outdated_user, monkeypatch):
+    monkeypatch.setattr(auth, 'hash_password', busy)
+    response = login(client)
+    assert response.status_code == 200 and response.get_json()["access_token"]
+    assert database.session.get(User, outdated_user).password_hash.startswith('pbkdf2:sha256:1000$')
+
+
+def test_login_succeeds_when_rehash_cannot_be_stored(client, database, outdated_user, monkeypatch):
+    def failing_commit():
+        raise OperationalError("UPDATE users", {}, Exception("database is locked"))
+    monkeypatch.setattr(database.session, 'commit', failing_commit)
+    assert login(client).status_code == 200
+
+
+def test_login_is_503_when_verification_is_busy(client, outdated_user, monkeypatch):
+    monkeypatch.setattr(auth, 'verify_password', busy)
+    assert login(client).status_code == 503
@@ -0,0 +1,35 @@
+from services.book_search_index import BookTokenIndex
+
+
+def _index(rows):
+    index = BookTokenIndex()
+    index.load(rows)
+    return index
+
+
+def test_best_match_past_the_candidate_cutoff_is_kept():
+    # "dunaway", "dunbar" and "duncan" sort before "dune" and would fill a 3-book cutoff on their own
+    index = _index([
+        (1, "Seabiscuit", "Dunaway"),
+        (2, "Highland Tales", "Dunbar"),
+        (3, "A Memoir", "Duncan"),
+        (4, "Dune", "Frank Herbert"),
+    ])
+    assert index.search("dun", 1, max_candidates=3) == [4]
+    assert [s["title"] for s in index.suggest("dun", 2, max_candidates=3)] == ["Dune", "Seabiscuit"]
+
+
+def test_later_tokens_are_scored_within_the_books_already_matched():
+    index = _index([
+        (1, "Seabiscuit", "Dunaway"),
+        (2, "Highland Tales", "Dunbar"),
+        (3, "A Memoir", "Duncan"),
+        (4, "Dune", "Frank Herbert"),
+    ])
+    assert index.search("herbert dun", 5, max_candidates=3) == [4]
+
+
+def test_exact_tokens_outrank_prefixes():
+    index = _index([(1, "Dunes of Arrakis", "Anon"), (2, "Dunes", "Anon"), (3, "Dune", "Anon")])
+    assert index.search("dune", 1, max_candidates=2) == [3]
+    assert index.search("dune", 3) == [3, 1, 2]
@@ -0,0 +1,78 @@
+import pytest
+
+from config import settings
+from services import cover_cache
+from services.cover_cache import ContentAddressedCache, CoverTooLarge, get_openlibrary_cover
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, chunks, headers=None):
+        self.chunks = chunks
+        self.headers = headers or {}
+        self.read = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for chunk in self.chunks:
+            self.read += len(chunk)
+            yield chunk
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        self.calls.append(kwargs)
+        return self.response
+
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch):
+    """Serve `response` for every cover download, into an empty cache."""
+    monkeypatch.setattr(cover_cache, 'cover_cache', ContentAddressedCache(str(tmp_path), 10 ** 9))
+    monkeypatch.setattr(settings, 'COVER_MAX_BYTES', 100)
+
+    def upstream(response):
+        session = FakeSession(response)
+        monkeypatch.setattr(cover_cache, 'http_session', lambda: session)
+        return session
+    return upstream
+
+
+def test_covers_under_the_limit_are_streamed_and_cached(upstream):
+    session = upstream(FakeResponse([b'\xff\xd8' + b'x' * 48, b'y' * 50]))
+    path, _ = get_openlibrary_cover(1)
+    with open(path, 'rb') as f:
+        assert len(f.read()) == 100
+    assert session.calls[0]['stream'] is True
+
+
+def test_an_oversized_content_length_is_rejected_before_reading(upstream):
+    response = FakeResponse([b'x' * 10], headers={'Content-Length': '5000'})
+    upstream(response)
+    with pytest.raises(CoverTooLarge):
+        get_openlibrary_cover(2)
+    assert response.read == 0
+    assert cover_cache.cover_cache.lookup('ol:2:M') is None
+
+
+def test_a_body_longer_than_declared_stops_at_the_limit(upstream):
+    # No (or a lying) Content-Length: reading stops at the first chunk past the cap
+    response = FakeResponse([b'x' * 60, b'x' * 60, b'x' * 60], headers={'Content-Length': '50'})
+    upstream(response)
+    with pytest.raises(CoverTooLarge):
+        get_openlibrary_cover(3)
+    assert response.read == 120
+    assert cover_cache.cover_cache.lookup('ol:3:M') is None
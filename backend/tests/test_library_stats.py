@@ -0,0 +1,70 @@
+from models import LibraryEntry, LibraryStat, User
+from services.library_stats import (
+    get_library_stats, next_library_version, rebuild_library_stats, record_entry_removal,
+)
+
+
+def counters(db, user_id):
+    return {(stat.status, stat.rating_halves): stat.entry_count
+            for stat in db.session.query(LibraryStat).filter_by(user_id=user_id) if stat.entry_count}
+
+
+def test_versions_increase_per_user(database, make_user):
+    alice, bob = make_user('alice'), make_user('bob')
+    assert [next_library_version(alice) for _ in range(3)] == [1, 2, 3]
+    assert next_library_version(bob) == 1
+    database.session.commit()
+    assert database.session.get(User, alice).library_version == 3
+
+
+def test_adding_the_same_book_twice_counts_it_once(database, make_user, make_book, shelve):
+    user_id, book_id = make_user(), make_book()
+    shelve(user_id, book_id, 0)
+    shelve(user_id, book_id, 0)
+    assert counters(database, user_id) == {(0, 0): 1}
+    assert get_library_stats(user_id)["total"] == 1
+
+
+def test_counters_follow_shelf_and_rating_changes(database, make_user, make_book, shelve):
+    user_id = make_user()
+    dune, emma = make_book('Dune'), make_book('Emma')
+    shelve(user_id, dune, 0)
+    shelve(user_id, emma, 2, 4.5)
+    shelve(user_id, dune, 2, 3)
+
+    assert counters(database, user_id) == {(2, 6): 1, (2, 9): 1}
+    stats = get_library_stats(user_id)
+    assert stats["shelves"] == {"want_to_read": 0, "reading": 0, "read": 2}
+    assert stats["ratings"] == {"3": 1, "4.5": 1}
+    assert stats["average_rating"] == 3.75
+
+
+def test_removal_and_rebuild_agree(database, make_user, make_book, shelve):
+    user_id = make_user()
+    books = [make_book(f"Book {i}") for i in range(4)]
+    for i, book_id in enumerate(books):
+        shelve(user_id, book_id, i % 3, i + 0.5 if i else None)
+
+    entry = database.session.query(LibraryEntry).filter_by(book_id=books[1]).one()
+    database.session.delete(entry)
+    record_entry_removal(user_id, entry.status, entry.user_rating)
+    database.session.commit()
+    incremental = counters(database, user_id)
+
+    rebuild_library_stats(user_id)
+    assert counters(database, user_id) == incremental
+    assert get_library_stats(user_id)["total"] == 3
+
+
+def test_half_star_ratings_are_stored_as_such(database, make_user, make_book, shelve):
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateTable
+
+    # SQLite keeps 4.5 in any column, so check the type PostgreSQL would create too
+    ddl = str(CreateTable(LibraryEntry.__table__).compile(dialect=postgresql.dialect()))
+    assert 'user_rating FLOAT' in ddl
+
+    user_id = make_user()
+    entry_id = shelve(user_id, make_book(), 2, 4.5)
+    assert database.session.get(LibraryEntry, entry_id).user_rating == 4.5
+    assert get_library_stats(user_id)["ratings"] == {"4.5": 1}
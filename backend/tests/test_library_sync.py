@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import LibraryTombstone
+from services.library_sync import (
+    InvalidCursor, decode_cursor, encode_cursor, library_changes, prune_tombstones, remove_entry,
+)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(42, issued_at=1700000000)) == (42, 1700000000)
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not a cursor")
+
+
+def test_changes_since_a_version(database, make_user, make_book, shelve):
+    user_id = make_user()
+    dune, emma = make_book('Dune'), make_book('Emma')
+    shelve(user_id, dune, 0)
+    shelve(user_id, emma, 1)
+    shelve(user_id, dune, 2)
+
+    version, entries, deleted = library_changes(user_id, 0)
+    assert version == 3
+    assert [row.book_id for row in entries] == [emma, dune]
+    assert deleted == []
+
+    version, entries, deleted = library_changes(user_id, 2)
+    assert [(row.book_id, row.status) for row in entries] == [(dune, 2)]
+    assert library_changes(user_id, 3)[1].all() == []
+
+
+def test_removal_leaves_a_tombstone(database, make_user, make_book, shelve):
+    alice, bob = make_user('alice'), make_user('bob')
+    entry_id = shelve(alice, make_book(), 0)
+
+    assert not remove_entry(bob, entry_id)
+    assert remove_entry(alice, entry_id)
+
+    version, entries, deleted = library_changes(alice, 1)
+    assert (version, entries.all(), deleted) == (2, [], [entry_id])
+    # A first sync starts from an empty cache, so it gets no deletions
+    assert library_changes(alice, 0)[2] == []
+
+
+def test_prune_tombstones(database, make_user, make_book, shelve):
+    user_id = make_user()
+    old, recent = (shelve(user_id, make_book(title), 0) for title in ('Old', 'Recent'))
+    remove_entry(user_id, old)
+    remove_entry(user_id, recent)
+    database.session.query(LibraryTombstone).filter_by(entry_id=old) \
+        .update({"deleted_at": datetime.utcnow() - timedelta(days=365)})
+    database.session.commit()
+
+    assert prune_tombstones() == 1
+    assert [t.entry_id for t in database.session.query(LibraryTombstone)] == [recent]
@@ -0,0 +1,67 @@
+import pytest
+
+from services.rate_limit import MemoryStore, RateLimiter, limiter, parse_budget
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_budget():
+    assert parse_budget("60/minute") == (60, 1.0)
+    assert parse_budget(" 10 / second ") == (10, 10.0)
+    with pytest.raises(ValueError):
+        parse_budget("sixty per minute")
+
+
+def test_bucket_allows_a_burst_then_refills():
+    clock = FakeClock()
+    store = MemoryStore(clock=clock)
+    assert all(store.take("search:ip:1", 3, 1.0)[0] for _ in range(3))
+
+    allowed, retry_after = store.take("search:ip:1", 3, 1.0)
+    assert not allowed and retry_after == pytest.approx(1.0)
+    # Buckets are independent per key
+    assert store.take("search:ip:2", 3, 1.0)[0]
+
+    clock.now += 0.5
+    allowed, retry_after = store.take("search:ip:1", 3, 1.0)
+    assert not allowed and retry_after == pytest.approx(0.5)
+    clock.now += 0.5
+    assert store.take("search:ip:1", 3, 1.0)[0]
+
+
+def test_least_recently_used_buckets_are_dropped():
+    store = MemoryStore(max_keys=2, clock=FakeClock())
+    store.take("a", 1, 0.001)
+    store.take("b", 1, 0.001)
+    store.take("c", 1, 0.001)
+    # "a" was evicted and comes back full; "c" is still empty
+    assert store.take("a", 1, 0.001)[0]
+    assert not store.take("c", 1, 0.001)[0]
+
+
+def test_limiter_lets_requests_through_when_the_store_fails():
+    class BrokenStore:
+        def take(self, key, capacity, rate):
+            raise ConnectionError("store unreachable")
+
+    rate_limiter = RateLimiter()
+    rate_limiter.store = BrokenStore()
+    assert rate_limiter.check('search', 'ip:1') is None
+
+
+def test_route_answers_429_with_retry_after(app, monkeypatch):
+    monkeypatch.setattr(limiter, 'store', MemoryStore(clock=FakeClock()))
+    monkeypatch.setitem(limiter._budgets, 'login', (2, 1 / 60))
+    client = app.test_client()
+
+    for _ in range(2):
+        assert client.post('/auth/login', json={}).status_code == 400
+    response = client.post('/auth/login', json={})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '60'
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from services import book_search_api as api
+from services.resilience import CircuitBreaker, LatencyTracker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr('services.resilience.time.monotonic', clock)
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.fixture
+def half_open(monkeypatch, clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    monkeypatch.setattr(api, '_breaker', breaker)
+    monkeypatch.setattr(api, '_hedge_delay', lambda: None)
+    return breaker
+
+
+def _raise(exc):
+    def search_once(*args, **kwargs):
+        raise exc
+    return search_once
+
+
+def test_probe_with_invalid_json_reopens_breaker(monkeypatch, clock, half_open):
+    monkeypatch.setattr(api, '_search_once', _raise(ValueError("No JSON object could be decoded")))
+    assert api._fetch_external("dune", 10) is None
+    assert half_open.state == CircuitBreaker.OPEN
+    clock.now += 10
+    assert half_open.allow()
+
+
+def test_probe_with_unexpected_error_releases_probe(monkeypatch, clock, half_open):
+    monkeypatch.setattr(api, '_search_once', _raise(KeyError("docs")))
+    with pytest.raises(KeyError):
+        api._fetch_external("dune", 10)
+    assert half_open.state == CircuitBreaker.OPEN
+    clock.now += 10
+    assert half_open.allow()
+
+
+def test_latency_percentiles():
+    tracker = LatencyTracker(window=100, min_samples=10)
+    for i in range(9):
+        tracker.record(i / 100)
+    assert tracker.percentile(50) is None
+    for i in range(9, 100):
+        tracker.record(i / 100)
+    assert tracker.percentile(50) == pytest.approx(0.49)
+    assert tracker.percentile(99) == pytest.approx(0.98)
+
+
+def test_open_breaker_short_circuits_upstream(monkeypatch, clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    monkeypatch.setattr(api, '_breaker', breaker)
+    monkeypatch.setattr(api, '_search_once', _raise(AssertionError("upstream called while open")))
+    with pytest.raises(api.UpstreamUnavailable):
+        api.search_books_external("breaker short circuit", 10)
+
+
+def test_successful_probe_closes_breaker(monkeypatch, clock, half_open):
+    monkeypatch.setattr(api, '_search_once', lambda *args, **kwargs: [])
+    assert api._fetch_external("dune", 10) == []
+    assert half_open.state == CircuitBreaker.CLOSED
+
+
+def test_calls_refused_while_half_open_are_unavailable(monkeypatch, clock, half_open):
+    # The probe is already out: everyone else must be told upstream is unavailable, not get a silent miss
+    assert half_open.allow()
+    monkeypatch.setattr(api, '_search_once', _raise(AssertionError("upstream called past the breaker")))
+    monkeypatch.setattr(api, '_get_async_client', lambda: object())
+    with pytest.raises(api.UpstreamUnavailable):
+        api.search_books_external("half open refused", 10)
+    with pytest.raises(api.UpstreamUnavailable):
+        asyncio.run(api.search_books_external_async("half open refused async", 10))
+
+
+def test_async_client_error_does_not_claim_the_probe(monkeypatch, clock, half_open):
+    monkeypatch.setattr(api, '_get_async_client', _raise(RuntimeError("The async serving mode requires httpx")))
+    key = api._cache_key("no client", 10)
+    with pytest.raises(RuntimeError):
+        asyncio.run(api._fetch_and_cache_async(key, "no client", 10))
+    assert half_open.allow()
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+from services.search_ranking import rank_results
+
+
+def local(book_id, title, author=None, isbn=None, external_id=None, public_rating=None):
+    return SimpleNamespace(id=book_id, title=title, author=author, isbn=isbn,
+                           external_id=external_id, public_rating=public_rating)
+
+
+def hit(title, author=None, isbn=None, external_id=None, public_rating=None):
+    return {"title": title, "authors": [author] if author else [], "isbn": isbn,
+            "external_id": external_id, "public_rating": public_rating}
+
+
+def titles(ranked):
+    return [(source, item.title if source == 'local' else item["title"]) for source, item in ranked]
+
+
+def test_exact_title_match_ranks_first():
+    ranked = rank_results("dune", [], [hit("Dune Messiah", "Frank Herbert"), hit("Dune", "Frank Herbert")], {}, 10)
+    assert titles(ranked) == [('external', "Dune"), ('external', "Dune Messiah")]
+
+
+def test_editions_collapse_into_the_local_book():
+    books = [local(1, "Dune", "Frank Herbert", isbn="9780441013593")]
+    hits = [
+        hit("Dune", "Frank Herbert", isbn="0441013597"),                   # same edition, as ISBN-10
+        hit("Dune: Deluxe Edition", "Herbert, Frank", isbn="9780593099322"),  # same title and author
+        hit("Dune Messiah", "Frank Herbert", external_id="/works/OL2W"),
+    ]
+    ranked = rank_results("dune", books, hits, {}, 10)
+    assert titles(ranked) == [('local', "Dune"), ('external', "Dune Messiah")]
+
+
+def test_shared_work_key_collapses_editions():
+    hits = [hit("Dune", "Frank Herbert", isbn="9780441013593", external_id="/works/OL1W"),
+            hit("Duna", "Frank Herbert", isbn="9788497596824", external_id="/works/OL1W")]
+    assert len(rank_results("dune", [], hits, {}, 10)) == 1
+
+
+def test_popularity_and_rating_break_text_ties():
+    books = [local(1, "Winter Garden", public_rating=3.0), local(2, "Winter House", public_rating=3.0),
+             local(3, "Winter Road", public_rating=4.8)]
+    ranked = rank_results("winter", books, [], {2: 40, 1: 1}, 10)
+    assert [item.id for _, item in ranked] == [2, 3, 1]
+
+
+def test_local_books_win_near_ties_and_limit_applies():
+    books = [local(1, "Glass Tower")]
+    hits = [hit("Glass Tower Two"), hit("Glass Towers")]
+    ranked = rank_results("glass tower", books, hits, {}, 2)
+    assert titles(ranked)[0] == ('local', "Glass Tower")
+    assert len(ranked) == 2
+
+
+def test_series_titles_by_the_same_author_stay_separate():
+    hits = [
+        hit("Dune", "Frank Herbert"),
+        hit("Dune: Messiah", "Frank Herbert"),
+        hit("Dune (Penguin Classics) [Paperback]", "Frank Herbert"),
+        hit("Dune: 40th Anniversary Edition", "Frank Herbert"),
+        hit("Dune Messiah (Deluxe Edition)", "Frank Herbert"),
+    ]
+    ranked = rank_results("dune", [], hits, {}, 10)
+    assert titles(ranked) == [('external', "Dune"), ('external', "Dune: Messiah")]
@@ -0,0 +1,50 @@
+import math
+
+import pytest
+
+from config import settings
+from models import BookSimilarity, LibraryEntry
+from services import similarity
+from services.recommendations import queue_similarity_refresh
+from services.similarity import entry_weight, refresh_similarities
+
+
+@pytest.fixture
+def shelves(database, make_user, make_book, monkeypatch):
+    """Two readers who both read Dune and Emma, one of them with a half-star rating."""
+    monkeypatch.setattr(settings, 'RECOMMENDATIONS_MIN_CO_READERS', 1)
+    alice, bob = make_user('alice'), make_user('bob')
+    dune, emma = make_book('Dune'), make_book('Emma')
+    database.session.add_all([
+        LibraryEntry(user_id=alice, book_id=dune, status=2, user_rating=4.5),
+        LibraryEntry(user_id=alice, book_id=emma, status=2, user_rating=5),
+        LibraryEntry(user_id=bob, book_id=dune, status=2, user_rating=1),
+        LibraryEntry(user_id=bob, book_id=emma, status=2, user_rating=2),
+    ])
+    queue_similarity_refresh([dune, emma])
+    database.session.commit()
+    return dune, emma
+
+
+def stored_score(database, book_id, similar_book_id):
+    return database.session.get(BookSimilarity, (book_id, similar_book_id)).score
+
+
+def test_numpy_and_python_refresh_agree_on_half_stars(database, shelves, monkeypatch):
+    pytest.importorskip('scipy')
+    dune, emma = shelves
+    dune_vector = [entry_weight(2, 4.5), entry_weight(2, 1)]
+    emma_vector = [entry_weight(2, 5), entry_weight(2, 2)]
+    expected = sum(a * b for a, b in zip(dune_vector, emma_vector)) / (
+        math.hypot(*dune_vector) * math.hypot(*emma_vector))
+
+    assert refresh_similarities() == (2, 0)
+    assert stored_score(database, dune, emma) == pytest.approx(expected)
+
+    monkeypatch.setattr(similarity, 'np', None)
+    monkeypatch.setattr(similarity, 'sparse', None)
+    queue_similarity_refresh([dune, emma])
+    database.session.commit()
+    assert refresh_similarities() == (2, 0)
+    assert stored_score(database, dune, emma) == pytest.approx(expected)
+    assert stored_score(database, emma, dune) == pytest.approx(expected)
@@ -0,0 +1,64 @@
+from sqlalchemy import select
+
+from models import Book, LibraryEntry
+from services.upsert import book_upsert, library_entry_upsert
+
+
+def test_book_upsert_inserts_and_returns_rows(database):
+    rows = database.session.execute(book_upsert([
+        {"title": "Dune", "author": "Frank Herbert", "isbn": "9780441013593"},
+        {"title": "Emma", "author": "Jane Austen", "isbn": "9780141439587"},
+    ])).all()
+    database.session.commit()
+
+    assert sorted((isbn, title) for _, isbn, title, _ in rows) == [
+        ("9780141439587", "Emma"), ("9780441013593", "Dune")]
+    assert database.session.scalar(select(Book.id).where(Book.isbn == "9780441013593")) in {row[0] for row in rows}
+
+
+def test_book_upsert_keeps_existing_row_and_fills_gaps(database, make_book):
+    book_id = make_book("Dune", isbn="9780441013593", external_id="/works/OL1W")
+
+    (row,) = database.session.execute(book_upsert({
+        "title": "Dune (Deluxe Edition)", "author": "Someone Else", "isbn": "9780441013593",
+        "image_url": "https://covers.openlibrary.org/b/id/1-M.jpg", "external_id": "/works/OL2W",
+        "first_publish_year": 1965,
+    })).all()
+    database.session.commit()
+
+    assert row.id == book_id and row.title == "Dune"
+    book = database.session.get(Book, book_id)
+    assert book.image_url == "https://covers.openlibrary.org/b/id/1-M.jpg"
+    assert book.external_id == "/works/OL1W"
+    assert book.first_publish_year == 1965
+    assert database.session.query(Book).count() == 1
+
+
+def test_library_entry_upsert_updates_in_place(database, make_user, make_book):
+    user_id, book_id = make_user(), make_book()
+
+    (first,) = database.session.execute(library_entry_upsert(
+        {"user_id": user_id, "book_id": book_id, "status": 0, "user_rating": None, "version": 1})).all()
+    (second,) = database.session.execute(library_entry_upsert(
+        {"user_id": user_id, "book_id": book_id, "status": 2, "user_rating": 4.5, "version": 2})).all()
+    database.session.commit()
+
+    assert first.id == second.id
+    assert (second.status, second.user_rating) == (2, 4.5)
+    entry = database.session.get(LibraryEntry, first.id)
+    assert (entry.status, entry.user_rating, entry.version) == (2, 4.5, 2)
+
+
+def test_library_entry_upsert_from_select(database, make_user, make_book):
+    from sqlalchemy import literal
+
+    user_id = make_user()
+    book_ids = [make_book(f"Book {i}") for i in range(3)]
+    stmt = library_entry_upsert(select=select(
+        literal(user_id), Book.id, literal(1), literal(None), literal(7)).where(Book.id.in_(book_ids)))
+
+    rows = database.session.execute(stmt).all()
+    database.session.commit()
+
+    assert sorted(row.book_id for row in rows) == book_ids
+    assert {(entry.status, entry.version) for entry in database.session.query(LibraryEntry)} == {(1, 7)}
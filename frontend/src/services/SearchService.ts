@@ -70,3 +70,120 @@ export const searchBooks = async (
           throw error; 
       }
 };
+
+
+
+export interface BookSuggestion {
+  book_id: number;
+  title: string;
+  author?: string | null;
+}
+
+
+//  * Fetches type-ahead suggestions from the backend's in-memory title/author index.
+//  * Cheap enough to call on every keystroke; use searchBooks for the full results.
+//  * @param query The partial search term (at least 2 characters).
+//  * @param limit Max number of suggestions.
+//  * @param signal AbortSignal for request cancellation.
+//  * @returns Promise<BookSuggestion[]>
+
+export const suggestBooks = async (
+  query: string,
+  limit: number = 8,
+  signal?: AbortSignal
+): Promise<BookSuggestion[]> => {
+      if (!query || query.trim().length < 2) {
+        return [];
+      }
+
+      const params = new URLSearchParams({
+        query: query,
+        limit: limit.toString(),
+      });
+
+      try {
+        const response = await fetch(`${API_BASE_URL}/search/suggest?${params.toString()}`, { signal });
+        if (!response.ok) {
+          return [];
+        }
+        return (await response.json()) as BookSuggestion[];
+      }
+      catch (error) {
+          if (error instanceof Error && error.name === 'AbortError') {
+            return [];
+          }
+          console.error("Error fetching suggestions:", error);
+          return [];
+      }
+};
+
+
+export type BookReference = number | string;
+
+
+//  * Resolves many books in one request, e.g. to render a page of cards.
+//  * @param books Local book ids (numbers), ISBNs or Open Library keys ('/works/OL45804W'); at most 100.
+//  * @param signal AbortSignal for request cancellation.
+//  * @returns Promise<(BookSearchResult | null)[]> in the order of `books`, null where a book was not found.
+
+export const lookupBooks = async (
+  books: BookReference[],
+  signal?: AbortSignal
+): Promise<(BookSearchResult | null)[]> => {
+      if (books.length === 0) {
+        return [];
+      }
+
+      const response = await fetch(`${API_BASE_URL}/search/books/lookup`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ books }),
+        signal
+      });
+
+      if (!response.ok) {
+        let errorMessage = `HTTP error! status: ${response.status}`;
+        try {
+            const errorData = await response.json();
+            errorMessage = errorData.message || errorMessage;
+        }
+        catch (e) {
+            // Not a JSON error body; keep the status message
+        }
+        throw new Error(errorMessage);
+      }
+
+      return (await response.json()) as (BookSearchResult | null)[];
+};
+
+
+//  * Fetches the books most often shelved by readers of a local book ("readers also shelved").
+//  * @param bookId The local book id.
+//  * @param limit Max number of books.
+//  * @param signal AbortSignal for request cancellation.
+//  * @returns Promise<BookSearchResult[]>, best first; empty when there are none yet.
+
+export const getSimilarBooks = async (
+  bookId: number,
+  limit: number = 10,
+  signal?: AbortSignal
+): Promise<BookSearchResult[]> => {
+      const params = new URLSearchParams({ limit: limit.toString() });
+
+      try {
+        const response = await fetch(`${API_BASE_URL}/search/books/${bookId}/similar?${params.toString()}`, { signal });
+        if (!response.ok) {
+          return [];
+        }
+        return (await response.json()) as BookSearchResult[];
+      }
+      catch (error) {
+          if (error instanceof Error && error.name === 'AbortError') {
+            return [];
+          }
+          console.error("Error fetching similar books:", error);
+          return [];
+      }
+};
@@ -89,4 +89,57 @@ export const addOrUpdateLibraryEntry = async (
     }
 
     return await response.json();
-}; 
\ No newline at end of file
+}; 
+
+export interface LibraryEntry {
+  id: number;
+  book_id: number;
+  status: number;
+  rating?: number | null;
+  notes?: string | null;
+  book: {
+    id: number;
+    title: string;
+    author?: string | null;
+    isbn?: string | null;
+    image_url?: string | null;
+    public_rating?: number | null;
+  };
+}
+
+export interface LibraryEntriesPage {
+  entries: LibraryEntry[];
+  next_cursor: string | null;
+}
+
+
+//  * Fetches one page of the user's library, ordered by status.
+//  * @param token The JWT authentication token.
+//  * @param options Page size, cursor from the previous page, and optional status/rating filters.
+//  * @returns Promise<LibraryEntriesPage> Pass next_cursor back in to load the following page.
+
+export const getLibraryEntries = async (
+  token: string,
+  options: { limit?: number; cursor?: string | null; status?: number; minRating?: number } = {}
+): Promise<LibraryEntriesPage> => {
+    const params = new URLSearchParams();
+    if (options.limit) params.set('limit', options.limit.toString());
+    if (options.cursor) params.set('cursor', options.cursor);
+    if (options.status !== undefined) params.set('status', options.status.toString());
+    if (options.minRating !== undefined) params.set('min_rating', options.minRating.toString());
+
+    const response = await fetch(`${API_BASE_URL}/library/entries?${params.toString()}`, {
+      method: 'GET',
+      headers: {
+        'Authorization': `Bearer ${token}`,
+      },
+    });
+
+    const data = await response.json();
+
+    if (!response.ok) {
+      throw new Error(data.message || `HTTP error! status: ${response.status}`);
+    }
+
+    return data as LibraryEntriesPage;
+};